@@ -0,0 +1,192 @@
+# Ingestion benchmark against a local PostgreSQL.
+#
+#   python bench_ingest.py [--scale 0.1] [--seed 42] [--tables ...] [--repeat 1]
+#                          [--data-dir data] [--output results/<commit>.json] [--compare old.json]
+#
+# Generates a seeded synthetic release with synthetic_data.py (reused while
+# --scale and --seed match the files already in --data-dir), then
+# loads every table with ingest.load_file() into a throw-away bench_<table>
+# copy of the real table, one fresh worker process per table so peak RSS is
+# per table. For each table it reports rows/s, MB/s of source file, peak RSS
+# and the DB-side time: the load is single threaded, so the wall time the
+# client did not spend on its own CPU is time waiting for PostgreSQL.
+#
+# Results are written as JSON tagged with the git commit; --compare prints
+# the change in rows/s against an earlier result file and flags regressions.
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+INSERT_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'Insert to Table')
+if INSERT_DIR not in sys.path:
+    sys.path.append(INSERT_DIR)
+from connect_db import new_connection  # noqa: E402
+from copy_stream import peak_rss_mb  # noqa: E402
+from ingest import find_source, load_file  # noqa: E402
+from journal import reset_target  # noqa: E402
+from synthetic_data import DEFAULT_SCALE, DEFAULT_SEED, generate_release, read_marker  # noqa: E402
+from table_specs import TABLE_SPECS  # noqa: E402
+
+BENCH_PREFIX = 'bench_'
+BENCH_PARAMS = {'year': 2023}
+REGRESSION_THRESHOLD = 0.10  # rows/s drop that --compare reports as a regression
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=BENCH_DIR,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, bool(dirty)
+
+
+def server_version():
+    conn = new_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SHOW server_version")
+            return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def bench_table(table, path):
+    # Runs in its own process. Loads path into a fresh bench_<table> and returns the measurements.
+    target = BENCH_PREFIX + table
+    conn = new_connection('bulk_load')
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {target}")
+            cur.execute(f"CREATE TABLE {target} (LIKE {table} INCLUDING ALL)")
+        conn.commit()
+        # The journal would otherwise skip the file as already loaded on the next run
+        reset_target(conn, target)
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        stats = load_file(conn, table, path, BENCH_PARAMS, target=target)
+        seconds = time.perf_counter() - wall_start
+        cpu_seconds = time.process_time() - cpu_start
+
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT pg_total_relation_size('{target}')")
+            table_bytes = cur.fetchone()[0]
+            cur.execute(f"DROP TABLE {target}")
+        conn.commit()
+        reset_target(conn, target)
+    finally:
+        conn.close()
+
+    size = os.path.getsize(path)
+    return {
+        'rows': stats['rows'],
+        'rejected': stats['rejected'],
+        'source_bytes': size,
+        'table_bytes': table_bytes,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(stats['rows'] / seconds, 1) if seconds > 0 else 0,
+        'mb_per_sec': round(size / (1024 * 1024) / seconds, 2) if seconds > 0 else 0,
+        'peak_rss_mb': peak_rss_mb(),
+        'client_cpu_seconds': round(cpu_seconds, 3),
+        'db_seconds': round(max(seconds - cpu_seconds, 0.0), 3),
+    }
+
+
+def run_benchmark(data_dir, tables, scale, seed, repeat=1):
+    marker = read_marker(data_dir)
+    if (marker.get('scale'), marker.get('seed')) != (scale, seed) or \
+            not all(table in marker.get('rows', {}) and find_source(data_dir, table) for table in tables):
+        generate_release(data_dir, scale, seed, tables)
+
+    results = {}
+    for table in tables:
+        path = find_source(data_dir, table)
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                runs.append(executor.submit(bench_table, table, path).result())
+        # Keep the fastest run; the slower ones mostly measure noise from elsewhere
+        best = max(runs, key=lambda run: run['rows_per_sec'])
+        best['runs'] = len(runs)
+        results[table] = best
+        print(f"✅ {table}: {best['rows']} rows in {best['seconds']:.2f}s, {best['rows_per_sec']:,.0f} rows/s, "
+              f"{best['mb_per_sec']:.1f} MB/s, peak RSS {best['peak_rss_mb'] or 0:.0f} MB, "
+              f"DB {best['db_seconds']:.2f}s")
+    return results
+
+
+def print_table(results):
+    print(f"{'table':40} {'rows':>10} {'rows/s':>12} {'MB/s':>8} {'RSS MB':>8} {'client s':>9} {'DB s':>8}")
+    for table, r in results.items():
+        print(f"{table:40} {r['rows']:>10} {r['rows_per_sec']:>12,.0f} {r['mb_per_sec']:>8.1f} "
+              f"{r['peak_rss_mb'] or 0:>8.0f} {r['client_cpu_seconds']:>9.2f} {r['db_seconds']:>8.2f}")
+
+
+def compare(old_path, report):
+    with open(old_path) as f:
+        old = json.load(f)
+    if (old.get('scale'), old.get('seed')) != (report['scale'], report['seed']):
+        print(f"Note: {old_path} was run with scale {old.get('scale')} / seed {old.get('seed')}")
+    print(f"Compared with {old.get('commit')} ({old.get('timestamp')}):")
+    regressed = False
+    for table, new in report['tables'].items():
+        before = old.get('tables', {}).get(table)
+        if not before or not before.get('rows_per_sec'):
+            continue
+        change = new['rows_per_sec'] / before['rows_per_sec'] - 1
+        mark = '❌' if change < -REGRESSION_THRESHOLD else '✅'
+        regressed |= change < -REGRESSION_THRESHOLD
+        print(f"{mark} {table}: {before['rows_per_sec']:,.0f} -> {new['rows_per_sec']:,.0f} rows/s ({change:+.1%})")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the loaders on synthetic CMS-shaped data.")
+    parser.add_argument('--data-dir', default=os.path.join(BENCH_DIR, 'data'),
+                        help="Synthetic release directory; generated if a source file is missing")
+    parser.add_argument('--scale', type=float, default=DEFAULT_SCALE)
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--tables', nargs='+', choices=sorted(TABLE_SPECS))
+    parser.add_argument('--repeat', type=int, default=1, help="Loads per table; the fastest is kept")
+    parser.add_argument('--output', help="Result file (default: results/<commit>.json)")
+    parser.add_argument('--compare', metavar='OLD_JSON', help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    commit, dirty = git_commit()
+    tables = args.tables or list(TABLE_SPECS)
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scale': args.scale,
+        'seed': args.seed,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'postgres': server_version(),
+        'tables': run_benchmark(args.data_dir, tables, args.scale, args.seed, args.repeat),
+    }
+    print_table(report['tables'])
+
+    output = args.output or os.path.join(BENCH_DIR, 'results', f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"🎯 Results written to {output}")
+
+    if args.compare and compare(args.compare, report):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
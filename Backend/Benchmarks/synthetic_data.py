@@ -0,0 +1,237 @@
+# Seeded generator for synthetic, CMS-shaped release files.
+#
+#   python synthetic_data.py <out_dir> [--scale 0.1] [--seed 42] [--tables ...]
+#
+# One file per table in TABLE_SPECS, named so find_source() picks it up, with
+# the spec's delimiter, header and column order. Row counts at --scale 1 are
+# close to a monthly release; key columns are drawn from pools sized like the
+# real cardinalities (formularies, plans, RxCUIs, NDCs, counties) and nullable
+# columns are empty at roughly the rates seen in the CMS files. The same seed
+# and scale always produce byte-identical files.
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+
+INSERT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Insert to Table')
+if INSERT_DIR not in sys.path:
+    sys.path.append(INSERT_DIR)
+from field_types import base_type  # noqa: E402
+from table_specs import TABLE_SPECS  # noqa: E402
+
+DEFAULT_SEED = 42
+DEFAULT_SCALE = 0.1
+MARKER_FILE = 'synthetic.json'  # scale, seed and row counts of the generated files
+
+# Rows per table at --scale 1
+TABLE_ROWS = {
+    'basic_drugs_formulary': 1400000,
+    'beneficiary_cost': 250000,
+    'insulin_beneficiary_cost': 60000,
+    'plan_info': 9000,
+    'geographic_locator': 3300,
+    'excluded_drugs_formulary': 25000,
+    'indication_based_coverage_formulary': 8000,
+    'prescribers_by_geography_drug': 120000,
+}
+
+FILE_NAMES = {
+    'basic_drugs_formulary': 'basic drugs formulary file  20250101.txt',
+    'beneficiary_cost': 'beneficiary cost file  20250101.txt',
+    'insulin_beneficiary_cost': 'insulin beneficiary cost file  20250101.txt',
+    'plan_info': 'plan information  20250101.txt',
+    'geographic_locator': 'geographic locator file 20250101.txt',
+    'excluded_drugs_formulary': 'excluded drugs formulary file  20250101.txt',
+    'indication_based_coverage_formulary': 'indication based coverage formulary file  20250101.txt',
+    'prescribers_by_geography_drug': 'MUP_DPR_RY25_P04_V10_DY23_Geo.csv',
+}
+
+# Pool sizes (distinct values) of the shared key columns
+FORMULARIES = 400
+CONTRACTS = 800
+PLANS_PER_CONTRACT = 40
+RXCUIS = 18000
+NDCS = 60000
+COUNTIES = 3300
+DRUG_NAMES = 3500
+DISEASES = 300
+
+SYLLABLES = ['ab', 'ac', 'al', 'am', 'an', 'ar', 'ba', 'ce', 'cil', 'da', 'dex', 'di', 'do', 'fen', 'flu',
+             'ga', 'im', 'in', 'lo', 'lu', 'ma', 'met', 'mi', 'mo', 'na', 'ne', 'no', 'ol', 'or', 'pa',
+             'pri', 'ra', 're', 'ri', 'sa', 'se', 'ta', 'te', 'ti', 'to', 'tra', 'va', 'vi', 'xa', 'zo']
+SUFFIXES = ['', '', '', ' HCl', ' Sodium', ' ER', ' Extended-Release', ', Extended Release', ' Sulfate/Lamivudine']
+STATES = ['Alabama', 'Alaska', 'Arizona', 'Arkansas', 'California', 'Colorado', 'Connecticut', 'Delaware',
+          'Florida', 'Georgia', 'Hawaii', 'Idaho', 'Illinois', 'Indiana', 'Iowa', 'Kansas', 'Kentucky',
+          'Louisiana', 'Maine', 'Maryland', 'Massachusetts', 'Michigan', 'Minnesota', 'Mississippi',
+          'Missouri', 'Montana', 'Nebraska', 'Nevada', 'New Hampshire', 'New Jersey', 'New Mexico',
+          'New York', 'North Carolina', 'North Dakota', 'Ohio', 'Oklahoma', 'Oregon', 'Pennsylvania',
+          'Rhode Island', 'South Carolina', 'South Dakota', 'Tennessee', 'Texas', 'Utah', 'Vermont',
+          'Virginia', 'Washington', 'West Virginia', 'Wisconsin', 'Wyoming']
+
+
+def drug_name(rng):
+    name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    return name + rng.choice(SUFFIXES)
+
+
+class Pools:
+    # Shared value pools, so keys line up across tables like in a real release
+
+    def __init__(self, rng):
+        self.formularies = [f"{rng.randint(1, 25999):08d}" for _ in range(FORMULARIES)]
+        self.contracts = sorted({f"{rng.choice('HRS')}{rng.randint(1000, 9999)}" for _ in range(CONTRACTS)})
+        self.rxcuis = rng.sample(range(1000, 2700000), RXCUIS)
+        self.ndcs = [f"{rng.randint(0, 99999):05d}{rng.randint(0, 9999):04d}{rng.randint(0, 99):02d}"
+                     for _ in range(NDCS)]
+        self.counties = [f"{rng.randint(1000, 56999):05d}" for _ in range(COUNTIES)]
+        self.drug_names = [drug_name(rng) for _ in range(DRUG_NAMES)]
+        self.generic_names = [drug_name(rng) for _ in range(DRUG_NAMES // 2)]
+        self.diseases = [f"{drug_name(rng).split(',')[0]} Disease" for _ in range(DISEASES)]
+
+
+def number(rng, low, high, null_rate=0.0, places=0):
+    if null_rate and rng.random() < null_rate:
+        return ''
+    if places:
+        return f"{rng.uniform(low, high):.{places}f}"
+    return str(rng.randint(low, high))
+
+
+def yes_no(rng, yes_rate):
+    return 'Y' if rng.random() < yes_rate else 'N'
+
+
+# Column models: name -> function(rng, pools) returning the field text.
+# Columns without a model fall back to default_model() by spec type.
+COLUMN_MODELS = {
+    'formulary_id': lambda rng, p: rng.choice(p.formularies),
+    'formulary_version': lambda rng, p: number(rng, 1, 40),
+    'contract_year': lambda rng, p: '2025',
+    'rxcui': lambda rng, p: str(rng.choice(p.rxcuis)),
+    'ndc': lambda rng, p: rng.choice(p.ndcs),
+    'tier_level_value': lambda rng, p: number(rng, 1, 7),
+    'quantity_limit_yn': lambda rng, p: yes_no(rng, 0.3),
+    'quantity_limit_amount': lambda rng, p: number(rng, 1, 360, null_rate=0.7),
+    'quantity_limit_days': lambda rng, p: number(rng, 1, 90, null_rate=0.7),
+    'prior_authorization_yn': lambda rng, p: yes_no(rng, 0.2),
+    'prior_auth_yn': lambda rng, p: yes_no(rng, 0.2),
+    'step_therapy_yn': lambda rng, p: yes_no(rng, 0.05),
+    'capped_benefit_yn': lambda rng, p: yes_no(rng, 0.02),
+    'contract_id': lambda rng, p: rng.choice(p.contracts),
+    'plan_id': lambda rng, p: f"{rng.randint(1, PLANS_PER_CONTRACT):03d}",
+    'segment_id': lambda rng, p: '0' if rng.random() < 0.9 else str(rng.randint(1, 3)),
+    'coverage_level': lambda rng, p: number(rng, 0, 3),
+    'tier': lambda rng, p: number(rng, 1, 7),
+    'days_supply': lambda rng, p: rng.choice(['1', '2', '3', '4']),
+    'tier_specialty_yn': lambda rng, p: yes_no(rng, 0.15),
+    'ded_applies_yn': lambda rng, p: yes_no(rng, 0.4),
+    'contract_name': lambda rng, p: f"{rng.choice(STATES).upper()} HEALTH PLAN, INC.",
+    'plan_name': lambda rng, p: f"{drug_name(rng).split(',')[0]} Rx {rng.choice(['Basic', 'Plus', 'Value'])} (PDP)",
+    'premium': lambda rng, p: number(rng, 0, 180, null_rate=0.05, places=2),
+    'deductible': lambda rng, p: number(rng, 0, 590, null_rate=0.05),
+    'ma_region_code': lambda rng, p: f"{rng.randint(1, 26):02d}",
+    'pdp_region_code': lambda rng, p: f"{rng.randint(1, 34):02d}",
+    'state': lambda rng, p: rng.choice(STATES)[:2].upper(),
+    'county_code': lambda rng, p: rng.choice(p.counties),
+    'snp': lambda rng, p: number(rng, 0, 3, null_rate=0.02),
+    'plan_suppressed_yn': lambda rng, p: yes_no(rng, 0.01),
+    'statename': lambda rng, p: rng.choice(STATES),
+    'county': lambda rng, p: f"{drug_name(rng).split(',')[0].split(' ')[0]}",
+    'ma_region': lambda rng, p: f"{rng.choice(STATES)} and {rng.choice(STATES)}",
+    'pdp_region': lambda rng, p: f"{rng.choice(STATES)} and {rng.choice(STATES)}",
+    'disease': lambda rng, p: rng.choice(p.diseases),
+    'prscrbr_geo_lvl': lambda rng, p: 'State' if rng.random() < 0.98 else 'National',
+    'prscrbr_geo_cd': lambda rng, p: f"{rng.randint(1, 56):02d}",
+    'prscrbr_geo_desc': lambda rng, p: rng.choice(STATES),
+    'brnd_name': lambda rng, p: rng.choice(p.drug_names),
+    'gnrc_name': lambda rng, p: rng.choice(p.generic_names),
+    'ge65_sprsn_flag': lambda rng, p: rng.choice(['', '', '', '*', '#']),
+    'ge65_bene_sprsn_flag': lambda rng, p: rng.choice(['', '', '*', '#']),
+    'opioid_drug_flag': lambda rng, p: yes_no(rng, 0.05),
+    'opioid_la_drug_flag': lambda rng, p: yes_no(rng, 0.01),
+    'antbtc_drug_flag': lambda rng, p: yes_no(rng, 0.08),
+    'antpsyct_drug_flag': lambda rng, p: yes_no(rng, 0.04),
+}
+
+
+def default_model(name, col_type, nullable):
+    null_rate = 0.15 if nullable else 0.0
+    if base_type(col_type) == 'int':
+        return lambda rng, p: number(rng, 0, 5000, null_rate)
+    if base_type(col_type) == 'decimal':
+        return lambda rng, p: number(rng, 0, 50000, null_rate, places=2)
+    return lambda rng, p: rng.choice(p.drug_names)
+
+
+def table_models(table):
+    models = []
+    for name, col_type, nullable in TABLE_SPECS[table]['columns']:
+        models.append(COLUMN_MODELS.get(name) or default_model(name, col_type, nullable))
+    return models
+
+
+def write_table(table, out_dir, rows, seed, pools):
+    spec = TABLE_SPECS[table]
+    # Seed per table so one table's file does not depend on which others were generated
+    rng = random.Random(f"{seed}:{table}")
+    models = table_models(table)
+    header = [name.upper() for name, _, _ in spec['columns']]
+    path = os.path.join(out_dir, FILE_NAMES[table])
+    with open(path, 'w', encoding=spec['encoding'], newline='') as f:
+        if spec.get('format') == 'csv':
+            writer = csv.writer(f, delimiter=spec['delimiter'], lineterminator='\n')
+            writer.writerow(header)
+            for _ in range(rows):
+                writer.writerow([model(rng, pools) for model in models])
+        else:
+            delimiter = spec['delimiter']
+            f.write(delimiter.join(header) + '\n')
+            for _ in range(rows):
+                f.write(delimiter.join(model(rng, pools) for model in models) + '\n')
+    return path
+
+
+def read_marker(out_dir):
+    # What an earlier generate_release() wrote to out_dir, or {}
+    try:
+        with open(os.path.join(out_dir, MARKER_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def generate_release(out_dir, scale=DEFAULT_SCALE, seed=DEFAULT_SEED, tables=None):
+    # Returns {table: path}
+    os.makedirs(out_dir, exist_ok=True)
+    pools = Pools(random.Random(seed))
+    paths = {}
+    marker = read_marker(out_dir)
+    if (marker.get('scale'), marker.get('seed')) != (scale, seed):
+        marker = {'scale': scale, 'seed': seed, 'rows': {}}
+    for table in tables or TABLE_SPECS:
+        rows = max(1, int(TABLE_ROWS[table] * scale))
+        paths[table] = write_table(table, out_dir, rows, seed, pools)
+        marker['rows'][table] = rows
+        print(f"✅ {table}: {rows} rows -> {paths[table]}")
+    with open(os.path.join(out_dir, MARKER_FILE), 'w') as f:
+        json.dump(marker, f, indent=2)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic CMS-shaped release files.")
+    parser.add_argument('out_dir', help="Directory to write the files to")
+    parser.add_argument('--scale', type=float, default=DEFAULT_SCALE,
+                        help=f"Fraction of a full release's row counts (default {DEFAULT_SCALE})")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--tables', nargs='+', choices=sorted(TABLE_SPECS))
+    args = parser.parse_args(argv)
+    generate_release(args.out_dir, args.scale, args.seed, args.tables)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
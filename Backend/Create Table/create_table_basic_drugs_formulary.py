@@ -5,6 +5,18 @@ conn = connect_db()
 cur = conn.cursor()
 
 # Create table SQL
+# FORMULARY_SK is FORMULARY_ID's integer key in dim_formulary, filled by the
+# loaders (see Insert to Table/dimensions.py) and used for joins with plan_info.
+# RESTRICTIONS is computed by the loaders from the three flags:
+# 1 = PRIOR_AUTHORIZATION_YN, 2 = STEP_THERAPY_YN, 4 = QUANTITY_LIMIT_YN ('Y').
+# NDC11 is NDC as an 11-digit integer, also filled by the loaders (see
+# Insert to Table/ndc.py); lookups by NDC compare it instead of the text.
+# One list partition per contract year (created by the loaders, see
+# Insert to Table/partitions.py): a monthly release replaces its contract year's
+# partition and an old year is retired with
+#   python partitions.py drop basic_drugs_formulary <year>
+# An existing unpartitioned table is converted with:
+#   python partitions.py migrate basic_drugs_formulary
 create_table_sql = """
 CREATE TABLE IF NOT EXISTS basic_drugs_formulary (
   FORMULARY_ID VARCHAR(20) NOT NULL,
@@ -17,9 +29,25 @@ CREATE TABLE IF NOT EXISTS basic_drugs_formulary (
   QUANTITY_LIMIT_AMOUNT DECIMAL(5,2),
   QUANTITY_LIMIT_DAYS INT,
   PRIOR_AUTHORIZATION_YN CHAR(1),
-  STEP_THERAPY_YN CHAR(1)
-)
+  STEP_THERAPY_YN CHAR(1),
+  RESTRICTIONS SMALLINT,
+  NDC11 BIGINT,
+  FORMULARY_SK INT
+) PARTITION BY LIST (CONTRACT_YEAR)
 """
+# Adding RESTRICTIONS to a table loaded before it existed:
+# cur.execute("""
+# ALTER TABLE basic_drugs_formulary ADD COLUMN IF NOT EXISTS RESTRICTIONS SMALLINT;
+# UPDATE basic_drugs_formulary SET RESTRICTIONS =
+#   CASE WHEN PRIOR_AUTHORIZATION_YN = 'Y' THEN 1 ELSE 0 END
+#   + CASE WHEN STEP_THERAPY_YN = 'Y' THEN 2 ELSE 0 END
+#   + CASE WHEN QUANTITY_LIMIT_YN = 'Y' THEN 4 ELSE 0 END;
+# """)
+# Adding NDC11 the same way (CMS files carry the 11-digit form):
+# cur.execute("""
+# ALTER TABLE basic_drugs_formulary ADD COLUMN IF NOT EXISTS NDC11 BIGINT;
+# UPDATE basic_drugs_formulary SET NDC11 = CASE WHEN NDC ~ '^[0-9]{11}$' THEN NDC::BIGINT END;
+# """)
 # cur.execute("""
 # ALTER TABLE basic_drugs_formulary 
 # ALTER COLUMN QUANTITY_LIMIT_AMOUNT TYPE DECIMAL(7,2);
@@ -5,11 +5,12 @@ conn = connect_db()
 cur = conn.cursor()
 
 # Create table SQL
+# PLAN_SK is the integer key of (CONTRACT_ID, PLAN_ID, SEGMENT_ID) in dim_plan,
+# filled by the loaders (see Insert to Table/dimensions.py); the string
+# identifiers are only in dim_plan, join on PLAN_SK to get them
 create_table_sql = """
 CREATE TABLE IF NOT EXISTS beneficiary_cost (
-  CONTRACT_ID VARCHAR(10) NOT NULL,
-  PLAN_ID VARCHAR(10),
-  SEGMENT_ID VARCHAR(10),
+  PLAN_SK INT NOT NULL,
   COVERAGE_LEVEL INT,
   TIER INT,
   DAYS_SUPPLY INT,
@@ -34,6 +35,13 @@ CREATE TABLE IF NOT EXISTS beneficiary_cost (
 )
 """
 
+# Moving a table loaded with the string identifiers onto PLAN_SK alone
+# (backfill first: python dimensions.py backfill beneficiary_cost):
+# cur.execute("""
+# ALTER TABLE beneficiary_cost ALTER COLUMN PLAN_SK SET NOT NULL;
+# ALTER TABLE beneficiary_cost DROP COLUMN CONTRACT_ID, DROP COLUMN PLAN_ID, DROP COLUMN SEGMENT_ID;
+# """)
+
 try:
     cur.execute(create_table_sql)
 except Exception as e:
@@ -8,21 +8,31 @@ conn = connect_db()
 cur = conn.cursor()
 
 # create table SQL matching sample data columns
+# plan_sk is the integer key of (contract_id, plan_id, segment_id) in dim_plan,
+# filled by the loaders (see Insert to Table/dimensions.py); the string
+# identifiers are only in dim_plan, join on plan_sk to get them
 create_table_sql = """
 CREATE TABLE IF NOT EXISTS insulin_beneficiary_cost (
-  contract_id VARCHAR(20) NOT NULL,
-  plan_id VARCHAR(20) NOT NULL,
-  segment_id VARCHAR(20) NOT NULL,
+  plan_sk INTEGER NOT NULL,
   tier VARCHAR(10) NOT NULL,
   days_supply INTEGER NOT NULL,
   copay_amt_pref_insln NUMERIC(10,2),
   copay_amt_nonpref_insln NUMERIC(10,2),
   copay_amt_mail_pref_insln NUMERIC(10,2),
   copay_amt_mail_nonpref_insln NUMERIC(10,2),
-  PRIMARY KEY (contract_id, plan_id, segment_id, tier, days_supply)
+  PRIMARY KEY (plan_sk, tier, days_supply)
 )
 """
 
+# Moving a table loaded with the string identifiers onto plan_sk alone
+# (backfill first: python dimensions.py backfill insulin_beneficiary_cost):
+# cur.execute("""
+# ALTER TABLE insulin_beneficiary_cost DROP CONSTRAINT insulin_beneficiary_cost_pkey;
+# ALTER TABLE insulin_beneficiary_cost ALTER COLUMN plan_sk SET NOT NULL;
+# ALTER TABLE insulin_beneficiary_cost DROP COLUMN contract_id, DROP COLUMN plan_id, DROP COLUMN segment_id;
+# ALTER TABLE insulin_beneficiary_cost ADD PRIMARY KEY (plan_sk, tier, days_supply);
+# """)
+
 try:
     cur.execute(create_table_sql)
     conn.commit()
@@ -5,6 +5,9 @@ conn = connect_db()
 cur = conn.cursor()
 
 # Create table SQL
+# PLAN_SK / FORMULARY_SK are the integer keys of the plan and formulary
+# identifiers in dim_plan / dim_formulary, filled by the loaders (see
+# Insert to Table/dimensions.py) and used for joins with the other tables
 create_table_sql = """
 CREATE TABLE IF NOT EXISTS plan_info (
   CONTRACT_ID VARCHAR(10) NOT NULL,
@@ -20,7 +23,9 @@ CREATE TABLE IF NOT EXISTS plan_info (
   STATE CHAR(2),
   COUNTY_CODE VARCHAR(10),
   SNP INT,
-  PLAN_SUPPRESSED_YN CHAR(1)
+  PLAN_SUPPRESSED_YN CHAR(1),
+  PLAN_SK INT,
+  FORMULARY_SK INT
 )
 """
 
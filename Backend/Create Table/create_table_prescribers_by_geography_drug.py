@@ -4,6 +4,9 @@ conn = connect_db()
 cur = conn.cursor()
 
 # Create table SQL
+# One list partition per data year (created by the loaders, see
+# Insert to Table/partitions.py); an existing unpartitioned table is converted
+# with: python partitions.py migrate prescribers_by_geography_drug
 create_table_sql = """
 CREATE TABLE IF NOT EXISTS prescribers_by_geography_drug (
     Year INT,
@@ -29,7 +32,7 @@ CREATE TABLE IF NOT EXISTS prescribers_by_geography_drug (
     Opioid_LA_Drug_Flag CHAR(1),
     Antbtc_Drug_Flag CHAR(1),
     Antpsyct_Drug_Flag CHAR(1)
-)
+) PARTITION BY LIST (Year)
 """
 
 try:
@@ -11,7 +11,11 @@ from datetime import datetime, time
 import pytz
 import sys
 import logging
+import asyncio
 from fastapi.encoders import jsonable_encoder 
+from response_cache import ResponseCache
+from streaming import stream_format, stream_response
+from pagination import decode_cursor, keyset_columns, keyset_order, keyset_seek, next_cursor
 
 def is_outside_server_time(): 
     ist = pytz.timezone('Asia/Kolkata') 
@@ -30,6 +34,16 @@ load_dotenv()
 # Define a global variable for pool
 pool: asyncpg.Pool = None
 
+# Response cache of the aggregate endpoints, emptied when a data release is
+# recorded (see response_cache.py and Insert to Table/releases.py)
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", "512"))
+RELEASE_CHANNEL = "data_release"
+RELEASE_CHECK_SECONDS = 60  # re-read the release stamp this often in case a NOTIFY was missed
+
+# Rows per (geo level, region, year) in summary_geo_top; the loaders keep the
+# summary_* tables (see Insert to Table/summaries.py, GEO_TOP_N there)
+GEO_TOP_N = 100
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Connecting DB")
@@ -42,11 +56,127 @@ async def lifespan(app: FastAPI):
         min_size=1,
         max_size=10,
     )
+    app.state.ndc_index = await load_ndc_index(app.state.pool)
+    app.state.cache = ResponseCache(API_CACHE_MAX_ENTRIES)
+    app.state.cache.set_version(await current_release(app.state.pool))
+    app.state.release_checked = asyncio.get_running_loop().time()
+
+    def on_release(conn, pid, channel, payload):
+        asyncio.create_task(apply_release(app, int(payload)))
+
+    # One pooled connection stays checked out to LISTEN for new releases
+    release_conn = await app.state.pool.acquire()
+    await release_conn.add_listener(RELEASE_CHANNEL, on_release)
     yield
+    await release_conn.remove_listener(RELEASE_CHANNEL, on_release)
+    await app.state.pool.release(release_conn)
     await app.state.pool.close()
 
 app = FastAPI(lifespan=lifespan)
 
+# NDC -> RxCUIs from the ndc_rxcui crosswalk, kept in memory (the loaders
+# maintain the table, see Insert to Table/ndc.py; reloaded with every release)
+async def load_ndc_index(pool):
+    index = {}
+    try:
+        rows = await pool.fetch("SELECT ndc11, rxcui FROM ndc_rxcui")
+    except asyncpg.PostgresError as e:
+        logging.warning(f"NDC crosswalk not loaded: {e}")
+        return index
+    for r in rows:
+        index.setdefault(r["ndc11"], []).append(r["rxcui"])
+    print(f"Loaded {len(index)} NDCs")
+    return index
+
+# Latest data_release.release_id: the version stamp of the response cache
+async def current_release(pool):
+    try:
+        return await pool.fetchval("SELECT max(release_id) FROM data_release")
+    except asyncpg.UndefinedTableError:
+        return None  # no release recorded yet
+
+async def apply_release(app, version):
+    # A new release: the cached responses and the NDC index are out of date
+    if app.state.cache.set_version(version):
+        print(f"Data release {version}: response cache cleared")
+        app.state.ndc_index = await load_ndc_index(app.state.pool)
+
+async def response_cache(request):
+    app = request.app
+    now = asyncio.get_running_loop().time()
+    if now - app.state.release_checked >= RELEASE_CHECK_SECONDS:
+        app.state.release_checked = now
+        await apply_release(app, await current_release(app.state.pool))
+    return app.state.cache
+
+def cached_response(content, hit):
+    return JSONResponse(content=content, headers={"X-Cache": "HIT" if hit else "MISS"})
+
+# Segment lengths of the dashed NDC forms, padded to 5-4-2
+NDC_DASHED_FORMS = {(4, 4, 2), (5, 3, 2), (5, 4, 1), (5, 4, 2)}
+
+def ndc_candidates(value):
+    # Every 11-digit NDC (as an int) that `value` can stand for: 11 digits,
+    # dashed 4-4-2 / 5-3-2 / 5-4-1 / 5-4-2, or 10 digits without dashes, which
+    # could be any of the three 10-digit layouts
+    value = value.strip()
+    if "-" in value:
+        parts = value.split("-")
+        if len(parts) != 3 or tuple(map(len, parts)) not in NDC_DASHED_FORMS \
+                or not all(p.isascii() and p.isdigit() for p in parts):
+            return []
+        return [int(parts[0].zfill(5) + parts[1].zfill(4) + parts[2].zfill(2))]
+    if not (value.isascii() and value.isdigit()):
+        return []
+    if len(value) == 11:
+        return [int(value)]
+    if len(value) == 10:
+        return [int("0" + value), int(value[:5] + "0" + value[5:]), int(value[:9] + "0" + value[9:])]
+    return []
+
+def resolve_ndc(request, value):
+    # NDCs to match with "ndc11 = ANY(...)"; the in-memory crosswalk picks the
+    # known reading(s) of an ambiguous 10-digit NDC
+    candidates = ndc_candidates(value)
+    known = [c for c in candidates if c in request.app.state.ndc_index]
+    return known or candidates
+
+def invalid_ndc_response():
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"error": "Parameter 'ndc' must be an NDC: 11 digits, 10 digits or dashed (e.g. 0002-1433-80)"},
+    )
+
+# Drug names containing a search string, from the summary_drug_names dictionary
+# the loaders keep (trigram-indexed, see Insert to Table/summaries.py). The
+# prescriber rows are then matched on the exact names through the btree name
+# indexes instead of an ILIKE over every row.
+def like_pattern(value, prefix="%"):
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{prefix}{escaped}%"
+
+async def matching_drug_names(conn, drug):
+    # None while the dictionary does not exist yet: search the rows with ILIKE
+    try:
+        rows = await conn.fetch("SELECT DISTINCT drug_name FROM summary_drug_names WHERE drug_name ILIKE $1",
+                                like_pattern(drug))
+    except asyncpg.UndefinedTableError:
+        return None
+    return [r["drug_name"] for r in rows]
+
+async def drug_filter(conn, drug, param_index):
+    # (WHERE clause, its parameter) matching brnd_name or gnrc_name on `drug`
+    names = await matching_drug_names(conn, drug)
+    if names is None:
+        return f"(brnd_name ILIKE ${param_index} OR gnrc_name ILIKE ${param_index})", like_pattern(drug)
+    return f"(brnd_name = ANY(${param_index}::text[]) OR gnrc_name = ANY(${param_index}::text[]))", names
+
+# Keyset (cursor) pagination: see pagination.py
+def invalid_cursor_response(offset):
+    error = "Use either 'cursor' or 'offset', not both" if offset \
+        else "Parameter 'cursor' must be the nextCursor of a previous page of this request"
+    return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": error})
+
 # Assume a function to parse pagination parameters
 def parse_pagination(query_params):
     try:
@@ -81,26 +211,52 @@ async def health_check(request: Request):
             }
         )
 
+# Hit/miss counters of the response cache
+# http://127.0.0.1:8000/api/cache
+@app.get("/api/cache")
+async def cache_stats(request: Request):
+    return JSONResponse(content=request.app.state.cache.stats())
+
+# Rows of a year are ranked by tot_clms at load time: the rank is the sort key
+TREND_KEYS = [("clm_rank", int)]
+
 # http://127.0.0.1:8000/api/trends?year=2023&limit=100&offset=0
+# http://127.0.0.1:8000/api/trends?year=2023&limit=100&cursor=<metadata.nextCursor>
 @app.get("/api/trends") 
 async def get_trends(
     request: Request,
     year: int = Query(...), 
     limit: int = Query(100, gt=0), 
-    offset: int = Query(0, ge=0)
+    offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
 ):
+    scope = f"trends:{year}"
+    after = offset
+    if cursor is not None:
+        key = decode_cursor(cursor, scope, TREND_KEYS)
+        if key is None or offset:
+            return invalid_cursor_response(offset)
+        after = key[0]
+
+    cache = await response_cache(request)
+    cache_params = {"year": year, "limit": limit, "offset": offset, "cursor": cursor}
+    cached = cache.get("trends", cache_params)
+    if cached is not None:
+        return cached_response(cached, True)
+
     pool = request.app.state.pool
     async with pool.acquire() as conn:
+        # A page is a range of ranks, whether it starts at an offset or a cursor
         rows = await conn.fetch(
-            """
+            f"""
             SELECT year, brnd_name, gnrc_name,
-                   tot_prscrbrs, tot_clms, tot_30day_fills, tot_drug_cst, tot_benes
-            FROM prescribers_by_geography_drug
-            WHERE year = $1
-            ORDER BY tot_clms DESC
-            LIMIT $2 OFFSET $3
+                   tot_prscrbrs, tot_clms, tot_30day_fills, tot_drug_cst, tot_benes,
+                   {keyset_columns(TREND_KEYS)}
+            FROM summary_drug_rank
+            WHERE year = $1 AND clm_rank > $2::bigint AND clm_rank <= $2::bigint + $3
+            ORDER BY clm_rank
             """,
-            year, limit, offset
+            year, after, limit
         )
     data = [
         {
@@ -121,12 +277,31 @@ async def get_trends(
             "limit": limit,
             "offset": offset,
             "count": len(data),
+            "nextCursor": next_cursor(scope, TREND_KEYS, rows, limit),
         },
         "data": data,
     }
     json_compatible_content = jsonable_encoder(response_content)
-    return JSONResponse(content=json_compatible_content)
+    cache.put("trends", cache_params, json_compatible_content)
+    return cached_response(json_compatible_content, False)
+
+def drug_search_item(r):
+    return {
+        "brnd_name": r["brnd_name"],
+        "gnrc_name": r["gnrc_name"],
+        "year": r["year"],
+        "totalPrescribers": float(r["tot_prscrbrs"]) if r["tot_prscrbrs"] is not None else None,
+        "totalClaims": float(r["tot_clms"]) if r["tot_clms"] is not None else None,
+        "total30DayFills": float(r["tot_30day_fills"]) if r["tot_30day_fills"] is not None else None,
+        "totalDrugCost": float(r["tot_drug_cst"]) if r["tot_drug_cst"] is not None else None,
+        "totalBeneficiaries": float(r["tot_benes"]) if r["tot_benes"] is not None else None,
+        "prscrbr_geo_lvl": r["prscrbr_geo_lvl"],
+        "prscrbr_geo_cd": r["prscrbr_geo_cd"],
+        "prscrbr_geo_desc": r["prscrbr_geo_desc"],
+    }
 
+# Every matching row: with "Accept: application/x-ndjson" or "Accept: text/csv"
+# the rows are streamed (see streaming.py) instead of returned in one document
 # http://127.0.0.1:8000/api/pbg/search?drug=naproxen&startYear=2022&endYear=2023
 @app.get("/api/pbg/search")
 async def search_drugs(
@@ -149,9 +324,7 @@ async def search_drugs(
     params = []
     param_index = 1
 
-    pattern = f"%{drug}%"
-    where_clauses.append(f"(brnd_name ILIKE ${param_index} OR gnrc_name ILIKE ${param_index})")
-    params.append(pattern)
+    # The drug clause is added once a connection is acquired (see drug_filter)
     param_index += 1
 
     if startYear is not None:
@@ -164,9 +337,7 @@ async def search_drugs(
         params.append(endYear)
         param_index += 1
 
-    where_sql = " AND ".join(where_clauses)
-
-    query = f"""
+    query = """
         SELECT year,
                brnd_name, gnrc_name,
                tot_prscrbrs,
@@ -182,26 +353,20 @@ async def search_drugs(
         ORDER BY year DESC, tot_clms DESC
     """
 
+    fmt = stream_format(request)
     try:
         async with pool.acquire() as conn:
-            rows = await conn.fetch(query, *params)
+            drug_sql, drug_param = await drug_filter(conn, drug, 1)
+            where_sql = " AND ".join([drug_sql] + where_clauses)
+            query = query.format(where_sql=where_sql)
+            params.insert(0, drug_param)
+            if not fmt:
+                rows = await conn.fetch(query, *params)
 
-        data = [
-            {
-                "brnd_name": r["brnd_name"],
-                "gnrc_name": r["gnrc_name"],
-                "year": r["year"],
-                "totalPrescribers": float(r["tot_prscrbrs"]) if r["tot_prscrbrs"] is not None else None,
-                "totalClaims": float(r["tot_clms"]) if r["tot_clms"] is not None else None,
-                "total30DayFills": float(r["tot_30day_fills"]) if r["tot_30day_fills"] is not None else None,
-                "totalDrugCost": float(r["tot_drug_cst"]) if r["tot_drug_cst"] is not None else None,
-                "totalBeneficiaries": float(r["tot_benes"]) if r["tot_benes"] is not None else None,
-                "prscrbr_geo_lvl": r["prscrbr_geo_lvl"],
-                "prscrbr_geo_cd": r["prscrbr_geo_cd"],
-                "prscrbr_geo_desc": r["prscrbr_geo_desc"],
-            }
-            for r in rows
-        ]
+        if fmt:
+            return await stream_response(pool, query, params, drug_search_item, fmt)
+
+        data = [drug_search_item(r) for r in rows]
 
 
         return JSONResponse(
@@ -214,25 +379,98 @@ async def search_drugs(
             content={"error": "Database error while searching by drug", "details": str(e)},
         )
 
+# Autocomplete over the drug name dictionary (summary_drug_names): names that
+# start with q, then names containing it, then names similar to it (pg_trgm's
+# % operator, for typos); within each group the closest and most prescribed
+# come first. All three are served by the trigram index.
+# http://127.0.0.1:8000/api/drugs/suggest?q=metfor&limit=10
+@app.get("/api/drugs/suggest")
+async def suggest_drugs(
+    request: Request,
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, gt=0, le=100),
+):
+    q = q.strip()
+    if not q:
+        return JSONResponse(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            content={"error": "Parameter 'q' must not be blank"},
+        )
+    cache = await response_cache(request)
+    cache_params = {"q": q, "limit": limit}
+    cached = cache.get("drugs_suggest", cache_params)
+    if cached is not None:
+        return cached_response(cached, True)
+
+    pool = request.app.state.pool
+    try:
+        async with pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT drug_name,
+                       CASE WHEN drug_name ILIKE $1 THEN 'prefix'
+                            WHEN drug_name ILIKE $2 THEN 'substring'
+                            ELSE 'fuzzy' END AS match_type,
+                       similarity(drug_name, $3) AS score,
+                       SUM(tot_clms) AS tot_clms
+                FROM summary_drug_names
+                WHERE drug_name ILIKE $2 OR drug_name % $3
+                GROUP BY drug_name
+                ORDER BY CASE WHEN drug_name ILIKE $1 THEN 0 WHEN drug_name ILIKE $2 THEN 1 ELSE 2 END,
+                         score DESC, tot_clms DESC NULLS LAST, drug_name
+                LIMIT $4
+                """,
+                like_pattern(q, prefix=""), like_pattern(q), q, limit
+            )
+    except asyncpg.UndefinedTableError:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"error": "Drug name dictionary not built yet (python summaries.py refresh)"},
+        )
+    except Exception as e:
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"error": "Database error while suggesting drugs", "details": str(e)},
+        )
+
+    data = [
+        {
+            "drugName": r["drug_name"],
+            "match": r["match_type"],
+            "score": round(float(r["score"]), 4),
+            "totalClaims": float(r["tot_clms"]) if r["tot_clms"] is not None else None,
+        }
+        for r in rows
+    ]
+    content = {"query": q, "count": len(data), "data": data}
+    cache.put("drugs_suggest", cache_params, content)
+    return cached_response(content, False)
+
 # http://127.0.0.1:8000/api/years
 @app.get("/api/years")
 async def get_years(request: Request):
     pool = request.app.state.pool
 
     query = """
-        SELECT DISTINCT year
-        FROM prescribers_by_geography_drug
+        SELECT year
+        FROM summary_national_totals
         ORDER BY year ASC
     """
 
     try:
+        cache = await response_cache(request)
+        cached = cache.get("years", {})
+        if cached is not None:
+            return cached_response(cached, True)
+
         async with pool.acquire() as conn:
             rows = await conn.fetch(query)
 
         years = [r["year"] for r in rows]
 
         # Return a simple JSON array of years
-        return JSONResponse(status_code=200, content=years)
+        cache.put("years", {}, years)
+        return cached_response(years, False)
 
     except Exception as e:
         return JSONResponse(
@@ -245,19 +483,24 @@ async def get_years(request: Request):
 async def get_national_totals(request: Request):
     pool = request.app.state.pool
 
+    # Summed per year at load time
     query = """
         SELECT year,
-               SUM(tot_prscrbrs) AS total_prescribers,
-               SUM(tot_clms) AS total_claims,
-               SUM(tot_30day_fills) AS total_30day_fills,
-               SUM(tot_drug_cst) AS total_drug_cost,
-               SUM(tot_benes) AS total_beneficiaries
-        FROM prescribers_by_geography_drug
-        GROUP BY year
+               total_prescribers,
+               total_claims,
+               total_30day_fills,
+               total_drug_cost,
+               total_beneficiaries
+        FROM summary_national_totals
         ORDER BY year ASC
     """
 
     try:
+        cache = await response_cache(request)
+        cached = cache.get("national_totals", {})
+        if cached is not None:
+            return cached_response(cached, True)
+
         async with pool.acquire() as conn:
             rows = await conn.fetch(query)
 
@@ -273,16 +516,30 @@ async def get_national_totals(request: Request):
             for r in rows
         ]
 
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={"data": data, "count": len(data)},
-        )
+        content = {"data": data, "count": len(data)}
+        cache.put("national_totals", {}, content)
+        return cached_response(content, False)
     except Exception as e:
         return JSONResponse(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             content={"error": "Database error while fetching national totals", "details": str(e)},
         )
 
+def geo_detail_item(r):
+    return {
+        "drugName": r["drug_name"],
+        "year": r["year"],
+        "totalPrescribers": float(r["tot_prscrbrs"]) if r["tot_prscrbrs"] is not None else None,
+        "totalClaims": float(r["tot_clms"]) if r["tot_clms"] is not None else None,
+        "total30DayFills": float(r["tot_30day_fills"]) if r["tot_30day_fills"] is not None else None,
+        "totalDrugCost": float(r["tot_drug_cst"]) if r["tot_drug_cst"] is not None else None,
+        "totalBeneficiaries": float(r["tot_benes"]) if r["tot_benes"] is not None else None,
+        "prscrbr_geo_lvl": r["prscrbr_geo_lvl"],
+        "prscrbr_geo_cd": r["prscrbr_geo_cd"],
+        "prscrbr_geo_desc": r["prscrbr_geo_desc"],
+    }
+
+# Streams NDJSON or CSV like /api/pbg/search
 # http://127.0.0.1:8000/api/geo_detail?year=2023&drug=naproxen
 @app.get("/api/geo_detail")
 async def get_geo_detail(
@@ -300,14 +557,7 @@ async def get_geo_detail(
     params = [year]
     param_index = 2
 
-    if drug:
-        where_clauses.append(f"(brnd_name ILIKE ${param_index} OR gnrc_name ILIKE ${param_index})")
-        params.append(f"%{drug}%")
-        param_index += 1
-
-    where_sql = " AND ".join(where_clauses)
-
-    query = f"""
+    query = """
         SELECT year,
                COALESCE(brnd_name, gnrc_name) AS drug_name,
                tot_prscrbrs,
@@ -323,25 +573,23 @@ async def get_geo_detail(
         ORDER BY prscrbr_geo_lvl ASC, prscrbr_geo_cd ASC, tot_clms DESC
     """
 
+    fmt = stream_format(request)
     try:
         async with pool.acquire() as conn:
-            rows = await conn.fetch(query, *params)
+            if drug:
+                drug_sql, drug_param = await drug_filter(conn, drug, param_index)
+                where_clauses.append(drug_sql)
+                params.append(drug_param)
+                param_index += 1
+            where_sql = " AND ".join(where_clauses)
+            query = query.format(where_sql=where_sql)
+            if not fmt:
+                rows = await conn.fetch(query, *params)
 
-        data = [
-            {
-                "drugName": r["drug_name"],
-                "year": r["year"],
-                "totalPrescribers": float(r["tot_prscrbrs"]) if r["tot_prscrbrs"] is not None else None,
-                "totalClaims": float(r["tot_clms"]) if r["tot_clms"] is not None else None,
-                "total30DayFills": float(r["tot_30day_fills"]) if r["tot_30day_fills"] is not None else None,
-                "totalDrugCost": float(r["tot_drug_cst"]) if r["tot_drug_cst"] is not None else None,
-                "totalBeneficiaries": float(r["tot_benes"]) if r["tot_benes"] is not None else None,
-                "prscrbr_geo_lvl": r["prscrbr_geo_lvl"],
-                "prscrbr_geo_cd": r["prscrbr_geo_cd"],
-                "prscrbr_geo_desc": r["prscrbr_geo_desc"],
-            }
-            for r in rows
-        ]
+        if fmt:
+            return await stream_response(pool, query, params, geo_detail_item, fmt)
+
+        data = [geo_detail_item(r) for r in rows]
 
         return JSONResponse(
             status_code=status.HTTP_200_OK,
@@ -354,7 +602,19 @@ async def get_geo_detail(
             content={"error": "Database error while fetching geographic detail", "details": str(e)},
         )
 
+# Highest tot_clms first, ties broken by year and then as in summaries.RANK_ORDER,
+# so within a year this is the order of the summary_geo_top ranks (both tables
+# have these columns)
+REGION_KEYS = [
+    ("COALESCE(tot_clms, -1)", int),
+    ("COALESCE(year, 0)", int),
+    ("COALESCE(prscrbr_geo_cd, '')", str),
+    ("COALESCE(brnd_name, '')", str),
+    ("COALESCE(gnrc_name, '')", str),
+]
+
 # http://127.0.0.1:8000/api/region_detail?level=State&region=California&year=2023&limit=5
+# http://127.0.0.1:8000/api/region_detail?level=State&region=California&year=2023&limit=100&cursor=<nextCursor>
 @app.get("/api/region_detail")
 async def get_region_detail(
     request: Request,
@@ -363,9 +623,16 @@ async def get_region_detail(
     year: Optional[int] = Query(None),
     limit: int = Query(100, gt=0),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
 ):
     pool = request.app.state.pool
 
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor, "region", REGION_KEYS)
+        if after is None or offset:
+            return invalid_cursor_response(offset)
+
     # Validate level and region parameters are enforced by FastAPI Query parameters
 
 
@@ -386,15 +653,32 @@ async def get_region_detail(
         params.append(year)
         param_index += 1
 
-    where_sql = " AND ".join(where_clauses)
+    # Pages within the top GEO_TOP_N of each year come from summary_geo_top;
+    # deeper pages sort the prescriber rows, and pages after a cursor seek
+    # into them through idx_pbgd_region_keyset
+    from_summary = after is None and offset + limit <= GEO_TOP_N
+    if from_summary and year is not None:
+        # A single ranked list: the page is a range of ranks
+        where_clauses.append(f"clm_rank > ${param_index} AND clm_rank <= ${param_index + 1}")
+        params.append(offset)
+        params.append(offset + limit)
+        page_sql = "ORDER BY clm_rank"
+    elif after is not None:
+        where_clauses.append(keyset_seek(REGION_KEYS, "DESC", param_index))
+        params.extend(after)
+        param_index += len(after)
+        params.append(limit)
+        page_sql = f"{keyset_order(REGION_KEYS, 'DESC')} LIMIT ${param_index}"
+    else:
+        params.append(limit)
+        params.append(offset)
+        page_sql = f"{keyset_order(REGION_KEYS, 'DESC')} LIMIT ${param_index} OFFSET ${param_index + 1}"
 
-    # Add pagination params
-    params.append(limit)
-    params.append(offset)
+    where_sql = " AND ".join(where_clauses)
 
     query = f"""
         SELECT year,
-               COALESCE(brnd_name, gnrc_name) AS drug_name,
+               {"drug_name" if from_summary else "COALESCE(brnd_name, gnrc_name) AS drug_name"},
                tot_prscrbrs,
                tot_clms,
                tot_30day_fills,
@@ -402,11 +686,11 @@ async def get_region_detail(
                tot_benes,
                prscrbr_geo_lvl,
                prscrbr_geo_cd,
-               prscrbr_geo_desc
-        FROM prescribers_by_geography_drug
+               prscrbr_geo_desc,
+               {keyset_columns(REGION_KEYS)}
+        FROM {"summary_geo_top" if from_summary else "prescribers_by_geography_drug"}
         WHERE {where_sql}
-        ORDER BY tot_clms DESC
-        LIMIT ${param_index} OFFSET ${param_index + 1}
+        {page_sql}
     """
 
     try:
@@ -431,7 +715,8 @@ async def get_region_detail(
 
         return JSONResponse(
             status_code=status.HTTP_200_OK,
-            content={"data": data, "limit": limit, "offset": offset, "count": len(data)},
+            content={"data": data, "limit": limit, "offset": offset, "count": len(data),
+                     "nextCursor": next_cursor("region", REGION_KEYS, rows, limit)},
         )
     except Exception as e:
         return JSONResponse(
@@ -439,6 +724,28 @@ async def get_region_detail(
             content={"error": "Database error while fetching region detail", "details": str(e)},
         )
 
+def formulary_lookup_item(r):
+    return {
+        "formularyId": r["formulary_id"],
+        "formularyVersion": r["formulary_version"],
+        "contractYear": r["contract_year"],
+        "rxcui": r["rxcui"],
+        "ndc": r["ndc"],
+        "tierLevel": r["tier_level_value"],
+        "quantityLimit": r["quantity_limit_yn"],
+        "quantityLimitAmount": float(r["quantity_limit_amount"]) if r["quantity_limit_amount"] is not None else None,
+        "quantityLimitDays": r["quantity_limit_days"],
+        "paRequired": r["prior_authorization_yn"],
+        "stepTherapyRequired": r["step_therapy_yn"],
+        "planId": r["plan_id"],
+        "contractId": r["contract_id"],
+        "segmentId": r["segment_id"],
+        "planName": r["plan_name"],
+        "contractName": r["contract_name"],
+        "coveredStatus": "Covered",
+    }
+
+# Streams NDJSON or CSV like /api/pbg/search (an empty stream instead of the 404)
 # http://127.0.0.1:8000/api/bdf_pi/search?ndc=58151015577&rxcui=617314&plan_id=001&contract_id=H0034
 @app.get("/api/bdf_pi/search")
 async def formulary_lookup(
@@ -473,9 +780,12 @@ async def formulary_lookup(
         params.append(rxcui_val)
         param_index += 1
     elif ndc is not None:
-        # ndc stored as varchar
-        where_clauses.append(f"bf.ndc = ${param_index}")
-        params.append(ndc)
+        # Any NDC format; compared as the normalized 11-digit integer
+        ndcs = resolve_ndc(request, ndc)
+        if not ndcs:
+            return invalid_ndc_response()
+        where_clauses.append(f"bf.ndc11 = ANY(${param_index}::bigint[])")
+        params.append(ndcs)
         param_index += 1
 
     # Filter by plan_id or formulary_id in plan_info
@@ -512,12 +822,16 @@ async def formulary_lookup(
             pi.segment_id AS segment_id,
             pi.contract_name AS contract_name
         FROM basic_drugs_formulary bf
-        INNER JOIN plan_info pi ON pi.formulary_id = bf.formulary_id
+        INNER JOIN plan_info pi ON pi.formulary_sk = bf.formulary_sk
         WHERE {where_sql}
         ORDER BY bf.tier_level_value ASC, bf.ndc ASC
     """
 
     try:
+        fmt = stream_format(request)
+        if fmt:
+            return await stream_response(pool, query, params, formulary_lookup_item, fmt)
+
         async with pool.acquire() as conn:
             rows = await conn.fetch(query, *params)
 
@@ -528,28 +842,7 @@ async def formulary_lookup(
                 content={"data": [], "count": 0},
             )
 
-        data = [
-            {
-                "formularyId": r["formulary_id"],
-                "formularyVersion": r["formulary_version"],
-                "contractYear": r["contract_year"],
-                "rxcui": r["rxcui"],
-                "ndc": r["ndc"],
-                "tierLevel": r["tier_level_value"],
-                "quantityLimit": r["quantity_limit_yn"],
-                "quantityLimitAmount": float(r["quantity_limit_amount"]) if r["quantity_limit_amount"] is not None else None,
-                "quantityLimitDays": r["quantity_limit_days"],
-                "paRequired": r["prior_authorization_yn"],
-                "stepTherapyRequired": r["step_therapy_yn"],
-                "planId": r["plan_id"],
-                "contractId": r["contract_id"],
-                "segmentId": r["segment_id"],
-                "planName": r["plan_name"],
-                "contractName": r["contract_name"],
-                "coveredStatus": "Covered",
-            }
-            for r in rows
-        ]
+        data = [formulary_lookup_item(r) for r in rows]
 
         return JSONResponse(
             status_code=status.HTTP_200_OK,
@@ -561,6 +854,29 @@ async def formulary_lookup(
             content={"error": "Database error while performing formulary lookup", "details": str(e)},
         )
 
+# Bits of basic_drugs_formulary.restrictions, computed by the loaders from the Y/N flags
+RESTRICTION_BITS = {"pa": 1, "st": 2, "ql": 4}
+RESTRICTION_FLAGS = {"pa": "prior_authorization_yn", "st": "step_therapy_yn", "ql": "quantity_limit_yn"}
+
+def restriction_masks(flags):
+    # Every restrictions value matching {"pa": "Y", "ql": "N", ...}; one indexed
+    # "restrictions = ANY(...)" predicate narrows the rows. A bit is set only for
+    # 'Y', so a clear bit also covers a NULL or blank flag: the flags asked for
+    # as 'N' are still compared exactly (see formulary_search)
+    return [
+        mask for mask in range(8)
+        if all(bool(mask & RESTRICTION_BITS[name]) == (value == "Y") for name, value in flags.items())
+    ]
+
+# After the sort column: one row per NDC of a formulary version (see
+# idx_bdf_tier_keyset in create_index.py for the default order)
+BDF_TIEBREAK = [
+    ("COALESCE(bf.ndc, '')", str),
+    ("bf.formulary_id", str),
+    ("COALESCE(bf.contract_year, 0)", int),
+    ("COALESCE(bf.formulary_version, -1)", int),
+]
+
 # http://127.0.0.1:8000/api/bdf/search?rxcui=617314&ndc=58151015577&pa=N&st=Y&ql=Y&tier=1&limit=10&offset=0
 @app.get("/api/bdf/search")
 async def formulary_search(
@@ -575,6 +891,7 @@ async def formulary_search(
     sort_dir: Optional[str] = Query(None),
     limit: int = Query(100, gt=0),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
 ):
     pool = request.app.state.pool
 
@@ -603,16 +920,24 @@ async def formulary_search(
             content={"error": "Parameter 'ql' must be 'Y' or 'N'"},
         )
 
-    # Map sort options
+    # Map sort options; ties are broken by BDF_TIEBREAK in the same direction
     sort_column_map = {
-        "formularyId": "bf.formulary_id",
-        "tierLevel": "bf.tier_level_value",
-        "paRequired": "bf.prior_authorization_yn",
-        "stepTherapyRequired": "bf.step_therapy_yn",
-        "quantityLimit": "bf.quantity_limit_yn",
+        "formularyId": ("bf.formulary_id", str),
+        "tierLevel": ("COALESCE(bf.tier_level_value, -1)", int),
+        "paRequired": ("COALESCE(bf.prior_authorization_yn, '')", str),
+        "stepTherapyRequired": ("COALESCE(bf.step_therapy_yn, '')", str),
+        "quantityLimit": ("COALESCE(bf.quantity_limit_yn, '')", str),
     }
-    sort_by_column = sort_column_map.get(sort_by, "bf.tier_level_value")
+    sort_key = sort_by if sort_by in sort_column_map else "tierLevel"
     sort_direction = "DESC" if (sort_dir and sort_dir.upper() == "DESC") else "ASC"
+    keys = [sort_column_map[sort_key]] + BDF_TIEBREAK
+    scope = f"bdf:{sort_key}:{sort_direction}"
+
+    after = None
+    if cursor is not None:
+        after = decode_cursor(cursor, scope, keys)
+        if after is None or offset:
+            return invalid_cursor_response(offset)
 
     # Build WHERE clauses dynamically
     where_clauses = []
@@ -623,25 +948,28 @@ async def formulary_search(
         params.append(rxcui)
         param_idx += 1
     if ndc:
-        where_clauses.append(f"bf.ndc = ${param_idx}")
-        params.append(ndc)
+        ndcs = resolve_ndc(request, ndc)
+        if not ndcs:
+            return invalid_ndc_response()
+        where_clauses.append(f"bf.ndc11 = ANY(${param_idx}::bigint[])")
+        params.append(ndcs)
         param_idx += 1
     if tier is not None:
         where_clauses.append(f"bf.tier_level_value = ${param_idx}")
         params.append(tier)
         param_idx += 1
-    if pa:
-        where_clauses.append(f"bf.prior_authorization_yn = ${param_idx}")
-        params.append(pa.upper())
-        param_idx += 1
-    if st:
-        where_clauses.append(f"bf.step_therapy_yn = ${param_idx}")
-        params.append(st.upper())
-        param_idx += 1
-    if ql:
-        where_clauses.append(f"bf.quantity_limit_yn = ${param_idx}")
-        params.append(ql.upper())
+    flags = {name: value.upper() for name, value in (("pa", pa), ("st", st), ("ql", ql)) if value}
+    if flags:
+        where_clauses.append(f"bf.restrictions = ANY(${param_idx}::smallint[])")
+        params.append(restriction_masks(flags))
         param_idx += 1
+        where_clauses.extend(f"bf.{RESTRICTION_FLAGS[name]} = 'N'" for name, value in flags.items() if value == "N")
+
+    if after is not None:
+        # Seek past the previous page's last row instead of skipping rows
+        where_clauses.append(keyset_seek(keys, sort_direction, param_idx))
+        params.extend(after)
+        param_idx += len(after)
 
     where_sql = " AND ".join(where_clauses)
     
@@ -650,10 +978,13 @@ async def formulary_search(
 
 
     query = f"""
-        SELECT *
+        SELECT bf.formulary_id, bf.formulary_version, bf.contract_year, bf.rxcui, bf.ndc,
+               bf.tier_level_value, bf.quantity_limit_yn, bf.quantity_limit_amount,
+               bf.quantity_limit_days, bf.prior_authorization_yn, bf.step_therapy_yn,
+               {keyset_columns(keys)}
         FROM basic_drugs_formulary bf
         WHERE {where_sql}
-        ORDER BY {sort_by_column} {sort_direction}, bf.ndc ASC
+        {keyset_order(keys, sort_direction)}
         LIMIT ${param_idx} OFFSET ${param_idx + 1}
     """
 
@@ -680,7 +1011,8 @@ async def formulary_search(
 
         return JSONResponse(
             status_code=status.HTTP_200_OK,
-            content={"limit": limit, "offset": offset, "count": len(data), "data": data},
+            content={"limit": limit, "offset": offset, "count": len(data), "data": data,
+                     "nextCursor": next_cursor(scope, keys, rows, limit)},
         )
     except Exception as e:
         return JSONResponse(
@@ -735,9 +1067,16 @@ async def drug_profit_analysis(
             params.append(rxcui)
             param_index += 1
         else: 
-            conditions.append(f"ndc = ${param_index}")
-            params.append(ndc)
+            ndcs = resolve_ndc(request, ndc)
+            if not ndcs:
+                return invalid_ndc_response()
+            conditions.append(f"ndc11 = ANY(${param_index}::bigint[])")
+            params.append(ndcs)
             param_index += 1
+            # The tier requirements below are looked up by RxCUI
+            rxcuis = request.app.state.ndc_index.get(ndcs[0])
+            if rxcuis:
+                rxcui = rxcuis[0]
 
         tier_level_value = tier
         if tier_level_value is not None:
@@ -746,7 +1085,12 @@ async def drug_profit_analysis(
             param_index += 1
 
         where_sql = " AND ".join(conditions)
-        sql = f"SELECT * FROM basic_drugs_formulary WHERE {where_sql} LIMIT {limitb} OFFSET {offset}"
+        sql = f"""
+            SELECT formulary_id, formulary_version, contract_year, rxcui, ndc, tier_level_value,
+                   quantity_limit_yn, quantity_limit_amount, quantity_limit_days,
+                   prior_authorization_yn, step_therapy_yn
+            FROM basic_drugs_formulary WHERE {where_sql} LIMIT {limitb} OFFSET {offset}
+        """
 
         formulary_res = await pool.fetch(sql, *params)
 
@@ -778,7 +1122,7 @@ async def drug_profit_analysis(
                 plan_params.append(contract_name)
 
         plan_sql = f"""
-            SELECT DISTINCT p.contract_id, p.plan_id, p.segment_id,
+            SELECT DISTINCT p.plan_sk, p.contract_id, p.plan_id, p.segment_id,
                             p.contract_name, p.plan_name, p.premium, p.deductible,
                             p.ma_region_code, p.pdp_region_code, p.state, p.county_code, p.snp
             FROM plan_info p
@@ -805,10 +1149,10 @@ async def drug_profit_analysis(
                        cost_min_amt_mail_pref, cost_max_amt_mail_pref,
                        cost_min_amt_mail_nonpref, cost_max_amt_mail_nonpref
                 FROM beneficiary_cost
-                WHERE contract_id = $1 AND plan_id = $2 AND segment_id = $3 AND tier = ANY($4)
+                WHERE plan_sk = $1 AND tier = ANY($2)
             """
             tier_levels = [r["tier_level_value"] for r in formulary_res]
-            costs = await pool.fetch(cost_sql, contract_id, plan_id, segment_id, tier_levels)
+            costs = await pool.fetch(cost_sql, plan["plan_sk"], tier_levels)
 
             # Fetch formulary tier requirements
             reqs_sql = """
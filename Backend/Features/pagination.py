@@ -0,0 +1,54 @@
+# Keyset pagination of /api/trends, /api/region_detail and /api/bdf/search (main.py).
+# Every page carries "nextCursor" (null on the last page): the sort key of its
+# last row in an opaque token. Sent back as ?cursor=, it makes the next query
+# seek past that row through an index ("WHERE (keys) < (last key)") instead of
+# sorting and discarding `offset` rows, so page N costs what page 1 does.
+# offset still works, but not together with a cursor.
+#
+# Sort keys are [(SQL expression, type of its value)]. Each key list is one
+# sort direction and its last keys make rows unique; NULLs are replaced so a
+# row comparison can seek over them (and the indexes in create_index.py match).
+
+import base64
+import json
+
+
+def encode_cursor(scope, key):
+    raw = json.dumps([scope, *key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token, scope, keys):
+    # The key values of a token from encode_cursor(scope, ...), None when the
+    # token is malformed or belongs to another endpoint or sort order
+    try:
+        value = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except ValueError:
+        return None
+    if not isinstance(value, list) or len(value) != len(keys) + 1 or value[0] != scope:
+        return None
+    key = value[1:]
+    if not all(type(v) is kind for v, (_, kind) in zip(key, keys)):
+        return None
+    return key
+
+
+def keyset_columns(keys):
+    # Select list of the sort key values, read back by next_cursor()
+    return ", ".join(f"{expr} AS key_{i}" for i, (expr, _) in enumerate(keys))
+
+
+def keyset_order(keys, direction):
+    return "ORDER BY " + ", ".join(f"{expr} {direction}" for expr, _ in keys)
+
+
+def keyset_seek(keys, direction, first_param):
+    # Rows after the cursor's key ($first_param...) in keyset_order(keys, direction)
+    placeholders = ", ".join(f"${first_param + i}" for i in range(len(keys)))
+    return f"({', '.join(expr for expr, _ in keys)}) {'<' if direction == 'DESC' else '>'} ({placeholders})"
+
+
+def next_cursor(scope, keys, rows, limit):
+    if len(rows) < limit:
+        return None
+    return encode_cursor(scope, [rows[-1][f"key_{i}"] for i in range(len(keys))])
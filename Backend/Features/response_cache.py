@@ -0,0 +1,68 @@
+# In-process response cache for the aggregate endpoints of main.py.
+#
+# Entries are keyed on the endpoint, its normalized query parameters and the
+# data-release version stamp: the latest data_release.release_id, which the
+# loaders bump after every load (see Insert to Table/releases.py). The data
+# only changes with a release, so an entry stays valid until the next one is
+# recorded; main.py LISTENs for the loaders' NOTIFY and calls set_version(),
+# which drops every entry. Eviction is least-recently-used, at most
+# max_entries entries.
+
+from collections import OrderedDict
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, endpoint, params):
+        # Parameters left unset do not make a separate entry
+        return endpoint, self.version, tuple(sorted((k, v) for k, v in params.items() if v is not None))
+
+    def get(self, endpoint, params):
+        key = self.key(endpoint, params)
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, endpoint, params, value):
+        key = self.key(endpoint, params)
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def set_version(self, version):
+        # Returns True when the version changed and the entries were dropped
+        if version == self.version:
+            return False
+        if self.entries:
+            self.invalidations += 1
+        self.entries.clear()
+        self.version = version
+        return True
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "entries": len(self.entries),
+            "maxEntries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,119 @@
+# Streamed responses for the endpoints of main.py that return every matching row.
+#
+# A client that sends "Accept: application/x-ndjson" (or application/ndjson)
+# gets one JSON object per line, "Accept: text/csv" gets CSV with a header
+# row; any other Accept keeps the usual JSON document. Streamed rows come from
+# a server-side cursor, STREAM_CHUNK_ROWS per round trip, and every chunk is
+# written out before the next one is fetched, so a request holds one chunk in
+# memory however large the result is.
+#
+# The query is started and its first chunk fetched before the response
+# begins, so a database error is still an error response. An error after that
+# aborts the response, and the client sees an incomplete body. An empty result
+# is an empty body: there is no first row to take the CSV header from.
+
+import csv
+import io
+import json
+
+from fastapi.responses import StreamingResponse
+
+STREAM_CHUNK_ROWS = 2000
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def stream_format(request):
+    # "ndjson", "csv" or None (a JSON document) from the Accept header
+    accept = request.headers.get("accept", "").lower()
+    if "application/x-ndjson" in accept or "application/ndjson" in accept:
+        return "ndjson"
+    if "text/csv" in accept:
+        return "csv"
+    return None
+
+
+def ndjson_chunk(items):
+    return "".join(json.dumps(item, separators=(",", ":")) + "\n" for item in items)
+
+
+class CsvChunks:
+    # Called with each chunk of items; the header comes from the first item's keys
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = None
+
+    def __call__(self, items):
+        for item in items:
+            if self.writer is None:
+                self.writer = csv.DictWriter(self.buffer, fieldnames=list(item))
+                self.writer.writeheader()
+            self.writer.writerow(item)
+        chunk = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return chunk
+
+
+class ReleasingStreamingResponse(StreamingResponse):
+    # Calls release() once the response is over, also when the body was never
+    # iterated (the client went away before the headers were sent): a body
+    # generator that never started does not run its finally
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.release()
+
+
+def connection_releaser(pool, conn, transaction):
+    # release() rolls back the streaming transaction (if it got started) and
+    # returns conn to the pool; only the first call does anything
+    released = False
+
+    async def release():
+        nonlocal released
+        if released:
+            return
+        released = True
+        try:
+            if conn.is_in_transaction():
+                await transaction.rollback()
+        finally:
+            await pool.release(conn)
+    return release
+
+
+async def stream_response(pool, query, params, to_item, fmt):
+    # StreamingResponse of query in fmt; to_item(row) is the endpoint's JSON
+    # object for a row. The connection stays checked out until the body ends
+    # or the response is abandoned; the read-only transaction is then rolled back.
+    conn = await pool.acquire()
+    transaction = conn.transaction()
+    release = connection_releaser(pool, conn, transaction)
+    try:
+        await transaction.start()
+        cursor = await conn.cursor(query, *params)
+        first = await cursor.fetch(STREAM_CHUNK_ROWS)
+    except BaseException:
+        await release()
+        raise
+    encode = CsvChunks() if fmt == "csv" else ndjson_chunk
+
+    async def body():
+        rows = first
+        try:
+            while rows:
+                yield encode([to_item(r) for r in rows])
+                if len(rows) < STREAM_CHUNK_ROWS:
+                    break
+                rows = await cursor.fetch(STREAM_CHUNK_ROWS)
+        finally:
+            await release()
+
+    return ReleasingStreamingResponse(body(), release, media_type=MEDIA_TYPES[fmt])
@@ -0,0 +1,50 @@
+# Tests for the keyset cursor helpers of pagination.py.
+
+import base64
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor, keyset_columns, keyset_order, keyset_seek, next_cursor
+
+KEYS = [("COALESCE(tot_clms, -1)", int), ("COALESCE(brnd_name, '')", str)]
+
+
+def test_cursor_round_trip():
+    token = encode_cursor("region", [1200, "Zoloft / 50 mg"])
+    assert "=" not in token and "+" not in token and "/" not in token
+    assert decode_cursor(token, "region", KEYS) == [1200, "Zoloft / 50 mg"]
+
+
+@pytest.mark.parametrize("token", [
+    "",
+    "not a token",
+    "%%%",
+    encode_cursor("trends:2023", [1200, "x"]),  # another endpoint or year
+    encode_cursor("region", [1200]),  # wrong number of keys
+    encode_cursor("region", [1200, "x", "y"]),
+    encode_cursor("region", ["1200", "x"]),  # wrong types
+    encode_cursor("region", [True, "x"]),
+    encode_cursor("region", [1200.5, "x"]),
+    encode_cursor("region", [None, "x"]),
+])
+def test_decode_cursor_rejects(token):
+    assert decode_cursor(token, "region", KEYS) is None
+
+
+def test_decode_cursor_rejects_non_list_json():
+    token = base64.urlsafe_b64encode(b'{"a": 1}').decode().rstrip("=")
+    assert decode_cursor(token, "region", KEYS) is None
+
+
+def test_keyset_sql():
+    assert keyset_columns(KEYS) == "COALESCE(tot_clms, -1) AS key_0, COALESCE(brnd_name, '') AS key_1"
+    assert keyset_order(KEYS, "DESC") == "ORDER BY COALESCE(tot_clms, -1) DESC, COALESCE(brnd_name, '') DESC"
+    assert keyset_seek(KEYS, "DESC", 3) == "(COALESCE(tot_clms, -1), COALESCE(brnd_name, '')) < ($3, $4)"
+    assert keyset_seek(KEYS, "ASC", 1) == "(COALESCE(tot_clms, -1), COALESCE(brnd_name, '')) > ($1, $2)"
+
+
+def test_next_cursor():
+    rows = [{"key_0": 9, "key_1": "b"}, {"key_0": 5, "key_1": "a"}]
+    assert next_cursor("region", KEYS, rows, 3) is None
+    token = next_cursor("region", KEYS, rows, 2)
+    assert decode_cursor(token, "region", KEYS) == [5, "a"]
@@ -0,0 +1,145 @@
+# Tests for stream_response (streaming.py) with stand-in asyncpg objects; no
+# database needed. They check that the pooled connection always goes back to
+# the pool, with its transaction rolled back, however the response ends.
+
+import asyncio
+
+import pytest
+
+import streaming
+
+SCOPE = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "method": "GET"}
+
+
+class ClientGone(Exception):
+    pass
+
+
+class FakeTransaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def start(self):
+        self.conn.in_transaction = True
+
+    async def rollback(self):
+        self.conn.in_transaction = False
+        self.conn.rollbacks += 1
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetch(self, n):
+        rows, self.rows = self.rows[:n], self.rows[n:]
+        return rows
+
+
+class FakeConnection:
+    def __init__(self, rows, fail=False):
+        self.rows = rows
+        self.fail = fail
+        self.in_transaction = False
+        self.rollbacks = 0
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def is_in_transaction(self):
+        return self.in_transaction
+
+    async def cursor(self, query, *params):
+        if self.fail:
+            raise RuntimeError("relation does not exist")
+        return FakeCursor(list(self.rows))
+
+
+class FakePool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.released = []
+
+    async def acquire(self):
+        return self.conn
+
+    async def release(self, conn):
+        assert not conn.in_transaction
+        self.released.append(conn)
+
+
+async def receive():
+    await asyncio.sleep(3600)
+    return {"type": "http.disconnect"}
+
+
+def respond(pool, send, fmt="ndjson"):
+    async def run():
+        response = await streaming.stream_response(pool, "SELECT", [], lambda r: {"id": r}, fmt)
+        await response(SCOPE, receive, send)
+    asyncio.run(run())
+
+
+def test_full_body_releases_once(monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_ROWS", 2)
+    pool = FakePool(FakeConnection([1, 2, 3]))
+    body = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    respond(pool, send)
+    assert b"".join(body) == b'{"id":1}\n{"id":2}\n{"id":3}\n'
+    assert pool.released == [pool.conn]
+    assert pool.conn.rollbacks == 1
+
+
+def test_csv_header_from_first_row():
+    pool = FakePool(FakeConnection([1, 2]))
+    body = []
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    respond(pool, send, "csv")
+    assert b"".join(body).replace(b"\r\n", b"\n") == b"id\n1\n2\n"
+
+
+def test_client_gone_before_body_releases_connection():
+    pool = FakePool(FakeConnection([1, 2, 3]))
+
+    async def send(message):
+        raise ClientGone()
+
+    with pytest.raises(ClientGone):
+        respond(pool, send)
+    assert pool.released == [pool.conn]
+    assert pool.conn.rollbacks == 1
+
+
+def test_client_gone_mid_body_releases_once(monkeypatch):
+    monkeypatch.setattr(streaming, "STREAM_CHUNK_ROWS", 1)
+    pool = FakePool(FakeConnection([1, 2, 3]))
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            raise ClientGone()
+
+    with pytest.raises(ClientGone):
+        respond(pool, send)
+    assert pool.released == [pool.conn]
+    assert pool.conn.rollbacks == 1
+
+
+def test_query_error_releases_connection():
+    pool = FakePool(FakeConnection([], fail=True))
+
+    async def send(message):
+        pass
+
+    with pytest.raises(RuntimeError):
+        respond(pool, send)
+    assert pool.released == [pool.conn]
+    assert pool.conn.rollbacks == 1
@@ -0,0 +1,195 @@
+# Binary COPY for the tables with 'copy_format': 'binary' in table_specs.py.
+#
+# The rows are converted to native values once on the client and sent in
+# PostgreSQL's binary COPY format, so the server does not parse text into
+# numeric/int for every cell. Each column is encoded for its type in the
+# target table (read from the catalog when the load starts), and a value the
+# column cannot hold is rejected here, with its line in the rejects file, instead
+# of failing the whole COPY chunk on the server:
+#
+#   int2/int4/int8  out of range, or not a whole number
+#   numeric(p,s)    more than p - s integer digits (after rounding to s
+#                   places, as the server would), NaN or infinity
+#   varchar/char(n) longer than n characters (trailing spaces are cut, as
+#                   the server does)
+
+import struct
+from decimal import ROUND_HALF_UP, Decimal
+
+from connect_db import copy_in
+from copy_stream import COPY_BUFFER_SIZE, CopyStream
+from field_types import strict_decimal
+
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+PGCOPY_TRAILER = struct.pack('>h', -1)
+NULL_FIELD = struct.pack('>i', -1)
+
+NUMERIC_POS = 0x0000
+NUMERIC_NEG = 0x4000
+NBASE_DIGITS = 4  # decimal digits per base-10000 numeric digit
+
+INT_FORMATS = {'int2': struct.Struct('>ih'), 'int4': struct.Struct('>ii'), 'int8': struct.Struct('>iq')}
+INT_SIZES = {'int2': 2, 'int4': 4, 'int8': 8}
+TEXT_TYPES = {'text', 'varchar', 'bpchar'}
+
+
+def column_types(conn, table):
+    # {column: (type name, typmod)} of table, typmod -1 when it has none
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT a.attname, t.typname, a.atttypmod
+            FROM pg_attribute a JOIN pg_type t ON t.oid = a.atttypid
+            WHERE a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped
+        """, (table,))
+        types = {name: (typname, typmod) for name, typname, typmod in cur.fetchall()}
+    conn.commit()
+    if not types:
+        raise ValueError(f"Table {table} not found")
+    return types
+
+
+def int_encoder(typname):
+    fmt = INT_FORMATS[typname]
+    size = INT_SIZES[typname]
+
+    def encode(value):
+        if not isinstance(value, int):
+            number = strict_decimal(value) if isinstance(value, str) else value
+            if number != number.to_integral_value():
+                raise ValueError(f"Not a whole number: {value}")
+            value = int(number)
+        try:
+            return fmt.pack(size, value)
+        except struct.error:
+            raise ValueError(f"{value} is out of range for {typname}") from None
+    return encode
+
+
+def numeric_encoder(typmod):
+    # numeric(p,s) keeps its precision and scale in typmod - 4: p << 16 | s
+    precision = scale = None
+    if typmod >= 4:
+        precision, scale = (typmod - 4) >> 16, (typmod - 4) & 0xffff
+        quantum = Decimal(1).scaleb(-scale)
+
+    def encode(value):
+        number = value if isinstance(value, Decimal) else strict_decimal(str(value))
+        if scale is not None:
+            number = number.quantize(quantum, rounding=ROUND_HALF_UP)
+            if number.adjusted() >= precision - scale and number:
+                raise ValueError(f"{value} does not fit numeric({precision},{scale})")
+        sign, digits, exponent = number.as_tuple()
+        dscale = max(-exponent, 0)
+        text = ''.join(map(str, digits)) + '0' * max(exponent, 0)
+        if dscale:
+            text = text.zfill(dscale + 1)
+            whole, fraction = text[:-dscale], text[-dscale:]
+        else:
+            whole, fraction = text, ''
+        whole = whole.lstrip('0')
+        whole = whole.zfill(-(-len(whole) // NBASE_DIGITS) * NBASE_DIGITS)
+        fraction = fraction.ljust(-(-len(fraction) // NBASE_DIGITS) * NBASE_DIGITS, '0')
+        groups = [int(whole[i:i + NBASE_DIGITS]) for i in range(0, len(whole), NBASE_DIGITS)]
+        weight = len(groups) - 1
+        groups += [int(fraction[i:i + NBASE_DIGITS]) for i in range(0, len(fraction), NBASE_DIGITS)]
+        # Leading and trailing zero digits are not stored
+        while groups and groups[0] == 0:
+            groups.pop(0)
+            weight -= 1
+        while groups and groups[-1] == 0:
+            groups.pop()
+        if not groups:
+            weight = 0
+        body = struct.pack(f'>hhHH{len(groups)}H', len(groups), weight,
+                           NUMERIC_NEG if sign and groups else NUMERIC_POS, dscale, *groups)
+        return struct.pack('>i', len(body)) + body
+    return encode
+
+
+def text_encoder(typmod):
+    # varchar(n) / char(n) keep n + 4 in typmod
+    length = typmod - 4 if typmod >= 4 else None
+
+    def encode(value):
+        value = value if isinstance(value, str) else str(value)
+        if length is not None and len(value) > length:
+            if value[length:].strip(' '):
+                raise ValueError(f"{value!r} is longer than {length} characters")
+            value = value[:length]
+        data = value.encode('utf-8')
+        return struct.pack('>i', len(data)) + data
+    return encode
+
+
+def field_encoder(typname, typmod):
+    if typname in INT_FORMATS:
+        return int_encoder(typname)
+    if typname == 'numeric':
+        return numeric_encoder(typmod)
+    if typname in TEXT_TYPES:
+        return text_encoder(typmod)
+    raise ValueError(f"No binary COPY encoder for type {typname}")
+
+
+class BinaryRows:
+    # convert_batch() that turns raw lines into binary COPY tuples for target.
+    # convert(raw) is a compile_spec(typed=True) converter; keys, when the
+    # table has surrogate keys, appends them to every row (and drops the
+    # lookup_only columns) before encoding.
+
+    def __init__(self, conn, target, columns, convert, keys=None):
+        types = column_types(conn, target)
+        missing = [name for name in columns if name not in types]
+        if missing:
+            raise ValueError(f"{target} has no column {', '.join(missing)}")
+        self.encoders = [field_encoder(*types[name]) for name in columns]
+        self.field_count = struct.pack('>h', len(columns))
+        self.convert = convert
+        self.keys = keys
+
+    def encode(self, row):
+        fields = [self.field_count]
+        for encode, value in zip(self.encoders, row):
+            fields.append(NULL_FIELD if value is None else encode(value))
+        return b''.join(fields)
+
+    def convert_batch(self, batch):
+        rows = []
+        rejected = []
+        for raw in batch:
+            try:
+                rows.append((raw, self.convert(raw)))
+            except (ValueError, UnicodeDecodeError):
+                if raw.strip():
+                    rejected.append(raw)
+        if self.keys is not None and rows:
+            rows = list(zip([raw for raw, _ in rows], self.keys.extend_rows([row for _, row in rows])))
+        lines = []
+        for raw, row in rows:
+            try:
+                lines.append(self.encode(row))
+            except ValueError:
+                rejected.append(raw)
+        return lines, rejected
+
+
+class BinaryCopyStream(CopyStream):
+    # CopyStream over encoded tuples, framed by the binary COPY header and trailer
+    empty = b''
+
+    def __init__(self, tuples):
+        super().__init__(self._framed(tuples))
+
+    @staticmethod
+    def _framed(tuples):
+        yield PGCOPY_HEADER
+        yield from tuples
+        yield PGCOPY_TRAILER
+
+
+def copy_tuples(cur, table, columns, tuples, size=COPY_BUFFER_SIZE):
+    # Stream encoded tuples into table with binary COPY; returns rows sent
+    stream = BinaryCopyStream(tuples)
+    copy_in(cur, table, columns, stream, size, binary=True)
+    # The header and trailer went through the stream as well
+    return stream.rows - 2
@@ -0,0 +1,224 @@
+# Quote-aware, column-at-a-time conversion for CSV sources ('format': 'csv').
+#
+# A batch of raw lines is split into records by the C csv module, so quoted
+# fields may contain the delimiter, doubled quotes and line breaks. The records
+# are then transposed and every column goes through one typed builder call:
+# int and decimal columns are validated with a single map() of their strict
+# parser (see field_types.py) over the whole column and only walked value by
+# value, to find the bad rows, when that fails. The COPY lines are assembled
+# from the finished columns.
+#
+# When the header names every spec column, columns are picked by name, so a
+# file that carries one of the spec params (e.g. a Year column) supplies it
+# per row instead of --param year.
+#
+# Records are assembled within one read batch (and one byte range of a
+# parallel load), so a quoted line break that straddles a batch boundary gets
+# both halves rejected rather than misloaded.
+
+import csv
+from itertools import repeat
+
+from copy_stream import COPY_ESCAPES, COPY_NULL
+from field_types import base_type, decimal_parser, int_parser
+from ndc import normalize_ndc
+
+
+ESCAPED_CHARS = ''.join(map(chr, COPY_ESCAPES))
+
+
+def _text_column(col, nullable):
+    # Padding and escapes are rare, so look for them in the whole column once
+    # before paying for strip() / translate() on every value
+    joined = '\x1f' + '\x1f'.join(col) + '\x1f'
+    if any(ch in joined for ch in ESCAPED_CHARS):
+        values = [v.strip().translate(COPY_ESCAPES) for v in col]
+    elif ' \x1f' in joined or '\x1f ' in joined:
+        values = [v.strip() for v in col]
+    else:
+        values = col
+    if nullable:
+        return [v or COPY_NULL for v in values], set()
+    return values, set()
+
+
+def _number_column(col, nullable, parse):
+    # PostgreSQL reads the same text (surrounding blanks included), so values
+    # are only validated here and passed through unchanged
+    try:
+        if nullable:
+            list(map(parse, filter(None, col)))
+            return [v or COPY_NULL for v in col], set()
+        list(map(parse, col))
+        return col, set()
+    except ValueError:
+        pass
+
+    # Something in the column is empty or malformed; find it
+    values = []
+    bad = set()
+    for i, v in enumerate(col):
+        v = v.strip()
+        if not v:
+            if not nullable:
+                bad.add(i)
+            values.append(COPY_NULL)
+            continue
+        try:
+            parse(v)
+        except ValueError:
+            bad.add(i)
+            values.append(COPY_NULL)
+            continue
+        values.append(v)
+    return values, bad
+
+
+def build_column(col, col_type, nullable):
+    # Returns (COPY text for every value, indexes of the values that failed)
+    kind = base_type(col_type)
+    if kind == 'int':
+        return _number_column(col, nullable, int_parser(col_type))
+    if kind == 'decimal':
+        return _number_column(col, nullable, decimal_parser(col_type))
+    return _text_column(col, nullable)
+
+
+def bitmask_column(*cols):
+    # Bit i set where the i-th column is 'Y'
+    return [str(sum(1 << i for i, v in enumerate(values) if v.strip() == 'Y')) for values in zip(*cols)]
+
+
+def ndc11_column(col):
+    values = []
+    for v in col:
+        ndc = normalize_ndc(v)
+        values.append(COPY_NULL if ndc is None else str(ndc))
+    return values
+
+
+DERIVED_COLUMNS = {'bitmask': bitmask_column, 'ndc11': ndc11_column}
+
+
+def parse_header(spec, header_line):
+    if not header_line:
+        return []
+    text = header_line.decode(spec['encoding'], 'replace').lstrip('\ufeff')
+    for names in csv.reader([text], delimiter=spec['delimiter']):
+        return [name.strip().lower() for name in names]
+    return []
+
+
+def compile_csv(spec, params=None, header_line=None):
+    # Build convert_batch(list of raw lines) -> (COPY lines, rejected raw lines)
+    params = params or {}
+    names = parse_header(spec, header_line)
+    file_columns = spec['columns']
+    if names and all(name in names for name, _, _ in file_columns):
+        width = len(names)
+        index = {name: i for i, name in enumerate(names)}
+    else:
+        # No usable header: the file holds exactly the spec columns, in order
+        width = len(file_columns)
+        index = {name: i for i, (name, _, _) in enumerate(file_columns)}
+
+    # (file column index or None, type, nullable, constant COPY text) in row_columns() order
+    layout = []
+    for name, col_type in spec.get('params', []):
+        if name in index:
+            layout.append((index[name], col_type, False, None))
+            continue
+        if name not in params:
+            raise ValueError(f"Missing parameter '{name}' for this table (not a column of the file either)")
+        values, bad = build_column([str(params[name])], col_type, False)
+        if bad:
+            raise ValueError(f"Bad value for parameter '{name}': {params[name]!r}")
+        layout.append((None, col_type, False, values[0]))
+    for name, col_type, nullable in file_columns:
+        layout.append((index[name], col_type, nullable, None))
+    derived = []
+    for _, kind, sources in spec.get('derived', []):
+        if kind not in DERIVED_COLUMNS:
+            raise ValueError(f"Unknown derived column kind: {kind}")
+        derived.append((DERIVED_COLUMNS[kind], [index[name] for name in sources]))
+
+    encoding = spec['encoding']
+    errors = spec['errors']
+    delimiter = spec['delimiter']
+
+    def decode(batch):
+        try:
+            return [raw.decode(encoding, errors) for raw in batch]
+        except UnicodeDecodeError:
+            pass
+        text_lines = []
+        for raw in batch:
+            try:
+                text_lines.append(raw.decode(encoding, errors))
+            except UnicodeDecodeError:
+                text_lines.append('')  # parses as a bad record, keeping the line numbers aligned
+        return text_lines
+
+    def split_records(batch):
+        # Returns (records, the raw bytes of each record, rejected raw lines).
+        # Blank lines are dropped.
+        text_lines = decode(batch)
+        try:
+            records = list(csv.reader(text_lines, delimiter=delimiter))
+        except csv.Error:
+            records = None
+        if records is not None and len(records) == len(batch):
+            # One record per line, the usual case
+            if set(map(len, records)) == {width}:
+                return records, batch, []
+            good = [i for i, record in enumerate(records) if len(record) == width]
+            rejected = [raw for i, (record, raw) in enumerate(zip(records, batch))
+                        if len(record) != width and raw.strip()]
+            return [records[i] for i in good], [batch[i] for i in good], rejected
+
+        # Quoted line breaks, or a line the csv module refused: walk the records
+        records = []
+        raws = []
+        rejected = []
+        lines = iter(text_lines)
+        offset = 0
+        while True:
+            reader = csv.reader(lines, delimiter=delimiter)
+            prev = 0
+            try:
+                for record in reader:
+                    raw = batch[offset + prev:offset + reader.line_num]
+                    prev = reader.line_num
+                    if len(record) == width:
+                        records.append(record)
+                        raws.append(b''.join(raw))
+                    elif any(line.strip() for line in raw):
+                        rejected.extend(raw)
+                return records, raws, rejected
+            except csv.Error:
+                rejected.extend(batch[offset + prev:offset + reader.line_num])
+                offset += reader.line_num
+
+    def convert_batch(batch):
+        records, raws, rejected = split_records(batch)
+        if not records:
+            return [], rejected
+        columns = list(zip(*records))
+        built = []
+        bad = set()
+        for col_index, col_type, nullable, constant in layout:
+            if col_index is None:
+                built.append(repeat(constant))
+                continue
+            values, col_bad = build_column(columns[col_index], col_type, nullable)
+            built.append(values)
+            bad |= col_bad
+        for build, indexes in derived:
+            built.append(build(*[columns[i] for i in indexes]))
+        lines = [row + '\n' for row in map('\t'.join, zip(*built))]
+        if bad:
+            rejected.extend(raws[i] for i in sorted(bad))
+            lines = [line for i, line in enumerate(lines) if i not in bad]
+        return lines, rejected
+
+    return convert_batch
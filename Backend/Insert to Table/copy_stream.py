@@ -0,0 +1,65 @@
+import sys
+
+from connect_db import copy_in
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module
+    resource = None
+
+# Characters that must be backslash-escaped inside a COPY text-format field
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+COPY_NULL = '\\N'
+
+COPY_BUFFER_SIZE = 1 << 20  # bytes handed to PostgreSQL per read() call
+
+
+class CopyStream:
+    # File-like wrapper around an iterator of COPY text lines.
+    # psycopg2's copy_expert() pulls data with read(size), so only one buffer
+    # worth of rows is ever held in memory no matter how large the source is.
+    empty = ''
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+        self.rows = 0
+        self.bytes = 0
+
+    def read(self, size=-1):
+        chunk = []
+        length = 0
+        for line in self._lines:
+            chunk.append(line)
+            length += len(line)
+            if 0 < size <= length:
+                break
+        self.rows += len(chunk)
+        self.bytes += length
+        return self.empty.join(chunk)
+
+    def readline(self, size=-1):
+        line = next(self._lines, self.empty)
+        if line:
+            self.rows += 1
+            self.bytes += len(line)
+        return line
+
+
+def copy_lines(cur, table, columns, lines, size=COPY_BUFFER_SIZE):
+    # Stream pre-formatted COPY text lines into table; returns rows sent
+    stream = CopyStream(lines)
+    copy_in(cur, table, columns, stream, size)
+    return stream.rows
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process in MB (None if unavailable)
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on Linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().peak_wset / (1024 * 1024)
@@ -0,0 +1,187 @@
+# Apply a new release of a table as a row-level delta instead of a full reload.
+#
+#   python delta_refresh.py <file> [--table basic_drugs_formulary] [--summary changes.json]
+#
+# The new file is copied into an UNLOGGED <table>_delta table (no WAL), then
+# compared with the live table on the spec's natural_key. Only the differences
+# are written to the live table, in one transaction:
+#   - rows whose key is gone from the new file are deleted
+#   - rows whose key exists in both but whose other columns differ are updated
+#   - rows with a new key are inserted
+# so refresh time and WAL volume follow the churn between releases, not the
+# table size. Keys containing NULL never match and are replaced instead.
+#
+# On a partitioned table only the partitions whose values occur in the new
+# file are refreshed (e.g. the current contract year); the others are left
+# alone and retired with `python partitions.py drop`.
+#
+# A refresh that changes rows is recorded as a data release (see releases.py).
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from connect_db import connect_db
+from ingest import load_file, parse_params, table_columns
+from journal import reset_target
+from ndc import CROSSWALK_SOURCE, update_crosswalk
+from partitions import ensure_partition
+from releases import complete_release
+from table_specs import TABLE_SPECS
+
+DELTA_SUFFIX = '_delta'
+
+
+def key_match(key, left, right):
+    return ' AND '.join(f"{left}.{col} = {right}.{col}" for col in key)
+
+
+def create_delta_table(conn, table):
+    delta = table + DELTA_SUFFIX
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {delta}")
+        cur.execute(f"CREATE UNLOGGED TABLE {delta} (LIKE {table} INCLUDING DEFAULTS)")
+    conn.commit()
+    reset_target(conn, delta)
+    return delta
+
+
+def delta_values(conn, table, delta):
+    # Partition values present in the delta table, or None if table is not partitioned
+    column = TABLE_SPECS[table].get('partition_by')
+    if column is None:
+        return None
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT DISTINCT {column} FROM {delta}")
+        values = [value for (value,) in cur.fetchall()]
+    conn.commit()
+    return values
+
+
+def apply_delta(conn, table, delta, values=None):
+    # Returns the change summary; everything is applied in one transaction.
+    # values limits the deletes to those partition values (see delta_values)
+    spec = TABLE_SPECS[table]
+    key = spec['natural_key']
+    columns = table_columns(spec)
+    others = [col for col in columns if col not in key]
+    match = key_match(key, 't', 'd')
+    changed = (f"({', '.join('t.' + col for col in others)}) IS DISTINCT FROM "
+               f"({', '.join('d.' + col for col in others)})")
+
+    scope = ''
+    scope_params = None
+    if values is not None:
+        # Constants, so the planner prunes every other partition
+        column = spec['partition_by']
+        scope = f"AND (t.{column} = ANY(%s){f' OR t.{column} IS NULL' if None in values else ''})"
+        scope_params = ([value for value in values if value is not None],)
+
+    summary = {'table': table}
+    with conn.cursor() as cur:
+        cur.execute(f"ANALYZE {delta}")
+        key_sql = ', '.join(key)
+        cur.execute(f"SELECT count(*), count(DISTINCT ({key_sql})) FROM {delta}")
+        total, distinct = cur.fetchone()
+        if total != distinct:
+            raise ValueError(f"{total - distinct} duplicate ({key_sql}) keys in the new file; "
+                             "delta refresh needs a unique natural key")
+        summary['new_rows'] = total
+
+        # Per-column change counts for the rows that are about to be updated
+        counts = ', '.join(f"count(*) FILTER (WHERE t.{col} IS DISTINCT FROM d.{col})" for col in others)
+        cur.execute(f"SELECT {counts} FROM {table} t JOIN {delta} d ON {match} WHERE {changed}")
+        summary['changed_columns'] = {col: n for col, n in zip(others, cur.fetchone()) if n}
+
+        cur.execute(f"""
+            DELETE FROM {table} t
+            WHERE NOT EXISTS (SELECT 1 FROM {delta} d WHERE {match}) {scope}
+        """, scope_params)
+        summary['deleted'] = cur.rowcount
+
+        cur.execute(f"""
+            UPDATE {table} t
+            SET {', '.join(f'{col} = d.{col}' for col in others)}
+            FROM {delta} d
+            WHERE {match} AND {changed}
+        """)
+        summary['updated'] = cur.rowcount
+
+        cur.execute(f"""
+            INSERT INTO {table} ({', '.join(columns)})
+            SELECT {', '.join('d.' + col for col in columns)}
+            FROM {delta} d
+            WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {match})
+        """)
+        summary['inserted'] = cur.rowcount
+    conn.commit()
+    summary['unchanged'] = summary['new_rows'] - summary['updated'] - summary['inserted']
+    return summary
+
+
+def delta_refresh(conn, table, path, params=None):
+    if 'natural_key' not in TABLE_SPECS[table]:
+        raise ValueError(f"{table} has no natural_key in table_specs.py")
+    start = time.perf_counter()
+    delta = create_delta_table(conn, table)
+    try:
+        stats = load_file(conn, table, path, params, target=delta)
+        values = delta_values(conn, table, delta)
+        for value in values or []:
+            if value is not None:
+                ensure_partition(conn, table, value)
+        summary = apply_delta(conn, table, delta, values)
+        if table == CROSSWALK_SOURCE:
+            update_crosswalk(conn, delta)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {delta}")
+        conn.commit()
+    summary['rejected'] = stats['rejected']
+    summary['seconds'] = round(time.perf_counter() - start, 1)
+    changed = summary['inserted'] + summary['updated'] + summary['deleted']
+    if changed:
+        complete_release(conn, os.path.abspath(path), [table], changed)
+    return summary
+
+
+def print_summary(summary):
+    print(f"🎯 {summary['table']}: {summary['inserted']} inserted, {summary['updated']} updated, "
+          f"{summary['deleted']} deleted, {summary['unchanged']} unchanged in {summary['seconds']}s")
+    for col, n in sorted(summary['changed_columns'].items(), key=lambda item: -item[1]):
+        print(f"   {col}: {n} rows changed")
+
+
+def main(argv=None):
+    delta_tables = sorted(table for table, spec in TABLE_SPECS.items() if 'natural_key' in spec)
+    parser = argparse.ArgumentParser(description="Refresh a table from a new release file as a row-level delta.")
+    parser.add_argument('file', help="Source file of the new release")
+    parser.add_argument('--table', default='basic_drugs_formulary', choices=delta_tables)
+    parser.add_argument('--param', action='append', metavar='NAME=VALUE',
+                        help="Value for a spec parameter, e.g. year=2023")
+    parser.add_argument('--summary', help="Also write the change summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    conn = connect_db('bulk_load')
+    try:
+        summary = delta_refresh(conn, args.table, args.file, parse_params(args.param))
+    except Exception as e:
+        print(f"❌ Delta refresh of {args.table} failed: {e}")
+        return 1
+    finally:
+        conn.close()
+
+    print_summary(summary)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
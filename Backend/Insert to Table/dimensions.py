@@ -0,0 +1,218 @@
+# Surrogate integer keys for the plan and formulary identifiers.
+#
+#   python dimensions.py backfill [<table> ...]   # fill the key columns of rows loaded before
+#
+# dim_formulary and dim_plan map the VARCHAR identifiers (formulary_id;
+# contract_id + plan_id + segment_id) to small integer keys. Tables with
+# 'surrogate_keys' in table_specs.py get those keys as extra columns, filled by
+# the loaders: every converted batch is looked up in an in-memory copy of the
+# dimension and only identifiers not seen before go to the database, on a
+# separate autocommit connection (the load's own connection is busy with COPY).
+# Concurrent workers may add the same identifier; ON CONFLICT keeps the first
+# key, so a key never changes once assigned.
+#
+# Tables with 'lookup_only' columns (beneficiary_cost, insulin_beneficiary_cost)
+# store only the key: the loaders read the identifiers from the file, look the
+# key up and drop them, and queries join the dimension to get the strings back.
+# The other tables keep their string columns for filters, the API responses and
+# delta_refresh's natural keys; joins between them use the integer keys.
+
+import sys
+
+from connect_db import connect_db, new_connection
+from copy_stream import COPY_NULL
+from table_specs import TABLE_SPECS
+
+DIMENSIONS = {
+    # dimension table: (key column, [(identifier column, type)])
+    'dim_formulary': ('formulary_sk', [('formulary_id', 'VARCHAR(20)')]),
+    'dim_plan': ('plan_sk', [('contract_id', 'VARCHAR(20)'), ('plan_id', 'VARCHAR(20)'),
+                             ('segment_id', 'VARCHAR(20)')]),
+}
+
+dimensions_ready = False
+
+
+def ensure_dimensions(conn):
+    global dimensions_ready
+    if dimensions_ready:
+        return
+    with conn.cursor() as cur:
+        for dimension, (key, columns) in DIMENSIONS.items():
+            column_sql = ',\n  '.join(f"{name} {col_type} NOT NULL" for name, col_type in columns)
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {dimension} (
+                  {key} SERIAL PRIMARY KEY,
+                  {column_sql},
+                  UNIQUE ({', '.join(name for name, _ in columns)})
+                )
+            """)
+    conn.commit()
+    dimensions_ready = True
+
+
+def dimension_columns(dimension):
+    return [name for name, _ in DIMENSIONS[dimension][1]]
+
+
+class KeyResolver:
+    # Identifier tuple (COPY text) -> surrogate key (COPY text) for one dimension
+
+    def __init__(self, conn, dimension):
+        self.conn = conn
+        self.dimension = dimension
+        self.key, _ = DIMENSIONS[dimension]
+        self.columns = dimension_columns(dimension)
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {self.key}, {', '.join(self.columns)} FROM {dimension}")
+            self.keys = {tuple(row[1:]): str(row[0]) for row in cur.fetchall()}
+
+    def add(self, idents):
+        # Assign keys to identifiers not in the dimension yet and cache them
+        column_sql = ', '.join(self.columns)
+        arrays = [list(values) for values in zip(*idents)]
+        unnest = ', '.join(['%s::text[]'] * len(arrays))
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                INSERT INTO {self.dimension} ({column_sql})
+                SELECT * FROM unnest({unnest})
+                ON CONFLICT DO NOTHING
+            """, arrays)
+            cur.execute(f"""
+                SELECT {self.key}, {column_sql} FROM {self.dimension}
+                WHERE ({column_sql}) IN (SELECT * FROM unnest({unnest}))
+            """, arrays)
+            for row in cur.fetchall():
+                self.keys[tuple(row[1:])] = str(row[0])
+
+    def resolve(self, idents):
+        missing = {ident for ident in idents if ident not in self.keys and COPY_NULL not in ident}
+        if missing:
+            self.add(sorted(missing))
+        keys = self.keys
+        return [keys.get(ident, COPY_NULL) for ident in idents]
+
+
+class SurrogateKeys:
+    # Wraps a convert_batch() so every COPY line gets the table's surrogate
+    # key columns appended, in 'surrogate_keys' order, and loses its
+    # 'lookup_only' columns (see ingest.table_columns). columns are the names
+    # of a converted row (ingest.row_columns)
+
+    def __init__(self, table, columns):
+        spec = TABLE_SPECS[table]
+        # Indexes of the stored columns, None when every column is stored
+        lookup_only = spec.get('lookup_only', [])
+        self.keep = None
+        if lookup_only:
+            self.keep = [i for i, name in enumerate(columns) if name not in lookup_only]
+        self.conn = new_connection()
+        self.conn.autocommit = True
+        ensure_dimensions(self.conn)
+        self.lookups = []
+        for key, dimension in spec['surrogate_keys']:
+            indexes = [columns.index(name) for name in dimension_columns(dimension)]
+            self.lookups.append((indexes, KeyResolver(self.conn, dimension)))
+        # Only split each line as far as the last identifier column
+        self.split = max(max(indexes) for indexes, _ in self.lookups) + 1
+
+    def lookup(self, rows, field):
+        # [(key, ...)] of every row as COPY text; field(row, i) is the COPY text of column i
+        keys = [resolver.resolve([tuple(field(row, i) for i in indexes) for row in rows])
+                for indexes, resolver in self.lookups]
+        return list(zip(*keys))
+
+    def wrap(self, convert_batch):
+        keep = self.keep
+
+        def convert(batch):
+            lines, rejected = convert_batch(batch)
+            if not lines:
+                return lines, rejected
+            if keep is None:
+                fields = [line.split('\t', self.split) for line in lines]
+                keys = self.lookup(fields, lambda f, i: f[i].rstrip('\n'))
+                return [line[:-1] + ''.join('\t' + k for k in row) + '\n'
+                        for line, row in zip(lines, keys)], rejected
+            fields = [line[:-1].split('\t') for line in lines]
+            keys = self.lookup(fields, lambda f, i: f[i])
+            return ['\t'.join([f[i] for i in keep] + list(row)) + '\n'
+                    for f, row in zip(fields, keys)], rejected
+        return convert
+
+    def row_keys(self, rows):
+        # Keys of converted row tuples (see binary_copy.py), as ints or None
+        keys = self.lookup(rows, lambda row, i: COPY_NULL if row[i] is None else str(row[i]))
+        return [tuple(None if k == COPY_NULL else int(k) for k in row) for row in keys]
+
+    def extend_rows(self, rows):
+        # Converted row tuples with their keys appended and lookup_only columns dropped
+        keys = self.row_keys(rows)
+        if self.keep is None:
+            return [row + k for row, k in zip(rows, keys)]
+        keep = self.keep
+        return [tuple([row[i] for i in keep]) + k for row, k in zip(rows, keys)]
+
+    def close(self):
+        self.conn.close()
+
+
+def stored_columns(cur, table):
+    cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name = %s", (table,))
+    return {row[0] for row in cur.fetchall()}
+
+
+def backfill(conn, table):
+    # Fill the surrogate key columns of rows loaded before the table had them.
+    # A lookup_only table can only be backfilled before its identifier
+    # columns are dropped (see its CREATE TABLE script)
+    ensure_dimensions(conn)
+    with conn.cursor() as cur:
+        stored = stored_columns(cur, table)
+        for key, dimension in TABLE_SPECS[table]['surrogate_keys']:
+            columns = dimension_columns(dimension)
+            if not all(name in stored for name in columns):
+                print(f"✅ {table}.{key}: no {', '.join(columns)} columns, the loaders fill it")
+                continue
+            column_sql = ', '.join(columns)
+            match = ' AND '.join(f"t.{name} = d.{name}" for name in columns)
+            cur.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {key} INT")
+            cur.execute(f"""
+                INSERT INTO {dimension} ({column_sql})
+                SELECT DISTINCT {column_sql} FROM {table}
+                WHERE {' AND '.join(f'{name} IS NOT NULL' for name in columns)}
+                ON CONFLICT DO NOTHING
+            """)
+            cur.execute(f"""
+                UPDATE {table} t SET {key} = d.{key}
+                FROM {dimension} d
+                WHERE {match} AND t.{key} IS DISTINCT FROM d.{key}
+            """)
+            print(f"✅ {table}.{key}: {cur.rowcount} rows updated")
+    conn.commit()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    keyed = sorted(table for table, spec in TABLE_SPECS.items() if 'surrogate_keys' in spec)
+    if not argv or argv[0] != 'backfill' or any(table not in keyed for table in argv[1:]):
+        print(f"Usage: python dimensions.py backfill [<table> ...]\n"
+              f"Tables with surrogate keys: {', '.join(keyed)}")
+        return 1
+
+    conn = connect_db()
+    try:
+        for table in argv[1:] or keyed:
+            backfill(conn, table)
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Backfill failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    print("🎯 Surrogate keys backfilled")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
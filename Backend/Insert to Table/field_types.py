@@ -0,0 +1,97 @@
+# Strict parsing of the numeric fields of the source files.
+#
+# A field is accepted only in a form PostgreSQL reads the same way, and only
+# when the target column can hold it, so a bad value rejects its row on the
+# client instead of failing the whole COPY chunk on the server:
+#
+#   int, bigint   ASCII digits with an optional sign (no '1_000', no
+#                 full-width digits), within the int4 / int8 range
+#   decimal(p,s)  ASCII digits with an optional sign, decimal point and
+#                 exponent (no NaN or infinity), and at most p - s integer
+#                 digits once rounded to s places, as the server rounds.
+#                 A plain 'decimal' has no size limit
+#
+# Blanks around a value are allowed, as PostgreSQL allows them.
+# Spec column types (table_specs.py) are 'int', 'bigint', 'decimal',
+# 'decimal(p,s)' and 'text'.
+
+import re
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+BLANKS = ' \t\r\n\v\f'
+INT_RE = re.compile(r'[+-]?[0-9]+')
+DECIMAL_RE = re.compile(r'[+-]?(?:([0-9]+)(?:\.[0-9]*)?|\.[0-9]+)([eE][+-]?[0-9]+)?')
+TYPE_RE = re.compile(r'(int|bigint|decimal|text)(?:\((\d+),(\d+)\))?')
+
+INT_RANGES = {'int': (-2 ** 31, 2 ** 31 - 1), 'bigint': (-2 ** 63, 2 ** 63 - 1)}
+BASE_TYPES = {'int': 'int', 'bigint': 'int', 'decimal': 'decimal', 'text': 'text'}
+
+
+def parse_type(col_type):
+    # (name, precision, scale); precision and scale are None unless given
+    match = TYPE_RE.fullmatch(col_type.replace(' ', ''))
+    if not match or (match.group(2) and match.group(1) != 'decimal'):
+        raise ValueError(f"Unknown column type: {col_type}")
+    name, precision, scale = match.groups()
+    if precision is None:
+        return name, None, None
+    if int(scale) > int(precision):
+        raise ValueError(f"Bad column type {col_type}: scale above precision")
+    return name, int(precision), int(scale)
+
+
+def base_type(col_type):
+    # 'int', 'decimal' or 'text': how a column is converted and formatted
+    return BASE_TYPES[parse_type(col_type)[0]]
+
+
+def int_parser(col_type):
+    # parse(text) -> int, ValueError for anything the column would not take
+    low, high = INT_RANGES[parse_type(col_type)[0]]
+
+    def parse(value):
+        text = value.strip(BLANKS)
+        if not INT_RE.fullmatch(text):
+            raise ValueError(f"Not an integer: {value!r}")
+        number = int(text)
+        if not low <= number <= high:
+            raise ValueError(f"{number} is out of range for {col_type}")
+        return number
+    return parse
+
+
+def strict_decimal(value):
+    # Decimal of a numeric field, ValueError when it is malformed
+    text = value.strip(BLANKS)
+    if not DECIMAL_RE.fullmatch(text):
+        raise ValueError(f"Not a number: {value!r}")
+    return Decimal(text)
+
+
+def decimal_parser(col_type, typed=False):
+    # parse(text) -> the stripped text (PostgreSQL gets the exact value), or a
+    # Decimal when typed; ValueError for anything the column would not take
+    _, precision, scale = parse_type(col_type)
+    if precision is not None:
+        quantum = Decimal(1).scaleb(-scale)
+        digits = precision - scale
+
+    def parse(value):
+        text = value.strip(BLANKS)
+        match = DECIMAL_RE.fullmatch(text)
+        if not match:
+            raise ValueError(f"Not a number: {value!r}")
+        number = None
+        # Rounding adds at most one integer digit, so shorter values need no Decimal
+        if precision is not None and (match.group(2) or len((match.group(1) or '').lstrip('0')) >= digits):
+            number = Decimal(text)
+            try:
+                rounded = number.quantize(quantum, rounding=ROUND_HALF_UP)
+            except InvalidOperation:
+                rounded = None
+            if rounded is None or (rounded and rounded.adjusted() >= digits):
+                raise ValueError(f"{text} does not fit numeric({precision},{scale})")
+        if typed:
+            return Decimal(text) if number is None else number
+        return text
+    return parse
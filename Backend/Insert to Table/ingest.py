@@ -0,0 +1,535 @@
+# Table-driven ingestion engine for the CMS source files.
+#
+#   python ingest.py <release_dir> [--tables basic_drugs_formulary plan_info ...] [--param year=2023]
+#
+# Every table is described in table_specs.py; compile_spec() turns a spec into
+# a generated row converter so all tables share the same hot loop, and rows are
+# streamed into PostgreSQL with COPY (see copy_stream.py; binary COPY for the
+# 'copy_format': 'binary' tables, see binary_copy.py). Stage timings of
+# every load go to the telemetry log (see telemetry.py; INGEST_TELEMETRY_LOG).
+
+import argparse
+import fnmatch
+import os
+import re
+import sys
+import time
+
+from binary_copy import BinaryRows, copy_tuples
+from columnar import compile_csv
+from connect_db import connect_db
+from copy_stream import copy_lines, peak_rss_mb, COPY_ESCAPES, COPY_NULL
+from dimensions import SurrogateKeys
+from field_types import base_type, decimal_parser, int_parser
+from journal import RejectFile, checkpoint, set_status, start_load
+from ndc import CROSSWALK_SOURCE, normalize_ndc, update_crosswalk
+from partitions import ensure_partition
+from releases import complete_release, loaded_tables
+from table_specs import TABLE_SPECS
+from telemetry import Progress, new_stages, summary_table, write_telemetry
+
+READ_BATCH_BYTES = 1 << 20  # raw bytes read from the source per readlines() call
+CHECKPOINT_ROWS = 500000  # rows per committed COPY chunk of a journaled load
+PEEK_BATCH_BYTES = 1 << 16  # raw bytes read at a time when looking for a partition value
+
+def _field_parser(col_type, typed=False):
+    # Strict parser of an int or decimal field (see field_types.py)
+    if base_type(col_type) == 'int':
+        return int_parser(col_type)
+    return decimal_parser(col_type, typed)
+
+
+def _param_value(col_type, value):
+    if base_type(col_type) == 'text':
+        return str(value)
+    return _field_parser(col_type)(str(value))
+
+
+def _field_expr(var, col_type, nullable, parser):
+    # parser: name of the field's _field_parser() in the converter's namespace
+    if base_type(col_type) == 'text':
+        return f"{var}.strip() or None" if nullable else f"{var}.strip()"
+    return f"{parser}({var}) if {var}.strip() else None" if nullable else f"{parser}({var})"
+
+
+def _format_expr(index, col_type, nullable):
+    value = f"r[{index}]"
+    if base_type(col_type) == 'text':
+        text = f"{value}.translate(ESC)"
+        return f"{{NULL if {value} is None else {text}}}" if nullable else f"{{{text}}}"
+    # int params/columns and validated decimal strings need no escaping
+    return f"{{NULL if {value} is None else {value}}}"
+
+
+def row_columns(spec):
+    # Column names of a converted row: params first, then the file columns and
+    # the derived columns
+    return ([name for name, _ in spec.get('params', [])] + [name for name, _, _ in spec['columns']]
+            + [name for name, _, _ in spec.get('derived', [])])
+
+
+def table_columns(spec):
+    # Target column names in COPY order: row_columns() without the lookup_only
+    # columns, then the surrogate keys looked up while loading (see dimensions.py)
+    lookup_only = spec.get('lookup_only', [])
+    return ([name for name in row_columns(spec) if name not in lookup_only]
+            + [key for key, _ in spec.get('surrogate_keys', [])])
+
+
+def _derived_expr(spec, fields, kind, sources):
+    # (expression over the split fields, nullable)
+    names = [name for name, _, _ in spec['columns']]
+    if kind == 'bitmask':
+        bits = [f"(({fields[names.index(name)]}.strip() == 'Y') << {i})" for i, name in enumerate(sources)]
+        return f"({' | '.join(bits)})", False
+    if kind == 'ndc11':
+        return f"_ndc11({fields[names.index(sources[0])]})", True
+    raise ValueError(f"Unknown derived column kind: {kind}")
+
+
+def compile_spec(spec, params=None, typed=False):
+    # Build (convert, format_row) for a spec.
+    # convert(raw_bytes) -> tuple of values, raising ValueError for a bad row;
+    #                       ints are int, decimals validated text, or Decimal when typed
+    # format_row(tuple)  -> one COPY text line
+    params = params or {}
+    namespace = {
+        'ENCODING': spec['encoding'],
+        'ERRORS': spec['errors'],
+        'DELIM': spec['delimiter'],
+        'ESC': COPY_ESCAPES,
+        'NULL': COPY_NULL,
+        '_ndc11': normalize_ndc,
+    }
+
+    values = []
+    types = []
+    for i, (name, col_type) in enumerate(spec.get('params', [])):
+        if name not in params:
+            raise ValueError(f"Missing parameter '{name}' for this table")
+        namespace[f'P{i}'] = _param_value(col_type, params[name])
+        values.append(f'P{i}')
+        types.append((col_type, False))
+
+    fields = [f'f{i}' for i in range(len(spec['columns']))]
+    for i, (var, (_, col_type, nullable)) in enumerate(zip(fields, spec['columns'])):
+        if base_type(col_type) != 'text':
+            namespace[f'T{i}'] = _field_parser(col_type, typed)
+        values.append(_field_expr(var, col_type, nullable, f'T{i}'))
+        types.append((col_type, nullable))
+    for _, kind, sources in spec.get('derived', []):
+        expr, nullable = _derived_expr(spec, fields, kind, sources)
+        values.append(expr)
+        types.append(('int', nullable))
+
+    # Unpacking the split raises ValueError when the field count is wrong
+    row_format = '\t'.join(_format_expr(i, t, n) for i, (t, n) in enumerate(types))
+    source = (
+        "def convert(raw):\n"
+        f"    {', '.join(fields)}, = raw.decode(ENCODING, ERRORS).rstrip('\\r\\n').split(DELIM)\n"
+        f"    return ({', '.join(values)},)\n"
+        "\n"
+        "def format_row(r):\n"
+        f"    return f\"{row_format}\\n\"\n"
+    )
+    exec(compile(source, f"<spec {spec['source']}>", 'exec'), namespace)
+    return namespace['convert'], namespace['format_row']
+
+
+def read_batches(binary, size=READ_BATCH_BYTES, end=None):
+    # Yield lists of raw lines; stop at byte offset end (a line boundary) if given
+    pos = binary.tell() if end is not None else 0
+    while True:
+        batch = binary.readlines(size)
+        if not batch:
+            return
+        if end is not None:
+            for i, raw in enumerate(batch):
+                if pos >= end:
+                    yield batch[:i]
+                    return
+                pos += len(raw)
+        yield batch
+
+
+def split_ranges(path, parts, header=True):
+    # Split a file into up to `parts` newline-aligned (start, end) byte ranges
+    size = os.path.getsize(path)
+    with open(path, 'rb') as binary:
+        if header:
+            binary.readline()
+        bounds = [binary.tell()]
+        first = bounds[0]
+        for i in range(1, parts):
+            target = first + (size - first) * i // parts
+            if target <= bounds[-1]:
+                continue
+            # Back up one byte so a target that is already a line start stays put
+            binary.seek(target - 1)
+            binary.readline()
+            pos = binary.tell()
+            if bounds[-1] < pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def line_converter(convert, format_row):
+    # convert_batch() for line-per-row sources, built on compile_spec()
+    def convert_batch(batch):
+        lines = []
+        rejected = []
+        for raw in batch:
+            try:
+                lines.append(format_row(convert(raw)))
+            except (ValueError, UnicodeDecodeError):
+                if raw.strip():
+                    rejected.append(raw)
+        return lines, rejected
+    return convert_batch
+
+
+def compile_batch(spec, params=None, header_line=None):
+    # convert_batch(list of raw lines) -> (COPY lines, rejected raw lines)
+    if spec.get('format') == 'csv':
+        return compile_csv(spec, params, header_line)
+    return line_converter(*compile_spec(spec, params))
+
+
+def first_value(binary, convert_batch, index):
+    # Field `index` (COPY text, None for NULL) of the first good row from the
+    # current position of binary; the position is restored afterwards
+    pos = binary.tell()
+    try:
+        for batch in read_batches(binary, PEEK_BATCH_BYTES):
+            lines, _ = convert_batch(batch)
+            if lines:
+                value = lines[0].rstrip('\n').split('\t')[index]
+                return None if value == COPY_NULL else value
+        return None
+    finally:
+        binary.seek(pos)
+
+
+def peek_value(table, binary, params=None):
+    # Partition value of a source stream positioned at its start, taken from
+    # the first good row; for tables partitioned on a file column (e.g.
+    # contract_year), whose value is not known from the file name
+    spec = TABLE_SPECS[table]
+    header_line = binary.readline() if spec.get('header', True) else None
+    convert_batch = compile_batch(spec, params, header_line)
+    return first_value(binary, convert_batch, row_columns(spec).index(spec['partition_by']))
+
+
+class ChunkReader:
+    # Hands out the converted rows of a source one checkpoint-sized chunk at a
+    # time. Chunks end on batch boundaries, so `pos` is always the byte offset
+    # just past the last line of the chunk.
+
+    def __init__(self, batches, convert_batch, stats, rejects, pos, progress=None):
+        self.batches = batches
+        self.convert_batch = convert_batch
+        self.stats = stats
+        self.rejects = rejects
+        self.pos = pos
+        self.progress = progress
+        self.exhausted = False
+
+    def chunk(self, max_rows=None):
+        stats = self.stats
+        stages = stats['stages']
+        rows = 0
+        while True:
+            started = time.perf_counter()
+            batch = next(self.batches, None)
+            read = time.perf_counter()
+            stages['read'] += read - started
+            if batch is None:
+                break
+            stats['lines'] += len(batch)
+            size = sum(map(len, batch))
+            self.pos += size
+            stats['bytes'] += size
+            lines, rejected = self.convert_batch(batch)
+            stats['rejected'] += len(rejected)
+            for raw in rejected:
+                self.rejects.write(raw)
+            stages['convert'] += time.perf_counter() - read
+            rows += len(lines)
+            if self.progress is not None:
+                self.progress.tick(stats['rows'] + rows)
+            yield from lines
+            if max_rows is not None and rows >= max_rows:
+                return
+        self.exhausted = True
+
+
+def copy_into(cur, target, spec, lines):
+    columns = table_columns(spec)
+    copy_rows = copy_tuples if spec.get('copy_format') == 'binary' else copy_lines
+    if spec.get('on_conflict') != 'ignore':
+        return copy_rows(cur, target, columns, lines)
+
+    # COPY cannot skip duplicates, so land the rows in a temp table first
+    column_sql = ', '.join(columns)
+    cur.execute(f"CREATE TEMP TABLE tmp_{target} (LIKE {target} INCLUDING DEFAULTS) ON COMMIT DROP")
+    rows = copy_rows(cur, f"tmp_{target}", columns, lines)
+    cur.execute(f"""
+        INSERT INTO {target} ({column_sql})
+        SELECT {column_sql} FROM tmp_{target}
+        ON CONFLICT DO NOTHING
+    """)
+    return rows
+
+
+def load_stream(conn, table, binary, params=None, end=None, header=None, target=None, source=None,
+                header_line=None):
+    # Load one source stream (binary file object) into table.
+    # With end set, only the lines before that byte offset are loaded; target
+    # redirects the rows into another table with the same columns (a staging table).
+    # header_line is the file's header for streams that start past it (byte ranges).
+    # With source set ({'name', 'size', 'mtime', 'rejects'}) the load is journaled:
+    # rows are committed every CHECKPOINT_ROWS together with a checkpoint in
+    # load_journal, bad lines go to source['rejects'], and a rerun resumes from
+    # the last checkpoint. Without it the whole stream is one transaction.
+    spec = TABLE_SPECS[table]
+    target = target or table
+    stats = {'table': table, 'target': target, 'rows': 0, 'rejected': 0, 'lines': 0, 'bytes': 0,
+             'stages': new_stages()}
+    if source is not None:
+        stats['source'] = source['name']
+
+    start = time.perf_counter()
+    if spec.get('header', True) if header is None else header:
+        header_line = binary.readline()
+    convert_batch = compile_batch(spec, params, header_line)
+    if target == table and 'partition_by' in spec:
+        # Straight into the parent: the partition for the value must exist.
+        # A value from a file column is taken from the first row, so a file
+        # is expected to hold a single value (one contract year per release).
+        column = spec['partition_by']
+        if column in (params or {}):
+            value = params[column]
+        else:
+            value = first_value(binary, convert_batch, row_columns(spec).index(column))
+        if value is not None:
+            ensure_partition(conn, table, value)
+    typed_rows = None
+    if spec.get('copy_format') == 'binary':
+        if spec.get('format') == 'csv':
+            raise ValueError(f"copy_format 'binary' needs a line-per-row source, not csv ({table})")
+        # The text converter above is then only used to peek at a partition value
+        convert, _ = compile_spec(spec, params, typed=True)
+        typed_rows = BinaryRows(conn, target, table_columns(spec), convert)
+    pos = binary.tell()
+    if end is not None:
+        stats['range'] = (pos, end)
+
+    entry = None
+    chunk_rows = None
+    rejects = RejectFile(None)
+    if source is not None:
+        entry = start_load(conn, table, target, source, pos, end)
+        if entry['status'] == 'done':
+            print(f"Skipping {source['name']}: already loaded into {target} (load {entry['load_id']})")
+            stats.update(skipped=True, status='skipped', seconds=0.0, rows_per_sec=0)
+            write_telemetry(stats)
+            return stats
+        if entry['byte_offset'] > pos:
+            print(f"Resuming {table} at byte {entry['byte_offset']} "
+                  f"({entry['rows_committed']} rows already committed)")
+            binary.seek(entry['byte_offset'])
+            pos = entry['byte_offset']
+        stats['rows_resumed'] = entry['rows_committed']
+        stats['rejected'] = entry['rows_rejected']
+        rejects = RejectFile(source['rejects'], entry['reject_bytes'])
+        chunk_rows = CHECKPOINT_ROWS
+
+    keys = None
+    if 'surrogate_keys' in spec:
+        keys = SurrogateKeys(table, row_columns(spec))
+    if typed_rows is not None:
+        typed_rows.keys = keys
+        convert_batch = typed_rows.convert_batch
+    elif keys is not None:
+        convert_batch = keys.wrap(convert_batch)
+
+    stages = stats['stages']
+    reader = ChunkReader(read_batches(binary, end=end), convert_batch, stats, rejects, pos, Progress(stats))
+    try:
+        with conn.cursor() as cur:
+            while not reader.exhausted:
+                # COPY pulls the rows through the reader, so its own share is
+                # what is left after the read and convert time spent inside it
+                copy_start = time.perf_counter()
+                client = stages['read'] + stages['convert']
+                stats['rows'] += copy_into(cur, target, spec, reader.chunk(chunk_rows))
+                commit_start = time.perf_counter()
+                stages['copy'] += commit_start - copy_start - (stages['read'] + stages['convert'] - client)
+                rejects.flush()
+                if entry is not None:
+                    checkpoint(cur, entry['load_id'], reader.pos, stats['rows_resumed'] + stats['rows'],
+                               stats['rejected'], rejects.bytes)
+                conn.commit()
+                stages['commit'] += time.perf_counter() - commit_start
+    except Exception as e:
+        conn.rollback()
+        if entry is not None:
+            set_status(conn, entry['load_id'], 'failed', str(e))
+        stats.update(status='failed', error=str(e), seconds=time.perf_counter() - start)
+        write_telemetry(stats)
+        raise
+    finally:
+        rejects.close()
+        if keys is not None:
+            keys.close()
+    if entry is not None:
+        set_status(conn, entry['load_id'], 'done')
+        if stats['rejected']:
+            print(f"Rejected lines written to {source['rejects']}")
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] > 0 else 0
+    write_telemetry(stats)
+    return stats
+
+
+def source_params(table, name, params=None):
+    # Params given explicitly win; the others may come from the file name
+    merged = dict(params or {})
+    for param, (pattern, template) in TABLE_SPECS[table].get('name_params', {}).items():
+        if param not in merged:
+            match = re.search(pattern, os.path.basename(name).lower())
+            if match:
+                merged[param] = template.format(*match.groups())
+    return merged
+
+
+def file_source(path, rejects=None):
+    return {
+        'name': os.path.abspath(path),
+        'size': os.path.getsize(path),
+        'mtime': os.path.getmtime(path),
+        'rejects': rejects or path + '.rejects',
+    }
+
+
+def load_file(conn, table, path, params=None, target=None):
+    params = source_params(table, path, params)
+    with open(path, 'rb') as binary:
+        stats = load_stream(conn, table, binary, params, target=target, source=file_source(path))
+    stats['file'] = path
+    print_stats(stats)
+    return stats
+
+
+def load_range(conn, table, path, start, end, params=None, target=None):
+    # Load the lines in [start, end) of path; used by the parallel loader
+    params = source_params(table, path, params)
+    source = file_source(path, f"{path}.{start}.rejects")
+    with open(path, 'rb') as binary:
+        header_line = binary.readline() if TABLE_SPECS[table].get('header', True) else None
+        binary.seek(start)
+        stats = load_stream(conn, table, binary, params, end=end, header=False, target=target, source=source,
+                            header_line=header_line)
+    stats['file'] = path
+    stats['range'] = (start, end)
+    print_stats(stats)
+    return stats
+
+
+def count_rows(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM {table}")
+        count = cur.fetchone()[0]
+    conn.commit()
+    return count
+
+
+def print_stats(stats):
+    if stats.get('skipped'):
+        return
+    stages = ', '.join(f"{stage} {seconds:.1f}s" for stage, seconds in stats['stages'].items())
+    print(f"Inserted {stats['rows']} rows into {stats['target']} in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/s), rejected {stats['rejected']}. [{stages}]")
+
+
+def find_sources(release_dir, table):
+    # Every source file for table anywhere under release_dir, sorted
+    pattern = TABLE_SPECS[table]['source']
+    matches = []
+    for root, _, files in os.walk(release_dir):
+        for name in files:
+            if fnmatch.fnmatch(name.lower(), pattern):
+                matches.append(os.path.join(root, name))
+    return sorted(matches)
+
+
+def find_source(release_dir, table):
+    # Locate the source file for table anywhere under release_dir; the last one wins
+    matches = find_sources(release_dir, table)
+    return matches[-1] if matches else None
+
+
+def parse_params(items):
+    params = {}
+    for item in items or []:
+        name, sep, value = item.partition('=')
+        if not sep:
+            raise ValueError(f"Parameter must look like name=value: {item}")
+        params[name.strip()] = value.strip()
+    return params
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load CMS release files into PostgreSQL.")
+    parser.add_argument('release_dir', help="Directory containing the extracted release files")
+    parser.add_argument('--tables', nargs='+', choices=sorted(TABLE_SPECS),
+                        help="Tables to load (default: every table with a source file)")
+    parser.add_argument('--param', action='append', metavar='NAME=VALUE',
+                        help="Value for a spec parameter, e.g. year=2023")
+    args = parser.parse_args(argv)
+
+    params = parse_params(args.param)
+    tables = args.tables or list(TABLE_SPECS)
+    failed = False
+    results = []
+    conn = connect_db('bulk_load')
+    try:
+        for table in tables:
+            path = find_source(args.release_dir, table)
+            if path is None:
+                if args.tables:
+                    print(f"❌ No source file for {table} under {args.release_dir}")
+                    failed = True
+                continue
+            print(f"Loading {table} from {path}")
+            try:
+                results.append(load_file(conn, table, path, params))
+                if table == CROSSWALK_SOURCE:
+                    update_crosswalk(conn)
+            except Exception as e:
+                print(f"❌ Failed to load {table}: {e}")
+                failed = True
+        tables = loaded_tables(results)
+        if tables:
+            try:
+                complete_release(conn, os.path.abspath(args.release_dir), tables,
+                                 sum(stats['rows'] for stats in results))
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Could not complete the release: {e}")
+                failed = True
+    finally:
+        conn.close()
+
+    if results:
+        print()
+        print(summary_table(results))
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"Peak RSS: {peak:.1f} MB")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
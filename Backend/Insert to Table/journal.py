@@ -0,0 +1,148 @@
+# Durable load checkpoints.
+#
+# Every file (or byte range / archive member) load has a row in load_journal.
+# ingest.load_stream() commits its COPY in chunks and updates the row in the
+# same transaction, so byte_offset / rows_committed always describe exactly
+# what is in the target table. A rerun of the same source resumes from
+# byte_offset; a source that finished ('done') is not loaded twice.
+
+import os
+
+JOURNAL_DDL = """
+CREATE TABLE IF NOT EXISTS load_journal (
+  load_id SERIAL PRIMARY KEY,
+  table_name VARCHAR(100) NOT NULL,
+  target_table VARCHAR(100) NOT NULL,
+  source TEXT NOT NULL,
+  source_size BIGINT,
+  source_mtime DOUBLE PRECISION,
+  range_start BIGINT NOT NULL,
+  range_end BIGINT,
+  byte_offset BIGINT NOT NULL,
+  rows_committed BIGINT NOT NULL DEFAULT 0,
+  rows_rejected BIGINT NOT NULL DEFAULT 0,
+  reject_bytes BIGINT NOT NULL DEFAULT 0,
+  status VARCHAR(20) NOT NULL,
+  error TEXT,
+  started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+JOURNAL_COLUMNS = ['load_id', 'status', 'byte_offset', 'rows_committed', 'rows_rejected', 'reject_bytes']
+
+journal_ready = False
+
+
+def ensure_journal(conn):
+    global journal_ready
+    if journal_ready:
+        return
+    with conn.cursor() as cur:
+        cur.execute(JOURNAL_DDL)
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_load_journal_source ON load_journal(target_table, source)")
+    conn.commit()
+    journal_ready = True
+
+
+def start_load(conn, table, target, source, range_start, range_end):
+    # Returns the journal entry to continue from: a finished or interrupted load
+    # of the same source into the same target, or a new 'running' entry
+    ensure_journal(conn)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT {', '.join(JOURNAL_COLUMNS)}
+            FROM load_journal
+            WHERE table_name = %s AND target_table = %s AND source = %s
+              AND source_size IS NOT DISTINCT FROM %s AND source_mtime IS NOT DISTINCT FROM %s
+              AND range_start = %s AND range_end IS NOT DISTINCT FROM %s
+              AND status IN ('running', 'failed', 'done')
+            ORDER BY load_id DESC
+            LIMIT 1
+        """, (table, target, source['name'], source.get('size'), source.get('mtime'), range_start, range_end))
+        row = cur.fetchone()
+        if row is None:
+            cur.execute(f"""
+                INSERT INTO load_journal (table_name, target_table, source, source_size, source_mtime,
+                                          range_start, range_end, byte_offset, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'running')
+                RETURNING {', '.join(JOURNAL_COLUMNS)}
+            """, (table, target, source['name'], source.get('size'), source.get('mtime'),
+                  range_start, range_end, range_start))
+            row = cur.fetchone()
+        elif row[1] != 'done':
+            cur.execute("UPDATE load_journal SET status = 'running', error = NULL, updated_at = now() "
+                        "WHERE load_id = %s", (row[0],))
+    conn.commit()
+    return dict(zip(JOURNAL_COLUMNS, row))
+
+
+def checkpoint(cur, load_id, byte_offset, rows_committed, rows_rejected, reject_bytes):
+    # Runs inside the transaction that commits the rows it describes
+    cur.execute("""
+        UPDATE load_journal
+        SET byte_offset = %s, rows_committed = %s, rows_rejected = %s, reject_bytes = %s, updated_at = now()
+        WHERE load_id = %s
+    """, (byte_offset, rows_committed, rows_rejected, reject_bytes, load_id))
+
+
+def set_status(conn, load_id, status, error=None):
+    with conn.cursor() as cur:
+        cur.execute("UPDATE load_journal SET status = %s, error = %s, updated_at = now() WHERE load_id = %s",
+                    (status, error, load_id))
+    conn.commit()
+
+
+def reset_target(conn, target):
+    # The target table was recreated empty, so earlier checkpoints into it are void
+    ensure_journal(conn)
+    with conn.cursor() as cur:
+        cur.execute("UPDATE load_journal SET status = 'superseded', updated_at = now() "
+                    "WHERE target_table = %s AND status <> 'superseded'", (target,))
+    conn.commit()
+
+
+def has_unfinished(conn, target):
+    ensure_journal(conn)
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM load_journal WHERE target_table = %s AND status IN ('running', 'failed') LIMIT 1",
+                    (target,))
+        found = cur.fetchone() is not None
+    conn.commit()
+    return found
+
+
+class RejectFile:
+    # Raw source lines that could not be converted, written next to the source
+    # so they can be fixed and loaded on their own. Opened on first reject and
+    # truncated to the last checkpoint when a load resumes. A path of None
+    # discards the lines.
+
+    def __init__(self, path, resume_bytes=0):
+        self.path = path
+        self.bytes = resume_bytes
+        self._file = None
+        if path is None:
+            return
+        if resume_bytes and os.path.exists(path):
+            with open(path, 'r+b') as f:
+                f.truncate(resume_bytes)
+        elif os.path.exists(path):
+            os.remove(path)  # left over from an earlier, unrelated load
+
+    def write(self, raw):
+        if self.path is None:
+            return
+        if self._file is None:
+            self._file = open(self.path, 'ab' if self.bytes else 'wb')
+        self._file.write(raw if raw.endswith(b'\n') else raw + b'\n')
+        self.bytes = self._file.tell()
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
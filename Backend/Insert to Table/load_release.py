@@ -0,0 +1,262 @@
+# Load every table of a monthly CMS release concurrently.
+#
+#   python load_release.py <release_dir | release.zip> [--max-workers 4] [--tables ...] [--param year=2023]
+#
+# A downloaded release zip can be loaded directly: its members are streamed
+# through the parser into COPY without being extracted (see zip_source.py).
+# Each table is loaded by a separate worker process with its own connection.
+# Tables marked 'parallel' in table_specs.py are split into newline-aligned byte
+# ranges and every range is parsed and copied by its own worker; the row count
+# of those tables is verified once all of their ranges have finished.
+# Jobs are started largest first so the long loads overlap with the short ones.
+#
+# With --staging every table is loaded into an UNLOGGED <table>_staging table,
+# indexed and analyzed, then swapped in atomically (see staging.py); the live
+# table is replaced, not appended to, and readers never see a half-loaded table.
+#
+# Tables with a 'partition_by' column take one file per value (e.g. a directory
+# of yearly MUP_DPR files, the year read from each file name, or monthly
+# formulary files, the contract year read from the first row); every value is
+# loaded into its own table and attached as that value's partition, replacing
+# the previous one (see partitions.py).
+#
+# Once the tables are in place the summaries built from them are refreshed
+# and the load is recorded as a data release (see releases.py), which tells
+# the API to drop its cached responses.
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from connect_db import connect_db
+from ingest import (count_rows, find_sources, load_file, load_range, parse_params, peek_value, source_params,
+                    split_ranges)
+from ndc import CROSSWALK_SOURCE, update_crosswalk
+from partitions import drop_partition_load, finalize_partition, partition_name, partition_value, prepare_partition
+from releases import complete_release
+from summaries import SUMMARY_SOURCE
+from table_specs import TABLE_SPECS
+from telemetry import summary_table
+from staging import create_staging, drop_staging, finalize_staging
+from zip_source import find_members, is_archive, load_member, open_member
+
+DEFAULT_MAX_WORKERS = 4
+
+
+def load_table_worker(table, path, params, start=None, end=None, member=None, target=None, value=None):
+    conn = connect_db('bulk_load')
+    try:
+        if member is not None:
+            stats = load_member(conn, table, path, member, params, target)
+        elif start is None:
+            stats = load_file(conn, table, path, params, target)
+        else:
+            stats = load_range(conn, table, path, start, end, params, target)
+    finally:
+        conn.close()
+    stats['partition'] = value
+    return stats
+
+
+def job_value(table, name, params, open_source):
+    # Partition value of a source for a partitioned table, else None.
+    # open_source() opens the source when the value is a column of the file.
+    spec = TABLE_SPECS[table]
+    column = spec.get('partition_by')
+    if column is None:
+        return None
+    params = source_params(table, name, params)
+    value = params.get(column)
+    if value is None and any(col == column for col, _, _ in spec['columns']):
+        with open_source() as binary:
+            value = peek_value(table, binary, params)
+    if value is None:
+        raise ValueError(f"No {column} for {name}: pass --param {column}=... or use the CMS file name")
+    return partition_value(table, value)
+
+
+def group_name(table, value):
+    # What one set of jobs is loaded into and verified as: a table or one of its partitions
+    return table if value is None else partition_name(table, value)
+
+
+def plan_jobs(release_dir, tables, ranges_per_file, params=None):
+    # Returns [(size, table, value, path, start, end, member)]; value is the
+    # partition value for partitioned tables, start/end are None for whole
+    # files and member is the archive member chain when loading a zip
+    if is_archive(release_dir):
+        # Compressed members cannot be split by byte offset, so one job per table
+        jobs = []
+        for table, (chain, size) in find_members(release_dir, tables).items():
+            value = job_value(table, chain[-1], params, lambda: open_member(release_dir, chain))
+            jobs.append((size, table, value, release_dir, None, None, chain))
+        jobs.sort(key=lambda job: job[0], reverse=True)
+        return jobs
+
+    jobs = []
+    for table in tables:
+        spec = TABLE_SPECS[table]
+        paths = find_sources(release_dir, table)
+        if not paths:
+            print(f"Skipping {table}: no source file under {release_dir}")
+            continue
+        if 'partition_by' in spec:
+            # One file per partition value (e.g. one per data year); the last one wins
+            sources = {}
+            for path in paths:
+                sources[job_value(table, path, params, lambda: open(path, 'rb'))] = path
+            if len(sources) < len(paths) and spec['partition_by'] in (params or {}):
+                raise ValueError(f"{len(paths)} {table} files found; drop --param {spec['partition_by']} "
+                                 f"so each file's value comes from its name")
+        else:
+            sources = {None: paths[-1]}
+        for value, path in sources.items():
+            if spec.get('parallel') and ranges_per_file > 1:
+                for start, end in split_ranges(path, ranges_per_file, spec.get('header', True)):
+                    jobs.append((end - start, table, value, path, start, end, None))
+            else:
+                jobs.append((os.path.getsize(path), table, value, path, None, None, None))
+    jobs.sort(key=lambda job: job[0], reverse=True)
+    return jobs
+
+
+def verify_row_counts(conn, before, results, targets):
+    # Compare the row growth of each split table or partition with the rows its workers reported
+    ok = True
+    for (table, value), count_before in before.items():
+        name = group_name(table, value)
+        expected = sum(stats['rows'] for stats in results
+                       if stats['table'] == table and stats.get('partition') == value)
+        actual = count_rows(conn, targets.get((table, value), table)) - count_before
+        if actual == expected:
+            print(f"✅ {name}: {actual} rows verified")
+        else:
+            print(f"❌ {name}: workers copied {expected} rows but the table grew by {actual}")
+            ok = False
+    return ok
+
+
+def load_release(release_dir, tables=None, params=None, max_workers=DEFAULT_MAX_WORKERS, ranges_per_file=None,
+                 staging=False):
+    # Returns (stats for every loaded job, {table or partition: error message}).
+    # Partitioned tables always load each value off to the side and attach it.
+    jobs = plan_jobs(release_dir, list(tables or TABLE_SPECS), ranges_per_file or max_workers, params)
+
+    groups = {(job[1], job[2]) for job in jobs}
+    split_groups = {(job[1], job[2]) for job in jobs if job[4] is not None}
+    targets = {}
+    conn = connect_db()
+    try:
+        for table, value in groups:
+            if value is not None:
+                targets[(table, value)] = prepare_partition(conn, table, value)
+            elif staging:
+                targets[(table, value)] = create_staging(conn, table)
+        before = {group: count_rows(conn, targets.get(group, group[0])) for group in split_groups}
+    finally:
+        conn.close()
+
+    results = []
+    errors = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for _, table, value, path, start, end, member in jobs:
+            job_params = params if value is None else {**(params or {}), TABLE_SPECS[table]['partition_by']: value}
+            future = executor.submit(load_table_worker, table, path, job_params, start, end, member,
+                                     targets.get((table, value)), value)
+            futures[future] = (table, value)
+        for future in as_completed(futures):
+            name = group_name(*futures[future])
+            try:
+                results.append(future.result())
+            except Exception as e:
+                errors[name] = str(e)
+                print(f"❌ Failed to load {name}: {e}")
+
+    swapped = set()
+    conn = connect_db()
+    try:
+        if before and not verify_row_counts(conn, before, results, targets):
+            errors.setdefault('row_count', "Row count verification failed")
+        for (table, value), target in targets.items():
+            name = group_name(table, value)
+            # A table or partition is only swapped in when every one of its jobs succeeded
+            if name in errors or ('row_count' in errors and (table, value) in split_groups):
+                print(f"❌ Keeping the live {name}; dropping {target}")
+                if value is None:
+                    drop_staging(conn, table)
+                else:
+                    drop_partition_load(conn, table, value)
+                continue
+            try:
+                if value is None:
+                    finalize_staging(conn, table)
+                else:
+                    finalize_partition(conn, table, value)
+            except Exception as e:
+                conn.rollback()
+                errors[name] = str(e)
+                print(f"❌ Failed to swap in {name}: {e}")
+                continue
+            swapped.add(table)
+            if table == CROSSWALK_SOURCE:
+                try:
+                    update_crosswalk(conn, name)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"❌ Could not update the NDC crosswalk from {name}: {e}")
+        # Tables loaded in place changed as their jobs committed, the others when swapped in
+        tables = swapped | {stats['table'] for stats in results
+                            if not stats.get('skipped') and (stats['table'], stats.get('partition')) not in targets}
+        # Only the data years that were loaded need their summaries rebuilt
+        years = {stats.get('partition') for stats in results if stats['table'] == SUMMARY_SOURCE}
+        if tables:
+            try:
+                complete_release(conn, os.path.abspath(release_dir), tables,
+                                 sum(stats['rows'] for stats in results if stats['table'] in tables),
+                                 None if None in years else years)
+            except Exception as e:
+                conn.rollback()
+                errors['release'] = str(e)
+                print(f"❌ Could not complete the release: {e}")
+    finally:
+        conn.close()
+    return results, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load a CMS release with one worker process per table.")
+    parser.add_argument('release_dir', help="Directory with the extracted release files, or the release zip")
+    parser.add_argument('--tables', nargs='+', choices=sorted(TABLE_SPECS),
+                        help="Tables to load (default: every table with a source file)")
+    parser.add_argument('--param', action='append', metavar='NAME=VALUE',
+                        help="Value for a spec parameter, e.g. year=2023")
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_MAX_WORKERS,
+                        help=f"Maximum loads running at once (default {DEFAULT_MAX_WORKERS})")
+    parser.add_argument('--ranges-per-file', type=int, default=None,
+                        help="Byte ranges for large files (default: --max-workers, 1 disables splitting)")
+    parser.add_argument('--staging', action='store_true',
+                        help="Replace each table through an unlogged staging table and an atomic swap")
+    args = parser.parse_args(argv)
+    if args.max_workers < 1:
+        parser.error("--max-workers must be at least 1")
+
+    start = time.perf_counter()
+    results, errors = load_release(args.release_dir, args.tables, parse_params(args.param),
+                                   args.max_workers, args.ranges_per_file, args.staging)
+    elapsed = time.perf_counter() - start
+
+    tables = {stats['table'] for stats in results}
+    total_rows = sum(stats['rows'] for stats in results)
+    if results:
+        print()
+        print(summary_table(results))
+    print(f"\n🎯 Loaded {len(tables)} tables, {total_rows} rows in {elapsed:.1f}s "
+          f"({total_rows / elapsed if elapsed > 0 else 0:,.0f} rows/s overall).")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
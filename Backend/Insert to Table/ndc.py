@@ -0,0 +1,102 @@
+# NDC normalization and the NDC -> RxCUI crosswalk.
+#
+#   python ndc.py refresh   # rebuild ndc_rxcui from basic_drugs_formulary
+#
+# NDCs are stored as the 11-digit 5-4-2 form in a BIGINT (basic_drugs_formulary.ndc11,
+# a 'derived' column filled by the loaders), so every lookup is one integer
+# comparison whatever form the NDC arrived in. ndc_rxcui holds the distinct
+# (ndc11, rxcui) pairs of the formulary; the loaders add the pairs of every
+# basic_drugs_formulary load and the API keeps a copy of it in memory.
+
+import sys
+
+from connect_db import connect_db
+
+CROSSWALK_SOURCE = 'basic_drugs_formulary'
+
+# Segment lengths of the dashed forms, padded to 5-4-2
+DASHED_FORMS = {(4, 4, 2), (5, 3, 2), (5, 4, 1), (5, 4, 2)}
+
+CROSSWALK_DDL = """
+CREATE TABLE IF NOT EXISTS ndc_rxcui (
+  ndc11 BIGINT NOT NULL,
+  rxcui INT NOT NULL,
+  PRIMARY KEY (ndc11, rxcui)
+)
+"""
+
+
+def normalize_ndc(value):
+    # 11-digit NDC as an int, or None. A 10-digit NDC without dashes could be
+    # any of the three 10-digit layouts, so only the dashed form is accepted.
+    value = value.strip()
+    if '-' in value:
+        parts = value.split('-')
+        if len(parts) != 3 or tuple(map(len, parts)) not in DASHED_FORMS \
+                or not all(part.isascii() and part.isdigit() for part in parts):
+            return None
+        return int(parts[0].zfill(5) + parts[1].zfill(4) + parts[2].zfill(2))
+    if len(value) == 11 and value.isascii() and value.isdigit():
+        return int(value)
+    return None
+
+
+def ensure_crosswalk(conn):
+    with conn.cursor() as cur:
+        cur.execute(CROSSWALK_DDL)
+    conn.commit()
+
+
+def update_crosswalk(conn, source=CROSSWALK_SOURCE):
+    # Add the (ndc11, rxcui) pairs of source: the formulary, one of its
+    # partitions or a table with the same columns. Returns the new pairs.
+    ensure_crosswalk(conn)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO ndc_rxcui (ndc11, rxcui)
+            SELECT DISTINCT ndc11, rxcui FROM {source}
+            WHERE ndc11 IS NOT NULL AND rxcui IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """)
+        added = cur.rowcount
+    conn.commit()
+    if added:
+        print(f"✅ Added {added} NDC/RxCUI pairs from {source}")
+    return added
+
+
+def refresh_crosswalk(conn):
+    # Rebuild from the whole formulary, dropping pairs of retired releases
+    ensure_crosswalk(conn)
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM ndc_rxcui")
+        cur.execute(f"""
+            INSERT INTO ndc_rxcui (ndc11, rxcui)
+            SELECT DISTINCT ndc11, rxcui FROM {CROSSWALK_SOURCE}
+            WHERE ndc11 IS NOT NULL AND rxcui IS NOT NULL
+        """)
+        count = cur.rowcount
+    conn.commit()
+    return count
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv != ['refresh']:
+        print("Usage: python ndc.py refresh")
+        return 1
+    conn = connect_db()
+    try:
+        count = refresh_crosswalk(conn)
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Crosswalk refresh failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    print(f"🎯 ndc_rxcui rebuilt with {count} pairs")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,306 @@
+# List partitioning for the tables with a 'partition_by' column in table_specs.py.
+#
+#   python partitions.py list    <table>
+#   python partitions.py migrate <table>          # one-off: plain table -> partitioned
+#   python partitions.py detach  <table> <value>  # keep the rows as a standalone table
+#   python partitions.py attach  <table> <value>  # re-attach a detached partition
+#   python partitions.py drop    <table> <value>
+#
+# Each value (e.g. one data year or contract year) lives in its own partition
+# <table>_<value>, so queries that filter on the column only scan that
+# partition, and retiring a value is a DROP of its partition rather than a
+# DELETE. A file for one value is loaded off to the side and attached in one
+# short transaction:
+#
+# 1. prepare_partition(): UNLOGGED <table>_<value>_load, LIKE the parent
+# 2. the loaders COPY into it (target=...)
+# 3. finalize_partition(): CHECK constraint for the value (validated here,
+#    so ATTACH needs no scan under lock), SET LOGGED (or the rewrite in
+#    'cluster_by' order, see staging.py), the table's indexes from
+#    create_index.py built in parallel, ANALYZE, then DETACH + DROP the
+#    previous partition for the value and ATTACH the new one
+#
+# The indexes on the parent are partitioned indexes; ATTACH adopts the ones
+# already built on the new partition instead of building them again.
+
+import re
+import sys
+
+from connect_db import connect_db
+from field_types import base_type
+from journal import has_unfinished, reset_target
+from releases import complete_release
+from staging import (INDEX_BUILD_WORKERS, SWAP_LOCK_TIMEOUT, build_indexes, log_table, record_clustering,
+                     table_indexes)
+from table_specs import TABLE_SPECS
+
+LOAD_SUFFIX = '_load'
+
+ensured = set()  # (table, value) partitions known to exist in this process
+
+
+def column_type(table, column):
+    spec = TABLE_SPECS[table]
+    for name, col_type in spec.get('params', []):
+        if name == column:
+            return col_type
+    for name, col_type, _ in spec['columns']:
+        if name == column:
+            return col_type
+    raise ValueError(f"{table} has no column {column}")
+
+
+def partition_value(table, value):
+    # Partition values arrive as text from --param or file names
+    return int(value) if base_type(column_type(table, TABLE_SPECS[table]['partition_by'])) == 'int' else str(value)
+
+
+def partition_name(table, value):
+    return f"{table}_{re.sub(r'[^0-9a-z]+', '_', str(value).lower())}"
+
+
+def load_table_name(table, value):
+    return partition_name(table, value) + LOAD_SUFFIX
+
+
+def relation_exists(cur, name):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    return cur.fetchone()[0]
+
+
+def is_partitioned(conn, table):
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+                    (table,))
+        partitioned = cur.fetchone()[0]
+    conn.commit()
+    return partitioned
+
+
+def attached_to(cur, name):
+    # Parent table name of partition `name`, or None
+    cur.execute("""
+        SELECT inhparent::regclass::text FROM pg_inherits
+        WHERE inhrelid = to_regclass(%s)
+    """, (name,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def require_partitioned(conn, table):
+    if not is_partitioned(conn, table):
+        raise ValueError(f"{table} is not partitioned yet; run: python partitions.py migrate {table}")
+
+
+def ensure_partition(conn, table, value):
+    # For loads straight into the parent: make sure the value has a partition
+    # so COPY can route its rows. No-op while the table is not partitioned.
+    value = partition_value(table, value)
+    if (table, value) in ensured:
+        return
+    if is_partitioned(conn, table):
+        with conn.cursor() as cur:
+            part = partition_name(table, value)
+            if not relation_exists(cur, part):
+                cur.execute(f"CREATE TABLE {part} PARTITION OF {table} FOR VALUES IN (%s)", (value,))
+                print(f"✅ Created partition {part}")
+        conn.commit()
+    ensured.add((table, value))
+
+
+def prepare_partition(conn, table, value):
+    # Returns the load table for value. An interrupted load keeps its table so
+    # the journaled jobs resume into it; otherwise start from an empty one.
+    require_partitioned(conn, table)
+    load = load_table_name(table, value)
+    with conn.cursor() as cur:
+        exists = relation_exists(cur, load)
+    conn.commit()
+    if exists and has_unfinished(conn, load):
+        print(f"Resuming the interrupted load of {load}")
+        return load
+
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {load}")
+        cur.execute(f"CREATE UNLOGGED TABLE {load} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    conn.commit()
+    reset_target(conn, load)
+    return load
+
+
+def drop_partition_load(conn, table, value):
+    load = load_table_name(table, value)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {load}")
+    conn.commit()
+    reset_target(conn, load)
+
+
+def add_bound_check(cur, table, name, value):
+    # A validated CHECK matching the partition bound lets ATTACH skip its own scan
+    column = TABLE_SPECS[table]['partition_by']
+    cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS {name}_bound")
+    cur.execute(f"ALTER TABLE {name} ADD CONSTRAINT {name}_bound CHECK ({column} IS NOT NULL AND {column} = %s)",
+                (value,))
+
+
+def attach(cur, table, name, value):
+    cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES IN (%s)", (value,))
+    cur.execute(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS {name}_bound")
+
+
+def finalize_partition(conn, table, value, index_workers=INDEX_BUILD_WORKERS):
+    value = partition_value(table, value)
+    part = partition_name(table, value)
+    load = load_table_name(table, value)
+    with conn.cursor() as cur:
+        add_bound_check(cur, table, load, value)
+    conn.commit()
+    clustering = log_table(conn, table, load)
+    suffix = part[len(table):] + LOAD_SUFFIX
+    build_indexes(table, index_workers, target=load, suffix=suffix)
+    with conn.cursor() as cur:
+        cur.execute(f"ANALYZE {load}")
+    conn.commit()
+    record_clustering(conn, clustering)
+
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        if relation_exists(cur, part):
+            if attached_to(cur, part) != table:
+                raise ValueError(f"{part} exists but is not a partition of {table}; drop or rename it first")
+            cur.execute(f"ALTER TABLE {table} DETACH PARTITION {part}")
+            cur.execute(f"DROP TABLE {part}")
+        cur.execute(f"ALTER TABLE {load} RENAME TO {part}")
+        attach(cur, table, part, value)
+        # The check keeps the name it was added under
+        cur.execute(f"ALTER TABLE {part} DROP CONSTRAINT IF EXISTS {load}_bound")
+        for name, _ in table_indexes(table):
+            cur.execute(f"ALTER INDEX IF EXISTS {name}{suffix} RENAME TO {name}{suffix[:-len(LOAD_SUFFIX)]}")
+    conn.commit()
+    reset_target(conn, load)
+    ensured.add((table, value))
+    print(f"🎯 Attached {part}")
+
+
+def list_partitions(conn, table):
+    # [(partition, bound, estimated rows)]
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+        """, (table,))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def detach_partition(conn, table, value):
+    part = partition_name(table, partition_value(table, value))
+    with conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {part}")
+    conn.commit()
+    ensured.discard((table, partition_value(table, value)))
+    print(f"✅ Detached {part}; it is now a standalone table")
+
+
+def attach_partition(conn, table, value):
+    value = partition_value(table, value)
+    part = partition_name(table, value)
+    with conn.cursor() as cur:
+        add_bound_check(cur, table, part, value)
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        attach(cur, table, part, value)
+    conn.commit()
+    print(f"✅ Attached {part}")
+
+
+def drop_partition(conn, table, value):
+    value = partition_value(table, value)
+    part = partition_name(table, value)
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        cur.execute(f"DROP TABLE {part}")
+    conn.commit()
+    ensured.discard((table, value))
+    print(f"✅ Dropped {part}")
+
+
+def migrate(conn, table):
+    # Rebuild a plain table as a partitioned one, one partition per value.
+    # Runs in one transaction and rewrites every row once.
+    column = TABLE_SPECS[table].get('partition_by')
+    if not column:
+        raise ValueError(f"{table} has no partition_by in table_specs.py")
+    if is_partitioned(conn, table):
+        print(f"{table} is already partitioned")
+        return
+    old = table + '_unpartitioned'
+    with conn.cursor() as cur:
+        cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+        # Index names are global; the new ones are created on the parent below
+        for name, _ in table_indexes(table):
+            cur.execute(f"DROP INDEX IF EXISTS {name}")
+        cur.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+                    f"PARTITION BY LIST ({column})")
+        cur.execute(f"SELECT DISTINCT {column} FROM {old}")
+        for (value,) in cur.fetchall():
+            part = partition_name(table, value) if value is not None else table + '_null'
+            cur.execute(f"CREATE TABLE {part} PARTITION OF {table} FOR VALUES IN (%s)", (value,))
+        order = TABLE_SPECS[table].get('cluster_by')
+        cur.execute(f"INSERT INTO {table} SELECT * FROM {old}" + (f" ORDER BY {', '.join(order)}" if order else ''))
+        print(f"Moved {cur.rowcount} rows into partitions of {table}")
+        for name, definition in table_indexes(table):
+            cur.execute(f"CREATE INDEX {name} ON {table} {definition}")
+        cur.execute(f"DROP TABLE {old}")
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute(f"ANALYZE {table}")
+    conn.commit()
+    print(f"🎯 {table} is now partitioned by {column}")
+
+
+COMMANDS = {
+    'detach': detach_partition,
+    'attach': attach_partition,
+    'drop': drop_partition,
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    partitioned = sorted(table for table, spec in TABLE_SPECS.items() if 'partition_by' in spec)
+    if len(argv) < 2 or argv[0] not in ('list', 'migrate', *COMMANDS) or argv[1] not in partitioned \
+            or (argv[0] in COMMANDS) != (len(argv) == 3):
+        print(f"Usage: python partitions.py list|migrate <table>\n"
+              f"       python partitions.py {'|'.join(COMMANDS)} <table> <value>\n"
+              f"Partitioned tables: {', '.join(partitioned)}")
+        return 1
+
+    command, table = argv[0], argv[1]
+    conn = connect_db()
+    try:
+        if command == 'list':
+            for name, bound, rows in list_partitions(conn, table):
+                print(f"{name:45} {bound:30} ~{max(rows, 0):,} rows")
+        elif command == 'migrate':
+            migrate(conn, table)
+        else:
+            COMMANDS[command](conn, table, argv[2])
+            # The rows of the value came or went: refresh what is built from them
+            complete_release(conn, f"partitions.py {command} {argv[2]}", [table], years=[argv[2]])
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ {command} failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
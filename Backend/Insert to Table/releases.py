@@ -0,0 +1,103 @@
+# Data releases: one row in data_release per completed load.
+#
+#   python releases.py list
+#   python releases.py record <source> <table> [<table> ...]   # after a load by other means
+#
+# load_release.py, ingest.py, delta_refresh.py and partitions.py finish with
+# complete_release() once their tables are in place: it refreshes the summary
+# tables built from the loaded tables (see summaries.py), then records the
+# release. Recording sends NOTIFY data_release with the new
+# release_id when it commits; the API uses the latest release_id as the
+# version stamp of its response cache and empties the cache when notified
+# (see Features/response_cache.py).
+
+import sys
+
+from connect_db import connect_db
+from summaries import SUMMARY_SOURCE, refresh_summaries
+from table_specs import TABLE_SPECS
+
+RELEASE_CHANNEL = 'data_release'
+
+RELEASE_DDL = """
+CREATE TABLE IF NOT EXISTS data_release (
+  release_id SERIAL PRIMARY KEY,
+  source TEXT NOT NULL,
+  tables TEXT[] NOT NULL,
+  row_count BIGINT,
+  recorded_at TIMESTAMPTZ NOT NULL DEFAULT now()
+)
+"""
+
+
+def ensure_releases(conn):
+    with conn.cursor() as cur:
+        cur.execute(RELEASE_DDL)
+    conn.commit()
+
+
+def record_release(conn, source, tables, rows=None):
+    # Returns the new release_id; listeners are notified on commit
+    ensure_releases(conn)
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO data_release (source, tables, row_count) VALUES (%s, %s, %s) RETURNING release_id",
+                    (source, sorted(tables), rows))
+        release_id = cur.fetchone()[0]
+        cur.execute("SELECT pg_notify(%s, %s)", (RELEASE_CHANNEL, str(release_id)))
+    conn.commit()
+    print(f"✅ Recorded release {release_id}: {', '.join(sorted(tables))}")
+    return release_id
+
+
+def complete_release(conn, source, tables, rows=None, years=None):
+    # Last step of a load. years: the data years of SUMMARY_SOURCE that changed
+    # (None: all of them); returns the new release_id
+    if SUMMARY_SOURCE in tables:
+        refresh_summaries(conn, years)
+    return record_release(conn, source, tables, rows)
+
+
+def loaded_tables(results):
+    # Tables that received rows in a list of load stats (skipped loads did not)
+    return sorted({stats['table'] for stats in results if not stats.get('skipped')})
+
+
+def list_releases(conn, limit=20):
+    ensure_releases(conn)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT release_id, recorded_at, source, tables, row_count FROM data_release
+            ORDER BY release_id DESC LIMIT %s
+        """, (limit,))
+        rows = cur.fetchall()
+    conn.commit()
+    return rows
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in ('list', 'record') or (argv[0] == 'record') != (len(argv) >= 3) \
+            or any(table not in TABLE_SPECS for table in argv[2:]):
+        print("Usage: python releases.py list\n"
+              "       python releases.py record <source> <table> [<table> ...]")
+        return 1
+
+    conn = connect_db()
+    try:
+        if argv[0] == 'list':
+            for release_id, recorded_at, source, tables, rows in list_releases(conn):
+                print(f"{release_id:6} {recorded_at:%Y-%m-%d %H:%M} {', '.join(tables):60} "
+                      f"{'' if rows is None else f'{rows:,} rows'}  {source}")
+        else:
+            complete_release(conn, argv[1], argv[2:])
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ {argv[0]} failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+# Staging-table loads with deferred index builds and an atomic swap.
+#
+# 1. create_staging()  : UNLOGGED copy of the live table without indexes; an
+#    'on_conflict' table gets only the primary key its ON CONFLICT needs
+#    ('conflict_key' in table_specs.py)
+# 2. the loaders COPY into <table>_staging (target=staging_name(table))
+# 3. finalize_staging(): SET LOGGED, build the table's indexes from
+#    create_index.py in parallel with a large maintenance_work_mem, ANALYZE,
+#    then swap the staging table in by rename inside one transaction
+#
+# Readers keep seeing the previous data until the swap commits, and no index is
+# maintained row by row during the load.
+#
+# Tables with 'cluster_by' in table_specs.py are rewritten in that order
+# instead of SET LOGGED (which rewrites the table anyway), so the rows of one
+# hot key (e.g. one rxcui) sit on neighbouring heap pages and an index scan
+# for it reads a few contiguous pages. The pg_stats correlation of the first
+# key column before and after goes to the telemetry log.
+
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from connect_db import pooled
+from journal import has_unfinished, reset_target
+from table_specs import TABLE_SPECS
+from telemetry import write_event
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+from create_index import index_statements  # noqa: E402
+
+STAGING_SUFFIX = '_staging'
+INDEX_BUILD_WORKERS = 4
+MAINTENANCE_WORK_MEM = '1GB'
+MAX_PARALLEL_MAINTENANCE_WORKERS = 2
+SWAP_LOCK_TIMEOUT = '30s'
+SORT_WORK_MEM = '1GB'  # work_mem of the clustered rewrite's sort
+
+INDEX_RE = re.compile(r"CREATE INDEX IF NOT EXISTS\s+(\w+)\s+ON\s+(\w+)\s*(.*)$", re.S)
+
+
+def staging_name(table):
+    return table + STAGING_SUFFIX
+
+
+def table_indexes(table):
+    # [(index name, definition after the table name)] from create_index.py
+    indexes = []
+    for stmt in index_statements:
+        match = INDEX_RE.match(stmt.strip())
+        if match and match.group(2) == table:
+            indexes.append((match.group(1), match.group(3)))
+    return indexes
+
+
+def staging_exists(conn, table):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s) IS NOT NULL", (staging_name(table),))
+        exists = cur.fetchone()[0]
+    conn.commit()
+    return exists
+
+
+def create_staging(conn, table):
+    # An interrupted load keeps its staging table so the journaled jobs resume
+    # into it; otherwise start from an empty one.
+    staging = staging_name(table)
+    if staging_exists(conn, table) and has_unfinished(conn, staging):
+        print(f"Resuming the interrupted load of {staging}")
+        return staging
+
+    key = TABLE_SPECS[table].get('conflict_key')
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {staging}")
+        cur.execute(f"CREATE UNLOGGED TABLE {staging} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        # Tables loaded with ON CONFLICT DO NOTHING need their primary key
+        # during the load; swap_in() gives it the live table's name
+        if key:
+            cur.execute(f"ALTER TABLE {staging} ADD CONSTRAINT {staging}_pkey PRIMARY KEY ({', '.join(key)})")
+    conn.commit()
+    reset_target(conn, staging)
+    return staging
+
+
+def drop_staging(conn, table):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {staging_name(table)}")
+    conn.commit()
+    reset_target(conn, staging_name(table))
+
+
+def key_correlation(conn, target, column):
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT correlation FROM pg_stats
+            WHERE schemaname = current_schema() AND tablename = %s AND attname = %s
+        """, (target, column))
+        row = cur.fetchone()
+    conn.commit()
+    return row[0] if row else None
+
+
+def log_table(conn, table, target):
+    # Make target, an UNLOGGED load table without indexes, LOGGED. With
+    # 'cluster_by' the rows are copied into a new LOGGED table in that order.
+    # Returns the clustering info for record_clustering(), or None.
+    columns = TABLE_SPECS[table].get('cluster_by')
+    if not columns:
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {target} SET LOGGED")
+        conn.commit()
+        return None
+
+    start = time.perf_counter()
+    with conn.cursor() as cur:
+        cur.execute(f"ANALYZE {target} ({columns[0]})")
+    conn.commit()
+    info = {'table': table, 'target': target, 'cluster_by': columns,
+            'correlation_before': key_correlation(conn, target, columns[0])}
+    unsorted = target + '_unsorted'
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL work_mem = '{SORT_WORK_MEM}'")
+        cur.execute(f"DROP TABLE IF EXISTS {unsorted}")
+        cur.execute(f"ALTER TABLE {target} RENAME TO {unsorted}")
+        cur.execute(f"CREATE TABLE {target} (LIKE {unsorted} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cur.execute(f"INSERT INTO {target} SELECT * FROM {unsorted} ORDER BY {', '.join(columns)}")
+        cur.execute(f"DROP TABLE {unsorted}")
+    conn.commit()
+    info['sort_seconds'] = round(time.perf_counter() - start, 1)
+    return info
+
+
+def record_clustering(conn, info):
+    # After ANALYZE: the correlation the planner now sees for the first key column
+    if info is None:
+        return
+    info['correlation'] = key_correlation(conn, info['target'], info['cluster_by'][0])
+    write_event('cluster', info)
+    before, after = info['correlation_before'], info['correlation']
+    print(f"✅ Clustered {info['target']} by {', '.join(info['cluster_by'])} in {info['sort_seconds']}s "
+          f"(correlation {before if before is None else round(before, 3)} -> "
+          f"{after if after is None else round(after, 3)})")
+
+
+def build_index(target, name, definition):
+    start = time.perf_counter()
+    # The pool resets the SETs when the connection is handed back
+    with pooled('bulk_load', autocommit=True) as conn, conn.cursor() as cur:
+        cur.execute(f"SET maintenance_work_mem = '{MAINTENANCE_WORK_MEM}'")
+        cur.execute(f"SET max_parallel_maintenance_workers = {MAX_PARALLEL_MAINTENANCE_WORKERS}")
+        cur.execute(f"CREATE INDEX {name} ON {target} {definition}")
+    print(f"✅ Built {name} in {time.perf_counter() - start:.1f}s")
+
+
+def build_indexes(table, workers=INDEX_BUILD_WORKERS, target=None, suffix=STAGING_SUFFIX):
+    # Build table's indexes on target (default: its staging table), each named
+    # <index><suffix>. Plain CREATE INDEX only takes a SHARE lock, so the
+    # builds run side by side.
+    target = target or staging_name(table)
+    indexes = table_indexes(table)
+    if not indexes:
+        return
+    with ThreadPoolExecutor(max_workers=min(workers, len(indexes))) as executor:
+        futures = [executor.submit(build_index, target, name + suffix, definition) for name, definition in indexes]
+        for future in futures:
+            future.result()
+
+
+def swap_in(conn, table):
+    staging = staging_name(table)
+    old = table + '_old'
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'")
+        cur.execute(f"ALTER TABLE {table} RENAME TO {old}")
+        cur.execute(f"ALTER TABLE {staging} RENAME TO {table}")
+        cur.execute(f"DROP TABLE {old}")
+        # Give the new indexes the live names now that the old ones are gone
+        # (renaming the primary key's index renames the constraint as well)
+        cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s",
+                    (table,))
+        for (index,) in cur.fetchall():
+            if index.endswith(STAGING_SUFFIX):
+                cur.execute(f"ALTER INDEX {index} RENAME TO {index[:-len(STAGING_SUFFIX)]}")
+            elif index == f"{staging}_pkey":
+                cur.execute(f"ALTER INDEX {index} RENAME TO {table}_pkey")
+    conn.commit()
+
+
+def finalize_staging(conn, table, index_workers=INDEX_BUILD_WORKERS):
+    start = time.perf_counter()
+    staging = staging_name(table)
+    # Log the table once, in bulk, before the indexes are built so the swapped-in
+    # table is crash safe like the one it replaces
+    clustering = log_table(conn, table, staging)
+    build_indexes(table, index_workers)
+    with conn.cursor() as cur:
+        cur.execute(f"ANALYZE {staging}")
+    conn.commit()
+    record_clustering(conn, clustering)
+    swap_in(conn, table)
+    print(f"🎯 Swapped in {table} ({time.perf_counter() - start:.1f}s to log, index and analyze)")
@@ -0,0 +1,192 @@
+# Summary tables of prescribers_by_geography_drug for the API.
+#
+#   python summaries.py refresh [<year> ...]   # all years by default
+#
+# The national totals, trends, region and drug name endpoints of Features/main.py
+# read these instead of aggregating, sorting or scanning the prescriber rows per
+# request:
+#
+#   summary_national_totals  one row per year: the sums of /api/national_totals
+#   summary_drug_rank        every prescriber row of a year, narrowed to the
+#                            /api/trends columns, with its rank by tot_clms;
+#                            a page is a range of (year, clm_rank)
+#   summary_geo_top          the GEO_TOP_N rows by tot_clms of every
+#                            (geo level, region, year), for /api/region_detail;
+#                            brnd_name and gnrc_name go into its page cursors
+#   summary_drug_names       the distinct brand and generic names of a year with
+#                            their national tot_clms, trigram-indexed (pg_trgm):
+#                            /api/pbg/search and /api/geo_detail turn a name
+#                            substring into exact names here, and
+#                            /api/drugs/suggest ranks its matches
+#
+# They are refreshed per year as the last step of a load (see
+# releases.complete_release): the rows of the loaded years are replaced in one
+# transaction, so readers see either the old or the new summaries.
+# Data loaded before the summaries existed, or summaries built before
+# RANK_ORDER last changed: python summaries.py refresh
+
+import sys
+
+from connect_db import connect_db
+
+SUMMARY_SOURCE = 'prescribers_by_geography_drug'
+GEO_TOP_N = 100  # rows kept per (geo level, region, year)
+
+# Ties on tot_clms are broken the same way everywhere so ranks are stable.
+# Within a region and year this is the order of the /api/region_detail cursors
+# (REGION_KEYS in Features/main.py): one direction and no NULLs, so a cursor
+# seeks with a single row comparison
+RANK_ORDER = ("COALESCE(tot_clms, -1) DESC, prscrbr_geo_lvl DESC, COALESCE(prscrbr_geo_cd, '') DESC, "
+              "COALESCE(brnd_name, '') DESC, COALESCE(gnrc_name, '') DESC")
+
+SUMMARY_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS summary_national_totals (
+      year INT PRIMARY KEY,
+      total_prescribers BIGINT,
+      total_claims BIGINT,
+      total_30day_fills DECIMAL(20,2),
+      total_drug_cost DECIMAL(24,2),
+      total_beneficiaries BIGINT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS summary_drug_rank (
+      year INT NOT NULL,
+      clm_rank INT NOT NULL,
+      brnd_name VARCHAR(150),
+      gnrc_name VARCHAR(150),
+      tot_prscrbrs INT,
+      tot_clms INT,
+      tot_30day_fills DECIMAL(15,2),
+      tot_drug_cst DECIMAL(20,2),
+      tot_benes INT,
+      PRIMARY KEY (year, clm_rank)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS summary_geo_top (
+      prscrbr_geo_lvl VARCHAR(50) NOT NULL,
+      prscrbr_geo_desc VARCHAR(100) NOT NULL,
+      year INT NOT NULL,
+      clm_rank INT NOT NULL,
+      prscrbr_geo_cd VARCHAR(20),
+      drug_name VARCHAR(150),
+      tot_prscrbrs INT,
+      tot_clms INT,
+      tot_30day_fills DECIMAL(15,2),
+      tot_drug_cst DECIMAL(20,2),
+      tot_benes INT,
+      brnd_name VARCHAR(150),
+      gnrc_name VARCHAR(150),
+      PRIMARY KEY (prscrbr_geo_lvl, prscrbr_geo_desc, year, clm_rank)
+    )
+    """,
+    # Tables created before the names were kept (the next refresh fills them)
+    """
+    ALTER TABLE summary_geo_top
+      ADD COLUMN IF NOT EXISTS brnd_name VARCHAR(150),
+      ADD COLUMN IF NOT EXISTS gnrc_name VARCHAR(150)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS summary_drug_names (
+      year INT NOT NULL,
+      drug_name VARCHAR(150) NOT NULL,
+      tot_clms BIGINT,
+      PRIMARY KEY (year, drug_name)
+    )
+    """,
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    # Serves ILIKE '%...%' as well as the similarity operator %
+    "CREATE INDEX IF NOT EXISTS idx_summary_drug_names_trgm ON summary_drug_names USING gin (drug_name gin_trgm_ops)",
+]
+
+# INSERT ... SELECT of every summary; {where} limits the source rows to the refreshed years
+SUMMARY_QUERIES = {
+    'summary_national_totals': """
+        INSERT INTO summary_national_totals
+        SELECT year, SUM(tot_prscrbrs), SUM(tot_clms), SUM(tot_30day_fills), SUM(tot_drug_cst), SUM(tot_benes)
+        FROM prescribers_by_geography_drug
+        WHERE year IS NOT NULL {where}
+        GROUP BY year
+    """,
+    'summary_drug_rank': f"""
+        INSERT INTO summary_drug_rank
+        SELECT year, row_number() OVER (PARTITION BY year ORDER BY {RANK_ORDER}),
+               brnd_name, gnrc_name, tot_prscrbrs, tot_clms, tot_30day_fills, tot_drug_cst, tot_benes
+        FROM prescribers_by_geography_drug
+        WHERE year IS NOT NULL {{where}}
+    """,
+    'summary_geo_top': f"""
+        INSERT INTO summary_geo_top (prscrbr_geo_lvl, prscrbr_geo_desc, year, clm_rank, prscrbr_geo_cd, drug_name,
+                                     tot_prscrbrs, tot_clms, tot_30day_fills, tot_drug_cst, tot_benes,
+                                     brnd_name, gnrc_name)
+        SELECT * FROM (
+          SELECT prscrbr_geo_lvl, prscrbr_geo_desc, year,
+                 row_number() OVER (PARTITION BY prscrbr_geo_lvl, prscrbr_geo_desc, year
+                                    ORDER BY {RANK_ORDER}) AS clm_rank,
+                 prscrbr_geo_cd, COALESCE(brnd_name, gnrc_name),
+                 tot_prscrbrs, tot_clms, tot_30day_fills, tot_drug_cst, tot_benes,
+                 brnd_name, gnrc_name
+          FROM prescribers_by_geography_drug
+          WHERE year IS NOT NULL AND prscrbr_geo_lvl IS NOT NULL AND prscrbr_geo_desc IS NOT NULL {{where}}
+        ) ranked
+        WHERE clm_rank <= {GEO_TOP_N}
+    """,
+    # A generic sold under its own name is one entry
+    'summary_drug_names': """
+        INSERT INTO summary_drug_names
+        SELECT year, names.drug_name, SUM(tot_clms) FILTER (WHERE prscrbr_geo_lvl = 'National')
+        FROM prescribers_by_geography_drug
+        CROSS JOIN LATERAL (VALUES (brnd_name), (NULLIF(gnrc_name, brnd_name))) AS names (drug_name)
+        WHERE year IS NOT NULL AND names.drug_name IS NOT NULL {where}
+        GROUP BY year, names.drug_name
+    """,
+}
+
+
+def ensure_summaries(conn):
+    with conn.cursor() as cur:
+        for ddl in SUMMARY_DDL:
+            cur.execute(ddl)
+    conn.commit()
+
+
+def refresh_summaries(conn, years=None):
+    # Rebuild the summary rows of years (every year when None) in one transaction
+    ensure_summaries(conn)
+    years = None if years is None else sorted({int(year) for year in years})
+    where = '' if years is None else 'AND year = ANY(%s)'
+    params = () if years is None else (years,)
+    with conn.cursor() as cur:
+        for table, query in SUMMARY_QUERIES.items():
+            cur.execute(f"DELETE FROM {table}" + ('' if years is None else ' WHERE year = ANY(%s)'), params)
+            cur.execute(query.format(where=where), params)
+            print(f"✅ {table}: {cur.rowcount} rows")
+    conn.commit()
+    with conn.cursor() as cur:
+        for table in SUMMARY_QUERIES:
+            cur.execute(f"ANALYZE {table}")
+    conn.commit()
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != 'refresh' or not all(year.isdigit() for year in argv[1:]):
+        print("Usage: python summaries.py refresh [<year> ...]")
+        return 1
+    conn = connect_db()
+    try:
+        refresh_summaries(conn, argv[1:] or None)
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Summary refresh failed: {e}")
+        return 1
+    finally:
+        conn.close()
+    print("🎯 Summaries refreshed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
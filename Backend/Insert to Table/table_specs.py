@@ -0,0 +1,256 @@
+# Per-table ingestion specs used by ingest.py.
+#
+# source     : file name pattern (matched case-insensitively) inside a release directory
+# format     : 'csv' for quoted CSV, parsed by columnar.py (quotes, embedded
+#              delimiters and line breaks, columns matched by header name);
+#              otherwise every line is one row split on the delimiter
+# delimiter  : field separator of the source file
+# encoding / errors : passed to bytes.decode for every line
+# header     : the first line of the file is a header and is skipped
+# params     : (name, type) columns that are not in the file; their values are
+#              supplied per load (e.g. --param year=2023) and prepended to each row;
+#              a csv source whose header has a column of that name supplies it itself
+# columns    : (name, type, nullable) in source-file order; the field count check
+#              uses len(columns)
+# on_conflict: 'ignore' loads through a temp table and INSERT ... ON CONFLICT DO NOTHING
+# conflict_key: primary key columns of an 'on_conflict' table (as in its
+#              CREATE TABLE); staged loads add only this key before the COPY
+# parallel   : large file; load_release.py splits it into byte ranges that are
+#              parsed and copied by several workers at once
+# natural_key: columns that identify a row across releases (delta_refresh.py)
+# cluster_by : hot lookup key; staged and partition loads store the rows in
+#              this order (see staging.py). Not for 'on_conflict' tables
+# partition_by: list-partition column; each value is stored, loaded and
+#              replaced as its own partition (see partitions.py). A param takes
+#              its value per file; a file column is read from the first row,
+#              so each source file must hold a single value
+# derived    : [(column, kind, [file columns])] int columns computed from the row:
+#              'bitmask' sets bit i when the i-th listed column is 'Y';
+#              'ndc11' is the NDC in the one listed column as an 11-digit
+#              integer, NULL when it is malformed (see ndc.py)
+# surrogate_keys: [(key column, dimension)] integer keys for the identifier
+#              columns of a dimension in dimensions.py, appended to every row
+#              by the loaders
+# lookup_only: identifier columns of surrogate_keys that are read from the
+#              file only to look up the keys and are not stored; the strings
+#              stay in the dimension table (join on the key to get them)
+# copy_format: 'binary' converts the fields to native values on the client and
+#              sends them with binary COPY, rejecting values the target columns
+#              cannot hold (see binary_copy.py); for numeric-heavy tables.
+#              Line-per-row sources only
+# name_params: {param: (regex, template)} fills a param that was not given
+#              from the lowercase file name, e.g. the data year of MUP_DPR_*_DY23_*
+#
+# Column types are 'int', 'bigint', 'decimal(p,s)' and 'text', sized as in the
+# CREATE TABLE: a value the column cannot hold rejects its row (see
+# field_types.py). A nullable column loads an empty field as NULL; otherwise an
+# empty text field stays '' and an empty numeric field rejects the row.
+
+TABLE_SPECS = {
+    'basic_drugs_formulary': {
+        'source': 'basic drugs formulary file*.txt',
+        'delimiter': '|',
+        'encoding': 'utf-8',
+        'errors': 'strict',
+        'header': True,
+        'parallel': True,
+        'partition_by': 'contract_year',
+        'cluster_by': ['rxcui', 'ndc11'],
+        'natural_key': ['formulary_id', 'rxcui', 'ndc', 'contract_year'],
+        'surrogate_keys': [('formulary_sk', 'dim_formulary')],
+        # 1 = prior authorization, 2 = step therapy, 4 = quantity limit
+        'derived': [('restrictions', 'bitmask', ['prior_authorization_yn', 'step_therapy_yn', 'quantity_limit_yn']),
+                    ('ndc11', 'ndc11', ['ndc'])],
+        'columns': [
+            ('formulary_id', 'text', False),
+            ('formulary_version', 'int', True),
+            ('contract_year', 'int', True),
+            ('rxcui', 'int', True),
+            ('ndc', 'text', False),
+            ('tier_level_value', 'int', True),
+            ('quantity_limit_yn', 'text', False),
+            ('quantity_limit_amount', 'decimal(5,2)', True),
+            ('quantity_limit_days', 'int', True),
+            ('prior_authorization_yn', 'text', False),
+            ('step_therapy_yn', 'text', False),
+        ],
+    },
+
+    'beneficiary_cost': {
+        'source': 'beneficiary cost file*.txt',
+        'delimiter': '|',
+        'encoding': 'utf-8',
+        'errors': 'strict',
+        'header': True,
+        'cluster_by': ['plan_sk'],
+        'copy_format': 'binary',
+        'surrogate_keys': [('plan_sk', 'dim_plan')],
+        'lookup_only': ['contract_id', 'plan_id', 'segment_id'],
+        'columns': [
+            ('contract_id', 'text', False),
+            ('plan_id', 'text', False),
+            ('segment_id', 'text', False),
+            ('coverage_level', 'int', True),
+            ('tier', 'int', True),
+            ('days_supply', 'int', True),
+            ('cost_type_pref', 'int', True),
+            ('cost_amt_pref', 'decimal(10,2)', True),
+            ('cost_min_amt_pref', 'decimal(10,2)', True),
+            ('cost_max_amt_pref', 'decimal(10,2)', True),
+            ('cost_type_nonpref', 'int', True),
+            ('cost_amt_nonpref', 'decimal(10,2)', True),
+            ('cost_min_amt_nonpref', 'decimal(10,2)', True),
+            ('cost_max_amt_nonpref', 'decimal(10,2)', True),
+            ('cost_type_mail_pref', 'int', True),
+            ('cost_amt_mail_pref', 'decimal(10,2)', True),
+            ('cost_min_amt_mail_pref', 'decimal(10,2)', True),
+            ('cost_max_amt_mail_pref', 'decimal(10,2)', True),
+            ('cost_type_mail_nonpref', 'int', True),
+            ('cost_amt_mail_nonpref', 'decimal(10,2)', True),
+            ('cost_min_amt_mail_nonpref', 'decimal(10,2)', True),
+            ('cost_max_amt_mail_nonpref', 'decimal(10,2)', True),
+            ('tier_specialty_yn', 'text', False),
+            ('ded_applies_yn', 'text', False),
+        ],
+    },
+
+    'insulin_beneficiary_cost': {
+        'source': 'insulin beneficiary cost file*.txt',
+        'delimiter': '|',
+        'encoding': 'utf-8',
+        'errors': 'ignore',
+        'header': True,
+        'on_conflict': 'ignore',
+        'conflict_key': ['plan_sk', 'tier', 'days_supply'],
+        'surrogate_keys': [('plan_sk', 'dim_plan')],
+        'lookup_only': ['contract_id', 'plan_id', 'segment_id'],
+        'columns': [
+            ('contract_id', 'text', False),
+            ('plan_id', 'text', False),
+            ('segment_id', 'text', False),
+            ('tier', 'text', False),  # '.' appears in the source, so kept as text
+            ('days_supply', 'int', False),
+            ('copay_amt_pref_insln', 'decimal(10,2)', True),
+            ('copay_amt_nonpref_insln', 'decimal(10,2)', True),
+            ('copay_amt_mail_pref_insln', 'decimal(10,2)', True),
+            ('copay_amt_mail_nonpref_insln', 'decimal(10,2)', True),
+        ],
+    },
+
+    'plan_info': {
+        'source': 'plan information*.txt',
+        'delimiter': '|',
+        'encoding': 'utf-8',
+        'errors': 'ignore',
+        'header': True,
+        'copy_format': 'binary',
+        'surrogate_keys': [('plan_sk', 'dim_plan'), ('formulary_sk', 'dim_formulary')],
+        'columns': [
+            ('contract_id', 'text', False),
+            ('plan_id', 'text', False),
+            ('segment_id', 'text', False),
+            ('contract_name', 'text', False),
+            ('plan_name', 'text', False),
+            ('formulary_id', 'text', False),
+            ('premium', 'decimal(10,2)', True),
+            ('deductible', 'int', True),
+            ('ma_region_code', 'text', False),
+            ('pdp_region_code', 'text', False),
+            ('state', 'text', False),
+            ('county_code', 'text', False),
+            ('snp', 'int', True),
+            ('plan_suppressed_yn', 'text', False),
+        ],
+    },
+
+    'geographic_locator': {
+        'source': 'geographic locator file*.txt',
+        'delimiter': '|',
+        'encoding': 'utf-8',
+        'errors': 'strict',
+        'header': True,
+        'columns': [
+            ('county_code', 'text', False),
+            ('statename', 'text', False),
+            ('county', 'text', False),
+            ('ma_region_code', 'text', False),
+            ('ma_region', 'text', False),
+            ('pdp_region_code', 'text', False),
+            ('pdp_region', 'text', False),
+        ],
+    },
+
+    'excluded_drugs_formulary': {
+        'source': 'excluded drugs formulary file*.txt',
+        'delimiter': '|',
+        'encoding': 'utf-8',
+        'errors': 'ignore',
+        'header': True,
+        'columns': [
+            ('contract_id', 'text', False),
+            ('plan_id', 'text', False),
+            ('rxcui', 'int', True),
+            ('tier', 'int', True),
+            ('quantity_limit_yn', 'text', False),
+            ('quantity_limit_amount', 'int', True),
+            ('quantity_limit_days', 'int', True),
+            ('prior_auth_yn', 'text', False),
+            ('step_therapy_yn', 'text', False),
+            ('capped_benefit_yn', 'text', False),
+        ],
+    },
+
+    'indication_based_coverage_formulary': {
+        'source': 'indication based coverage formulary file*.txt',
+        'delimiter': '|',
+        'encoding': 'utf-8',
+        'errors': 'strict',
+        'header': True,
+        'on_conflict': 'ignore',
+        'conflict_key': ['contract_id', 'plan_id', 'rxcui', 'disease'],
+        'columns': [
+            ('contract_id', 'text', False),
+            ('plan_id', 'text', False),
+            ('rxcui', 'bigint', False),
+            ('disease', 'text', False),
+        ],
+    },
+
+    'prescribers_by_geography_drug': {
+        'source': 'mup_dpr_*_geo.csv',
+        'format': 'csv',
+        'delimiter': ',',
+        'encoding': 'utf-8',
+        'errors': 'ignore',
+        'header': True,
+        'parallel': True,
+        'partition_by': 'year',
+        'cluster_by': ['prscrbr_geo_lvl', 'prscrbr_geo_desc'],
+        'params': [('year', 'int')],
+        'name_params': {'year': (r'_dy(\d{2})_', '20{}')},
+        'columns': [
+            ('prscrbr_geo_lvl', 'text', False),
+            ('prscrbr_geo_cd', 'text', False),
+            ('prscrbr_geo_desc', 'text', False),
+            ('brnd_name', 'text', False),
+            ('gnrc_name', 'text', False),
+            ('tot_prscrbrs', 'int', True),
+            ('tot_clms', 'int', True),
+            ('tot_30day_fills', 'decimal(15,2)', True),
+            ('tot_drug_cst', 'decimal(20,2)', True),
+            ('tot_benes', 'int', True),
+            ('ge65_sprsn_flag', 'text', True),
+            ('ge65_tot_clms', 'int', True),
+            ('ge65_tot_30day_fills', 'decimal(15,2)', True),
+            ('ge65_tot_drug_cst', 'decimal(20,2)', True),
+            ('ge65_bene_sprsn_flag', 'text', True),
+            ('ge65_tot_benes', 'int', True),
+            ('lis_bene_cst_shr', 'decimal(15,2)', True),
+            ('nonlis_bene_cst_shr', 'decimal(15,2)', True),
+            ('opioid_drug_flag', 'text', True),
+            ('opioid_la_drug_flag', 'text', True),
+            ('antbtc_drug_flag', 'text', True),
+            ('antpsyct_drug_flag', 'text', True),
+        ],
+    },
+}
@@ -0,0 +1,111 @@
+# Per-stage load telemetry.
+#
+# load_stream() times four stages of every load and keeps them in
+# stats['stages'] (seconds):
+#   read    : pulling raw batches from the source (disk, zip inflate)
+#   convert : parsing and formatting the rows into COPY text
+#   copy    : COPY wall time not spent in read/convert, i.e. the network and
+#             the server ingesting rows (plus the ON CONFLICT insert)
+#   commit  : checkpoint update and COMMIT
+# Each finished (or failed) load is appended as one JSON line to
+# TELEMETRY_LOG, and summary_table() renders a set of loads for the CLIs.
+# Progress lines are printed at most every PROGRESS_INTERVAL seconds, checked
+# once per read batch, so printing never runs per row. Steps after the load
+# (e.g. the clustered rewrite in staging.py) add their own 'event' records.
+
+import json
+import os
+import time
+
+from copy_stream import peak_rss_mb
+
+TELEMETRY_LOG = os.getenv('INGEST_TELEMETRY_LOG', 'ingest_telemetry.jsonl')
+PROGRESS_INTERVAL = 10.0  # seconds between progress lines of one load
+
+STAGES = ['read', 'convert', 'copy', 'commit']
+
+
+def new_stages():
+    return dict.fromkeys(STAGES, 0.0)
+
+
+class Progress:
+    # Rate-limited progress lines for one load
+
+    def __init__(self, stats, interval=PROGRESS_INTERVAL):
+        self.stats = stats
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.next_print = self.start + interval
+
+    def tick(self, rows):
+        now = time.perf_counter()
+        if now < self.next_print:
+            return
+        self.next_print = now + self.interval
+        elapsed = now - self.start
+        print(f"   {self.stats['target']}: {rows:,} rows, {rows / elapsed:,.0f} rows/s, "
+              f"rejected {self.stats['rejected']}")
+
+
+def write_record(record, path=None):
+    # Append one record as a JSON line; several worker processes may share the
+    # file, so it is written with a single write() call
+    path = path or TELEMETRY_LOG
+    try:
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+    except OSError as e:
+        print(f"❌ Could not write telemetry to {path}: {e}")
+
+
+def write_telemetry(stats, path=None):
+    # One load
+    record = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'pid': os.getpid(),
+        'table': stats['table'],
+        'target': stats['target'],
+        'source': stats.get('source'),
+        'range': stats.get('range'),
+        'status': stats.get('status', 'done'),
+        'error': stats.get('error'),
+        'rows': stats['rows'],
+        'rows_resumed': stats.get('rows_resumed', 0),
+        'rejected': stats['rejected'],
+        'lines': stats['lines'],
+        'bytes': stats.get('bytes', 0),
+        'seconds': round(stats.get('seconds', 0.0), 3),
+        'rows_per_sec': round(stats.get('rows_per_sec', 0.0), 1),
+        'stages': {stage: round(seconds, 3) for stage, seconds in stats.get('stages', {}).items()},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    write_record(record, path)
+
+
+def write_event(event, info, path=None):
+    write_record({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'pid': os.getpid(), 'event': event, **info}, path)
+
+
+def summary_table(results):
+    # Per-table totals of several loads (e.g. the byte ranges of one file)
+    totals = {}
+    for stats in results:
+        if stats.get('skipped'):
+            continue
+        total = totals.setdefault(stats['table'], {'rows': 0, 'rejected': 0, 'seconds': 0.0,
+                                                   'stages': new_stages()})
+        total['rows'] += stats['rows']
+        total['rejected'] += stats['rejected']
+        total['seconds'] += stats['seconds']
+        for stage, seconds in stats.get('stages', {}).items():
+            total['stages'][stage] += seconds
+
+    lines = [f"{'table':38} {'rows':>11} {'rejected':>9} {'rows/s':>10} "
+             + ' '.join(f"{stage + ' s':>9}" for stage in STAGES)]
+    for table, total in sorted(totals.items()):
+        # Worker seconds, so the rate is per worker when a table was split
+        rate = total['rows'] / total['seconds'] if total['seconds'] > 0 else 0
+        lines.append(f"{table:38} {total['rows']:>11} {total['rejected']:>9} {rate:>10,.0f} "
+                     + ' '.join(f"{total['stages'][stage]:>9.1f}" for stage in STAGES))
+    return '\n'.join(lines)
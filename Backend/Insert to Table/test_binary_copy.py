@@ -0,0 +1,104 @@
+# Tests for the binary COPY encoders of binary_copy.py; no database needed.
+# Numeric fields are decoded back with the layout PostgreSQL's numeric_recv()
+# reads: ndigits, weight, sign, dscale, then base-10000 digits.
+
+import struct
+from decimal import Decimal
+
+import pytest
+
+from binary_copy import (NULL_FIELD, PGCOPY_HEADER, PGCOPY_TRAILER, BinaryCopyStream, int_encoder,
+                         numeric_encoder, text_encoder)
+
+
+def typmod(precision, scale):
+    return (precision << 16 | scale) + 4
+
+
+def numeric_fields(data):
+    length, = struct.unpack_from('>i', data)
+    assert length == len(data) - 4
+    ndigits, weight, sign, dscale = struct.unpack_from('>hhHH', data, 4)
+    digits = struct.unpack_from(f'>{ndigits}H', data, 12)
+    assert len(data) == 12 + 2 * ndigits
+    return ndigits, weight, sign, dscale, digits
+
+
+def decode_numeric(data):
+    _, weight, sign, dscale, digits = numeric_fields(data)
+    assert sign in (0x0000, 0x4000)
+    assert all(0 <= d < 10000 for d in digits)
+    value = sum((Decimal(d).scaleb(4 * (weight - i)) for i, d in enumerate(digits)), Decimal(0))
+    value = value.quantize(Decimal(1).scaleb(-dscale))
+    return -value if sign else value
+
+
+def test_numeric_known_layouts():
+    encode = numeric_encoder(typmod(10, 2))
+    assert numeric_fields(encode(Decimal('1234.5'))) == (2, 0, 0, 2, (1234, 5000))
+    assert numeric_fields(encode(Decimal('-0.07'))) == (1, -1, 0x4000, 2, (700,))
+    assert numeric_fields(encode(Decimal('0'))) == (0, 0, 0, 2, ())
+    assert numeric_fields(encode(Decimal('-0.001'))) == (0, 0, 0, 2, ())  # rounds to zero, no sign
+    assert numeric_fields(encode(Decimal('10000'))) == (1, 1, 0, 2, (1,))
+    unsized = numeric_encoder(-1)
+    assert numeric_fields(unsized(Decimal('0.001'))) == (1, -1, 0, 3, (10,))
+    assert numeric_fields(unsized(Decimal('1E+5'))) == (1, 1, 0, 0, (10,))
+
+
+@pytest.mark.parametrize('value', [
+    '0', '1', '-1', '0.5', '12.34', '99999999.99', '-99999999.99', '100000.01', '0.01', '7.1', '20000',
+])
+def test_numeric_round_trip(value):
+    assert decode_numeric(numeric_encoder(typmod(10, 2))(Decimal(value))) == Decimal(value)
+
+
+@pytest.mark.parametrize('value', ['123456789.123456789', '0.000000001', '-31415.9265', '1E+20', '12345678'])
+def test_unsized_numeric_round_trip(value):
+    assert decode_numeric(numeric_encoder(-1)(Decimal(value))) == Decimal(value)
+
+
+def test_numeric_rounds_and_range_checks_like_the_server():
+    encode = numeric_encoder(typmod(5, 2))
+    assert decode_numeric(encode(Decimal('999.994'))) == Decimal('999.99')
+    assert decode_numeric(encode(Decimal('-1.005'))) == Decimal('-1.01')
+    assert decode_numeric(encode('12.5')) == Decimal('12.50')
+    for bad in [Decimal('999.995'), Decimal('1000'), 'NaN', 'inf', '1_0']:
+        with pytest.raises(ValueError):
+            encode(bad)
+
+
+@pytest.mark.parametrize('typname, value, fmt', [
+    ('int2', -32768, '>ih'),
+    ('int4', 2 ** 31 - 1, '>ii'),
+    ('int8', -2 ** 63, '>iq'),
+    ('int4', 0, '>ii'),
+])
+def test_int_encoder(typname, value, fmt):
+    assert int_encoder(typname)(value) == struct.pack(fmt, struct.calcsize(fmt) - 4, value)
+
+
+def test_int_encoder_whole_numbers_and_range():
+    encode = int_encoder('int4')
+    assert encode(Decimal('12.000')) == struct.pack('>ii', 4, 12)
+    assert encode('7') == struct.pack('>ii', 4, 7)
+    for bad in [2 ** 31, -2 ** 31 - 1, Decimal('1.5'), '1.5', 'x']:
+        with pytest.raises(ValueError):
+            encode(bad)
+    with pytest.raises(ValueError):
+        int_encoder('int2')(32768)
+
+
+def test_text_encoder():
+    assert text_encoder(-1)('héllo') == struct.pack('>i', 6) + 'héllo'.encode()
+    encode = text_encoder(3 + 4)  # varchar(3)
+    assert encode('abc  ') == struct.pack('>i', 3) + b'abc'
+    with pytest.raises(ValueError):
+        encode('abcd')
+
+
+def test_binary_copy_stream_framing():
+    row = struct.pack('>h', 2) + int_encoder('int4')(5) + NULL_FIELD
+    stream = BinaryCopyStream([row, row])
+    data = stream.read()
+    assert data == PGCOPY_HEADER + row + row + PGCOPY_TRAILER
+    assert stream.rows - 2 == 2
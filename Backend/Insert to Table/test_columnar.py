@@ -0,0 +1,67 @@
+# Tests for the quoted-CSV converter of columnar.py; no database needed.
+
+import pytest
+
+from columnar import compile_csv
+
+SPEC = {
+    'source': 'test*.csv',
+    'format': 'csv',
+    'delimiter': ',',
+    'encoding': 'utf-8',
+    'errors': 'strict',
+    'header': True,
+    'params': [('year', 'int')],
+    'derived': [('ndc11', 'ndc11', ['ndc'])],
+    'columns': [
+        ('name', 'text', False),
+        ('ndc', 'text', False),
+        ('fills', 'int', True),
+        ('cost', 'decimal(6,2)', True),
+    ],
+}
+
+HEADER = b'Name,NDC,Fills,Cost\r\n'
+
+
+def test_quoted_fields():
+    convert_batch = compile_csv(SPEC, {'year': 2023}, HEADER)
+    lines, rejected = convert_batch([
+        b'"Smith, Jones ""LLC""",0002-1433-80,12,4.50\r\n',
+        b'plain,12345678901,,\r\n',
+    ])
+    assert rejected == []
+    assert lines == [
+        '2023\tSmith, Jones "LLC"\t0002-1433-80\t12\t4.50\t2143380\n',
+        '2023\tplain\t12345678901\t\\N\t\\N\t12345678901\n',
+    ]
+
+
+def test_quoted_line_break_and_escapes():
+    convert_batch = compile_csv(SPEC, {'year': 2023}, HEADER)
+    lines, rejected = convert_batch([b'"two\r\n', b'lines\tand \\",x,1,1\r\n', b'next,x,2,2\r\n'])
+    assert rejected == []
+    assert lines == ['2023\ttwo\\r\\nlines\\tand \\\\\tx\t1\t1\t\\N\n', '2023\tnext\tx\t2\t2\t\\N\n']
+
+
+def test_columns_matched_by_header_name_and_param_from_file():
+    header = b'cost,year,ndc,extra,fills,name\n'
+    convert_batch = compile_csv(SPEC, None, header)
+    lines, rejected = convert_batch([b'1.5,2022,00002143380,?,7,A\n'])
+    assert rejected == []
+    assert lines == ['2022\tA\t00002143380\t7\t1.5\t2143380\n']
+
+
+def test_bad_values_reject_their_rows_only():
+    convert_batch = compile_csv(SPEC, {'year': 2023}, HEADER)
+    bad = [b'b,x,1_000,1\n', b'c,x,1,10000.00\n', b'd,x,1,inf\n', b'e,x,1\n', b'"f,x,1,1\n']
+    lines, rejected = convert_batch([b'a,x,1,9999.99\n'] + bad)
+    assert lines == ['2023\ta\tx\t1\t9999.99\t\\N\n']
+    assert sorted(rejected) == sorted(bad)
+
+
+def test_missing_or_bad_param():
+    with pytest.raises(ValueError):
+        compile_csv(SPEC, None, HEADER)
+    with pytest.raises(ValueError):
+        compile_csv(SPEC, {'year': 'x'}, HEADER)
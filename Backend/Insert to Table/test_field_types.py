@@ -0,0 +1,68 @@
+# Tests for the strict numeric parsing of field_types.py.
+
+from decimal import Decimal
+
+import pytest
+
+from field_types import base_type, decimal_parser, int_parser, parse_type
+
+
+def test_parse_type():
+    assert parse_type('int') == ('int', None, None)
+    assert parse_type('decimal(10, 2)') == ('decimal', 10, 2)
+    assert base_type('bigint') == 'int'
+    assert base_type('decimal(5,2)') == 'decimal'
+    for bad in ['float', 'int(5,2)', 'decimal(2,5)', 'decimal(5)']:
+        with pytest.raises(ValueError):
+            parse_type(bad)
+
+
+@pytest.mark.parametrize('col_type, value, expected', [
+    ('int', ' 42 ', 42),
+    ('int', '-7', -7),
+    ('int', '+2147483647', 2 ** 31 - 1),
+    ('int', '-2147483648', -2 ** 31),
+    ('bigint', '3000000000', 3000000000),
+    ('bigint', '9223372036854775807', 2 ** 63 - 1),
+])
+def test_int_parser_accepts(col_type, value, expected):
+    assert int_parser(col_type)(value) == expected
+
+
+@pytest.mark.parametrize('col_type, value', [
+    ('int', '2147483648'),
+    ('int', '1_000'),
+    ('int', '１２'),  # full-width digits
+    ('int', '1.0'),
+    ('int', ''),
+    ('int', '- 1'),
+    ('bigint', '9223372036854775808'),
+])
+def test_int_parser_rejects(col_type, value):
+    with pytest.raises(ValueError):
+        int_parser(col_type)(value)
+
+
+@pytest.mark.parametrize('value, text', [
+    ('999.994', '999.994'),
+    (' 1e2 ', '1e2'),
+    ('-.5', '-.5'),
+    ('000123.45', '000123.45'),
+    ('-999.99', '-999.99'),
+    ('1.5e-9', '1.5e-9'),
+])
+def test_decimal_parser_accepts(value, text):
+    assert decimal_parser('decimal(5,2)')(value) == text
+    assert decimal_parser('decimal(5,2)', typed=True)(value) == Decimal(text)
+
+
+@pytest.mark.parametrize('value', ['999.995', '1000', '1e3', 'NaN', 'inf', '1_0', '１', '', '.', '1e999999999999'])
+def test_decimal_parser_rejects(value):
+    with pytest.raises(ValueError):
+        decimal_parser('decimal(5,2)')(value)
+
+
+def test_unsized_decimal_has_no_limit():
+    assert decimal_parser('decimal')('1' * 40) == '1' * 40
+    with pytest.raises(ValueError):
+        decimal_parser('decimal')('Infinity')
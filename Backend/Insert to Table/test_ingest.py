@@ -0,0 +1,98 @@
+# Tests for the line-per-row conversion of ingest.py; no database needed.
+
+from decimal import Decimal
+
+import pytest
+
+from ingest import compile_batch, compile_spec, read_batches, split_ranges, table_columns
+
+SPEC = {
+    'source': 'test*.txt',
+    'delimiter': '|',
+    'encoding': 'utf-8',
+    'errors': 'strict',
+    'header': True,
+    'params': [('year', 'int')],
+    'derived': [('flags', 'bitmask', ['pa_yn', 'st_yn'])],
+    'columns': [
+        ('plan', 'text', False),
+        ('note', 'text', True),
+        ('tier', 'int', True),
+        ('amount', 'decimal(5,2)', True),
+        ('pa_yn', 'text', False),
+        ('st_yn', 'text', False),
+    ],
+}
+
+
+def write_lines(tmp_path, lines):
+    path = tmp_path / 'source.txt'
+    path.write_bytes(b''.join(lines))
+    return str(path)
+
+
+@pytest.mark.parametrize('parts', [1, 2, 3, 7, 50])
+def test_split_ranges_cover_every_line_once(tmp_path, parts):
+    lines = [b'header\n'] + [f'row {i}|{"x" * (i % 13)}\n'.encode() for i in range(40)]
+    path = write_lines(tmp_path, lines)
+    ranges = split_ranges(path, parts)
+
+    assert 1 <= len(ranges) <= parts
+    assert ranges[0][0] == len(lines[0])
+    assert ranges[-1][1] == sum(map(len, lines))
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    loaded = []
+    with open(path, 'rb') as binary:
+        for start, end in ranges:
+            binary.seek(start)
+            for batch in read_batches(binary, size=64, end=end):
+                loaded.extend(batch)
+    assert loaded == lines[1:]
+
+
+def test_split_ranges_without_header_and_empty_file(tmp_path):
+    path = write_lines(tmp_path, [b'a\n', b'b\n'])
+    assert split_ranges(path, 4, header=False)[0][0] == 0
+    empty = write_lines(tmp_path, [b'header\n'])
+    assert split_ranges(empty, 4) == []
+
+
+def test_compile_spec_converts_and_formats_a_row():
+    convert, format_row = compile_spec(SPEC, {'year': '2024'})
+    row = convert(b'H1234| | 3 |12.5|Y|N\r\n')
+    assert row == (2024, 'H1234', None, 3, '12.5', 'Y', 'N', 1)
+    assert format_row(row) == '2024\tH1234\t\\N\t3\t12.5\tY\tN\t1\n'
+    assert table_columns(SPEC) == ['year', 'plan', 'note', 'tier', 'amount', 'pa_yn', 'st_yn', 'flags']
+
+
+def test_compile_spec_typed_decimals():
+    convert, _ = compile_spec(SPEC, {'year': 2024}, typed=True)
+    assert convert(b'H1||| 1.25 |N|Y\n')[3:5] == (None, Decimal('1.25'))
+
+
+def test_compile_spec_escapes_text():
+    convert, format_row = compile_spec(SPEC, {'year': 2024})
+    assert format_row(convert(b'a\\b\tc|||||\n')) == '2024\ta\\\\b\\tc\t\\N\t\\N\t\\N\t\t\t0\n'
+
+
+def test_compile_spec_needs_every_param():
+    with pytest.raises(ValueError):
+        compile_spec(SPEC)
+    with pytest.raises(ValueError):
+        compile_spec(SPEC, {'year': '2_024'})
+
+
+def test_compile_batch_rejects_bad_rows():
+    convert_batch = compile_batch(SPEC, {'year': 2024})
+    good = b'H1||1|999.99|N|N\n'
+    bad = [
+        b'H1||1|1000.00|N|N\n',  # does not fit decimal(5,2)
+        b'H1||1_000||N|N\n',  # not a PostgreSQL integer
+        b'H1||3000000000||N|N\n',  # out of the int range
+        b'H1||1|NaN|N|N\n',
+        b'H1||1\n',  # too few fields
+        b'H1||1||N|N|extra\n',
+    ]
+    lines, rejected = convert_batch([good] + bad + [b'\n'])
+    assert lines == ['2024\tH1\t\\N\t1\t999.99\tN\tN\t0\n']
+    assert rejected == bad
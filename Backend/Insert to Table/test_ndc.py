@@ -0,0 +1,35 @@
+# Tests for normalize_ndc (ndc.py).
+
+import pytest
+
+from ndc import normalize_ndc
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('00002143380', 2143380),
+    (' 00002143380\n', 2143380),
+    ('0002-1433-80', 2143380),  # 4-4-2
+    ('12345-678-90', 12345067890),  # 5-3-2
+    ('12345-6789-1', 12345678901),  # 5-4-1
+    ('12345-6789-01', 12345678901),  # 5-4-2
+    ('99999999999', 99999999999),
+])
+def test_normalize_ndc(value, expected):
+    assert normalize_ndc(value) == expected
+
+
+@pytest.mark.parametrize('value', [
+    '',
+    '0002143380',  # 10 digits without dashes is ambiguous
+    '000021433801',
+    '0002-143380',
+    '002-1433-80',
+    '0002-1433-80-1',
+    '0002--1433',
+    '00002-1433-8A',
+    '0002-1433-８0',  # full-width digit
+    '+0002143380',
+    '0000214338０',
+])
+def test_normalize_ndc_rejects(value):
+    assert normalize_ndc(value) is None
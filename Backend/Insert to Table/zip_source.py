@@ -0,0 +1,77 @@
+# Read CMS source files straight out of a downloaded release archive.
+#
+# Members are matched to tables with the same 'source' patterns as a release
+# directory and decompressed on the fly into the loader, so nothing is
+# extracted to disk. Archives nested inside the archive (CMS ships one zip per
+# file inside the release zip) are opened in place as well; a deflated inner
+# zip is decompressed again for every seek, so its members are read one at a time.
+
+import fnmatch
+import os
+import posixpath
+from contextlib import contextmanager, ExitStack
+from zipfile import ZipFile
+
+from ingest import load_stream, print_stats, source_params
+from table_specs import TABLE_SPECS
+
+
+def is_archive(path):
+    return path.lower().endswith('.zip')
+
+
+def _walk(archive, chain):
+    for info in archive.infolist():
+        if info.is_dir():
+            continue
+        if is_archive(info.filename):
+            with archive.open(info) as member, ZipFile(member) as inner:
+                yield from _walk(inner, chain + [info.filename])
+        else:
+            yield chain + [info.filename], info.file_size
+
+
+def match_table(member_name, tables=None):
+    name = posixpath.basename(member_name).lower()
+    for table in tables or TABLE_SPECS:
+        if fnmatch.fnmatch(name, TABLE_SPECS[table]['source']):
+            return table
+    return None
+
+
+def find_members(zip_path, tables=None):
+    # Returns {table: (chain, uncompressed size)}; chain is the list of member
+    # names from the outer archive down to the file. The last match wins, like
+    # ingest.find_source().
+    found = {}
+    with ZipFile(zip_path) as archive:
+        for chain, size in _walk(archive, []):
+            table = match_table(chain[-1], tables)
+            if table is not None and (table not in found or chain > found[table][0]):
+                found[table] = (chain, size)
+    return found
+
+
+@contextmanager
+def open_member(zip_path, chain):
+    # Binary, decompressing stream for a (possibly nested) archive member
+    with ExitStack() as stack:
+        archive = stack.enter_context(ZipFile(zip_path))
+        for name in chain[:-1]:
+            archive = stack.enter_context(ZipFile(stack.enter_context(archive.open(name))))
+        yield stack.enter_context(archive.open(chain[-1]))
+
+
+def load_member(conn, table, zip_path, chain, params=None, target=None):
+    source = {
+        'name': f"{os.path.abspath(zip_path)}!{'!'.join(chain)}",
+        'size': os.path.getsize(zip_path),
+        'mtime': os.path.getmtime(zip_path),
+        'rejects': f"{zip_path}.{posixpath.basename(chain[-1])}.rejects",
+    }
+    params = source_params(table, chain[-1], params)
+    with open_member(zip_path, chain) as binary:
+        stats = load_stream(conn, table, binary, params, target=target, source=source)
+    stats['file'] = f"{zip_path}!{'!'.join(chain)}"
+    print_stats(stats)
+    return stats
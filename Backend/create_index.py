@@ -1,28 +1,12 @@
-import psycopg2
 from psycopg2 import sql
-from dotenv import load_dotenv
-import os
 
-# Load environment variables
-load_dotenv()
-
-# ---------------------------
-# 1) DB connection (your snippet)
-# ---------------------------
-load_dotenv()
-
-conn = psycopg2.connect(
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT"),
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD")
-)
-
-conn.autocommit = True
-cur = conn.cursor()
+from db import new_connection
 
 # Define all index statements
+# (one table per statement: "... <index name> ON <table>(...)")
+# Joins between the plan and formulary tables use the integer *_sk keys
+# (see Insert to Table/dimensions.py), so those are indexed instead of the
+# VARCHAR identifiers
 index_statements = [
 
     # --- geographic_locator ---
@@ -32,13 +16,19 @@ index_statements = [
     "CREATE INDEX IF NOT EXISTS idx_geo_statename        ON geographic_locator(statename)",
 
     # --- basic_drugs_formulary ---
-    "CREATE INDEX IF NOT EXISTS idx_bdf_formulary_id        ON basic_drugs_formulary(formulary_id)",
+    "CREATE INDEX IF NOT EXISTS idx_bdf_formulary_sk        ON basic_drugs_formulary(formulary_sk)",
     "CREATE INDEX IF NOT EXISTS idx_bdf_formulary_version   ON basic_drugs_formulary(formulary_version)",
     "CREATE INDEX IF NOT EXISTS idx_bdf_contract_year       ON basic_drugs_formulary(contract_year)",
     "CREATE INDEX IF NOT EXISTS idx_bdf_tier_level_value    ON basic_drugs_formulary(tier_level_value)",
     "CREATE INDEX IF NOT EXISTS idx_bdf_rxcui               ON basic_drugs_formulary(rxcui)",
-    "CREATE INDEX IF NOT EXISTS idx_bdf_ndc                 ON basic_drugs_formulary(ndc)",
-    "CREATE INDEX IF NOT EXISTS idx_bdf_formulary_year_tier ON basic_drugs_formulary(formulary_id, contract_year, tier_level_value)",
+    "CREATE INDEX IF NOT EXISTS idx_bdf_ndc11               ON basic_drugs_formulary(ndc11)",
+    "CREATE INDEX IF NOT EXISTS idx_bdf_formulary_year_tier ON basic_drugs_formulary(formulary_sk, contract_year, tier_level_value)",
+    # restrictions bitmask: = ANY(masks) filters, and per-tier counts as index-only scans
+    "CREATE INDEX IF NOT EXISTS idx_bdf_restrictions        ON basic_drugs_formulary(restrictions)",
+    "CREATE INDEX IF NOT EXISTS idx_bdf_tier_restrictions   ON basic_drugs_formulary(tier_level_value, restrictions)",
+    # /api/bdf/search pages in its default order (BDF_TIEBREAK in Features/main.py):
+    # a cursor seeks into this index instead of sorting the matching rows
+    "CREATE INDEX IF NOT EXISTS idx_bdf_tier_keyset         ON basic_drugs_formulary((COALESCE(tier_level_value, -1)), (COALESCE(ndc, '')), formulary_id, (COALESCE(contract_year, 0)), (COALESCE(formulary_version, -1)))",
 
     # --- prescribers_by_geography_drug ---
     "CREATE INDEX IF NOT EXISTS idx_pbgd_year_geo_lvl      ON prescribers_by_geography_drug(year, prscrbr_geo_lvl)",
@@ -46,15 +36,18 @@ index_statements = [
     "CREATE INDEX IF NOT EXISTS idx_pbgd_geo_desc          ON prescribers_by_geography_drug(prscrbr_geo_desc)",
     "CREATE INDEX IF NOT EXISTS idx_pbgd_brand_name        ON prescribers_by_geography_drug(brnd_name)",
     "CREATE INDEX IF NOT EXISTS idx_pbgd_generic_name      ON prescribers_by_geography_drug(gnrc_name)",
+    # /api/region_detail pages past the summary_geo_top lists (REGION_KEYS in Features/main.py)
+    "CREATE INDEX IF NOT EXISTS idx_pbgd_region_keyset     ON prescribers_by_geography_drug(prscrbr_geo_lvl, prscrbr_geo_desc, (COALESCE(tot_clms, -1)), (COALESCE(year, 0)), (COALESCE(prscrbr_geo_cd, '')), (COALESCE(brnd_name, '')), (COALESCE(gnrc_name, '')))",
 
     # --- beneficiary_cost ---
-    "CREATE INDEX IF NOT EXISTS idx_bc_contract_plan_seg ON beneficiary_cost(contract_id, plan_id, segment_id)",
+    "CREATE INDEX IF NOT EXISTS idx_bc_plan_sk           ON beneficiary_cost(plan_sk)",
     "CREATE INDEX IF NOT EXISTS idx_bc_tier              ON beneficiary_cost(tier)",
     "CREATE INDEX IF NOT EXISTS idx_bc_coverage_level    ON beneficiary_cost(coverage_level)",
 
     # --- plan_info ---
     "CREATE INDEX IF NOT EXISTS idx_pi_contract_plan_seg   ON plan_info(contract_id, plan_id, segment_id)",
-    "CREATE INDEX IF NOT EXISTS idx_pi_formulary_id        ON plan_info(formulary_id)",
+    "CREATE INDEX IF NOT EXISTS idx_pi_plan_sk             ON plan_info(plan_sk)",
+    "CREATE INDEX IF NOT EXISTS idx_pi_formulary_sk        ON plan_info(formulary_sk)",
     "CREATE INDEX IF NOT EXISTS idx_pi_state               ON plan_info(state)",
     "CREATE INDEX IF NOT EXISTS idx_pi_ma_region_code      ON plan_info(ma_region_code)",
     "CREATE INDEX IF NOT EXISTS idx_pi_pdp_region_code     ON plan_info(pdp_region_code)",
@@ -71,14 +64,29 @@ index_statements = [
     "CREATE INDEX IF NOT EXISTS idx_ibcf_disease        ON indication_based_coverage_formulary USING gin (to_tsvector('english', disease))",
 ]
 
-# Execute all indexes safely
-for stmt in index_statements:
-    try:
-        cur.execute(sql.SQL(stmt))
-        print(f"✅ Created: {stmt.split('ON')[0].strip()}")
-    except Exception as e:
-        print(f"❌ Failed: {stmt}\n   Error: {e}")
-
-cur.close()
-conn.close()
-print("\n🎯 All index creation commands executed.")
+
+def main():
+    # ---------------------------
+    # 1) DB connection (bulk_load: large maintenance_work_mem for the builds)
+    # ---------------------------
+    conn = new_connection('bulk_load')
+
+    conn.autocommit = True
+    cur = conn.cursor()
+
+    # Execute all indexes safely
+    for stmt in index_statements:
+        try:
+            cur.execute(sql.SQL(stmt))
+            print(f"✅ Created: {stmt.split('ON')[0].strip()}")
+        except Exception as e:
+            print(f"❌ Failed: {stmt}\n   Error: {e}")
+
+    cur.close()
+    conn.close()
+    print("\n🎯 All index creation commands executed.")
+
+
+# The loaders import index_statements to build the same indexes on staging tables
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+# Shared PostgreSQL access for the loaders, scripts and notebooks.
+#
+#   from db import connect_db, new_connection, pooled, copy_in, read_frame
+#
+# The connect_db.py files next to the scripts (Create Table/, Insert to Table/,
+# Features/Extra/) re-export this module, so `from connect_db import ...` works
+# from any of those directories.
+#
+# Every connection is opened with a session profile: its settings are passed
+# as startup options, so they cost no extra round trip and survive RESET ALL.
+#
+#   default    server defaults
+#   bulk_load  COPY and index builds: synchronous_commit off (a crash can lose
+#              the last commits, never corrupt them; the load journal rolls back
+#              with its rows, so a resumed load repeats exactly what was lost),
+#              large work_mem and maintenance_work_mem
+#   analytics  notebooks and reports: parallel workers for large scans and joins
+#
+# connect_db() returns the process's shared connection for a profile;
+# pooled() lends a connection from a thread-safe pool (one per profile) and
+# takes it back, rolled back and reset, when the block ends.
+
+import os
+import threading
+from contextlib import contextmanager
+from uuid import uuid4
+
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.pool import ThreadedConnectionPool
+
+# Load environment variables from .env file
+load_dotenv()
+
+PROFILES = {
+    'default': {},
+    'bulk_load': {
+        'synchronous_commit': 'off',
+        'work_mem': '256MB',
+        'maintenance_work_mem': '1GB',
+    },
+    'analytics': {
+        'max_parallel_workers_per_gather': '4',
+        'work_mem': '128MB',
+    },
+}
+
+POOL_MIN = 1
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "8"))
+CURSOR_BATCH_ROWS = 10000  # rows fetched per round trip by server-side cursors
+COPY_BUFFER_SIZE = 1 << 20  # bytes handed to PostgreSQL per read() call
+
+shared = {}  # profile -> the process's shared connection
+pools = {}  # profile -> ThreadedConnectionPool
+pools_lock = threading.Lock()
+
+
+def connect_params(profile='default'):
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown connection profile {profile!r}; use one of {', '.join(PROFILES)}")
+    params = {
+        'host': os.getenv("DB_HOST"),
+        'port': os.getenv("DB_PORT"),
+        'dbname': os.getenv("DB_NAME"),
+        'user': os.getenv("DB_USER"),
+        'password': os.getenv("DB_PASSWORD"),
+        'application_name': f"us-formulary:{profile}",
+    }
+    settings = PROFILES[profile]
+    if settings:
+        params['options'] = ' '.join(f"-c {name}={value}" for name, value in settings.items())
+    return params
+
+
+def new_connection(profile='default'):
+    # A separate connection that is not shared, e.g. for a worker process
+    return psycopg2.connect(**connect_params(profile))
+
+
+def connect_db(profile='default'):
+    # The shared connection for profile, reopened once a caller has closed it.
+    # A connection the server dropped shows up as closed on its next use.
+    conn = shared.get(profile)
+    if conn is None or conn.closed:
+        conn = shared[profile] = new_connection(profile)
+    return conn
+
+
+def get_pool(profile='default'):
+    pool = pools.get(profile)
+    if pool is None:
+        with pools_lock:
+            pool = pools.get(profile)
+            if pool is None:
+                pool = pools[profile] = ThreadedConnectionPool(POOL_MIN, POOL_MAX, **connect_params(profile))
+    return pool
+
+
+@contextmanager
+def pooled(profile='default', autocommit=False):
+    # with pooled('bulk_load') as conn: ...  Commits are up to the caller;
+    # whatever is left open when the block ends is rolled back.
+    pool = get_pool(profile)
+    conn = pool.getconn()
+    try:
+        conn.autocommit = autocommit
+        yield conn
+    finally:
+        if not conn.closed:
+            try:
+                # Drop the session SETs of this borrower; the profile stays
+                conn.reset()
+                conn.autocommit = False
+            except psycopg2.Error:
+                conn.close()
+        pool.putconn(conn, close=bool(conn.closed))
+
+
+def close_pools():
+    with pools_lock:
+        for pool in pools.values():
+            pool.closeall()
+        pools.clear()
+
+
+def copy_in(cur, table, columns, source, size=COPY_BUFFER_SIZE, binary=False):
+    # COPY a file-like object of COPY text rows (or binary COPY data) into table
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN" + (" WITH (FORMAT binary)" if binary else ""),
+                    source, size=size)
+
+
+def read_frame(conn, query, params=None, batch_rows=CURSOR_BATCH_ROWS):
+    # pandas DataFrame of query, fetched through a server-side cursor
+    import pandas as pd
+
+    with conn.cursor(name=f"frame_{uuid4().hex[:12]}") as cur:
+        cur.itersize = batch_rows
+        cur.execute(query, params)
+        rows = list(cur)
+        columns = [col.name for col in cur.description]
+    conn.commit()
+    return pd.DataFrame.from_records(rows, columns=columns)
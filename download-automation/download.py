@@ -1,31 +1,148 @@
 import os
+import json
+import hashlib
+import threading
 import yaml
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile
 from tqdm import tqdm
 import sys
 
-def download_file(url, save_path):
+CHUNK_SIZE = 1024 * 1024  # bytes per network read and file write
+MAX_RETRIES = 5
+TIMEOUT = (30, 300)  # connect, read (seconds)
+
+manifest_lock = threading.Lock()
+
+
+# ---------------------------
+# Manifest: one entry per configured file with the validators CMS sent
+# (ETag / Last-Modified), the SHA-256 and size of the completed download.
+# ---------------------------
+def load_manifest(manifest_path):
     try:
-        print(f"Connecting to {url}...")
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            total_size_in_bytes = int(r.headers.get('content-length', 0))
-            block_size = 1024
-            progress_bar = tqdm(total=total_size_in_bytes, unit='iB', unit_scale=True, desc=os.path.basename(save_path))
-            with open(save_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=block_size):
-                    progress_bar.update(len(chunk))
-                    f.write(chunk)
-            progress_bar.close()
-            if total_size_in_bytes != 0 and progress_bar.n != total_size_in_bytes:
-                print("ERROR, something went wrong during download.")
-                return False
+        with open(manifest_path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest, manifest_path):
+    # Write to a temp file first so a crash never leaves a truncated manifest
+    with manifest_lock:
+        tmp_path = manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+
+
+def sha256_file(path, hasher=None):
+    hasher = hasher or hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher
+
+
+def local_copy_is_current(entry, save_path):
+    # The completed file is still the one recorded in the manifest
+    return (
+        os.path.exists(save_path)
+        and os.path.getsize(save_path) == entry.get("size")
+        and os.path.getmtime(save_path) == entry.get("mtime")
+    )
+
+
+def conditional_headers(entry):
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def download_file(url, save_path, entry=None, session=None):
+    # Download url to save_path, resuming a previous partial download with an
+    # HTTP Range request. Returns the new manifest entry, "unchanged" when the
+    # server answers 304 Not Modified, or None on failure.
+    session = session or requests
+    entry = entry if entry is not None else {}
+    part_path = save_path + ".part"
+    partial = entry.get("partial", {})
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        headers = {}
+        if local_copy_is_current(entry, save_path):
+            headers.update(conditional_headers(entry))
+
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset and (partial.get("etag") or partial.get("last_modified")):
+            headers["Range"] = f"bytes={offset}-"
+            # Only resume if the server still has the same version of the file
+            headers["If-Range"] = partial.get("etag") or partial.get("last_modified")
+        else:
+            offset = 0
+
+        try:
+            print(f"Connecting to {url}..." if attempt == 1 else f"Retrying {url} ({attempt}/{MAX_RETRIES})...")
+            with session.get(url, stream=True, headers=headers, timeout=TIMEOUT) as r:
+                if r.status_code == 304:
+                    return "unchanged"
+                if r.status_code == 416:
+                    # The partial file is not a prefix of what the server has now
+                    os.remove(part_path)
+                    partial = entry["partial"] = {}
+                    continue
+                r.raise_for_status()
+
+                validators = {
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                }
+                if r.status_code == 206:
+                    hasher = sha256_file(part_path)
+                    mode = "ab"
+                else:
+                    offset = 0
+                    hasher = hashlib.sha256()
+                    mode = "wb"
+                partial = entry["partial"] = validators
+
+                total_size_in_bytes = offset + int(r.headers.get("content-length", 0))
+                with tqdm(total=total_size_in_bytes, initial=offset, unit='iB', unit_scale=True,
+                          desc=os.path.basename(save_path)) as progress_bar, \
+                        open(part_path, mode, buffering=CHUNK_SIZE) as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        progress_bar.update(len(chunk))
+                        hasher.update(chunk)
+                        f.write(chunk)
+                size = os.path.getsize(part_path)
+                if total_size_in_bytes != offset and size != total_size_in_bytes:
+                    raise requests.exceptions.ConnectionError(
+                        f"incomplete download ({size} of {total_size_in_bytes} bytes)")
+
+            os.replace(part_path, save_path)
             print(f"Successfully downloaded: {save_path}")
-            return True
-    except requests.exceptions.RequestException as e:
-        print(f"Error downloading file: {e}")
-        return False
+            return {
+                "url": url,
+                "etag": validators["etag"],
+                "last_modified": validators["last_modified"],
+                "sha256": hasher.hexdigest(),
+                "size": size,
+                "mtime": os.path.getmtime(save_path),
+            }
+        except requests.exceptions.HTTPError as e:
+            print(f"Error downloading file: {e}")
+            return None
+        except requests.exceptions.RequestException as e:
+            # Connection dropped: keep the .part file and resume from it
+            print(f"Download interrupted: {e}")
+
+    print(f"Giving up on {url} after {MAX_RETRIES} attempts.")
+    return None
+
 
 def unzip_file(zip_path, extract_dir):
     try:
@@ -36,6 +153,38 @@ def unzip_file(zip_path, extract_dir):
     except Exception as e:
         print(f"Error unzipping file: {e}")
 
+
+def process_item(item, download_dir, manifest, manifest_path, extract, session=None):
+    # Returns "downloaded", "unchanged" or "failed"
+    name = item["name"]
+    url = item["url"]
+    zip_save_path = os.path.join(download_dir, f"{name}.zip")
+    entry = manifest.get(name)
+    if entry is None or entry.get("url") != url:
+        entry = {"url": url}  # new file, or config now points somewhere else
+
+    print(f"Processing '{name}'...")
+    result = download_file(url, zip_save_path, entry, session)
+    if result is None:
+        # Remember the validators of the partial download for the next run
+        manifest[name] = entry
+        save_manifest(manifest, manifest_path)
+        return "failed"
+    if result == "unchanged":
+        print(f"'{name}' has not changed since the last run, skipping.")
+        return "unchanged"
+
+    same_content = entry.get("sha256") == result["sha256"]
+    manifest[name] = result
+    save_manifest(manifest, manifest_path)
+    if same_content:
+        print(f"'{name}' was re-sent with identical content (SHA-256 match), skipping.")
+        return "unchanged"
+    if extract:
+        unzip_file(zip_save_path, download_dir)
+    return "downloaded"
+
+
 def main(config_path="config.yaml"):
     try:
         with open(config_path) as f:
@@ -46,20 +195,36 @@ def main(config_path="config.yaml"):
 
     download_dir = config.get("download_dir", "data/raw")
     files_to_download = config.get("files", [])
+    # With extract: false the zip is kept as-is; load it directly with
+    # Backend/Insert to Table/load_release.py <zip>, which streams the members into the database.
+    extract = config.get("extract", True)
+    max_workers = config.get("max_workers", 4)
+    manifest_path = config.get("manifest", os.path.join(download_dir, "manifest.json"))
     os.makedirs(download_dir, exist_ok=True)
 
+    items = []
     for item in files_to_download:
         name = item.get("name")
         url = item.get("url")
         if not name or not url:
             print(f"Skipping invalid entry in config: {item}. Please provide a valid name and URL.")
             continue
+        items.append(item)
+
+    manifest = load_manifest(manifest_path)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(process_item, item, download_dir, manifest, manifest_path, extract)
+            for item in items
+        ]
+        results = [future.result() for future in futures]
+
+    print("-" * 50)
+    print(f"Downloaded: {results.count('downloaded')}, unchanged: {results.count('unchanged')}, "
+          f"failed: {results.count('failed')}")
+    if "failed" in results:
+        sys.exit(1)
 
-        zip_save_path = os.path.join(download_dir, f"{name}.zip")
-        print("-" * 50)
-        print(f"Processing '{name}'...")
-        if download_file(url, zip_save_path):
-            unzip_file(zip_save_path, download_dir)
 
 if __name__ == "__main__":
     main()
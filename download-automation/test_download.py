@@ -0,0 +1,131 @@
+# Tests for download.py against a local http.server: conditional requests,
+# resuming an interrupted download with Range / If-Range, and the manifest.
+
+import hashlib
+import io
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zipfile import ZipFile
+
+import pytest
+
+import download
+
+
+def zip_bytes(text):
+    buffer = io.BytesIO()
+    with ZipFile(buffer, "w") as archive:
+        archive.writestr("plan information 2025.txt", text)
+    return buffer.getvalue()
+
+
+class Handler(BaseHTTPRequestHandler):
+    # Serves server.content with ETag server.etag; server.cut_after drops the
+    # connection after that many body bytes, once
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.content
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get("Range") and self.headers.get("If-Range") == server.etag:
+            start = int(self.headers["Range"][len("bytes="):].rstrip("-"))
+            if start >= len(body):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        if server.cut_after is not None:
+            self.wfile.write(body[start:start + server.cut_after])
+            server.cut_after = None
+            return
+        self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.content = zip_bytes("x" * 50000 + "\n")
+    httpd.etag = '"v1"'
+    httpd.cut_after = None
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/plans.zip"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_then_not_modified(server, tmp_path):
+    save_path = str(tmp_path / "plans.zip")
+    entry = download.download_file(server.url, save_path, {})
+    with open(save_path, "rb") as f:
+        assert f.read() == server.content
+    assert entry["sha256"] == hashlib.sha256(server.content).hexdigest()
+    assert entry["etag"] == '"v1"' and entry["size"] == len(server.content)
+    assert not os.path.exists(save_path + ".part")
+
+    assert download.download_file(server.url, save_path, entry) == "unchanged"
+    assert server.requests[-1]["If-None-Match"] == '"v1"'
+
+
+def test_interrupted_download_resumes(server, tmp_path, monkeypatch):
+    # Small chunks, so the bytes before the cut reach the .part file
+    monkeypatch.setattr(download, "CHUNK_SIZE", 256)
+    save_path = str(tmp_path / "plans.zip")
+    server.cut_after = 1024
+    entry = download.download_file(server.url, save_path, {})
+    assert len(server.requests) == 2
+    assert server.requests[1]["Range"] == "bytes=1024-"
+    assert server.requests[1]["If-Range"] == '"v1"'
+    with open(save_path, "rb") as f:
+        assert f.read() == server.content
+    assert entry["sha256"] == hashlib.sha256(server.content).hexdigest()
+
+
+def test_changed_file_restarts_from_scratch(server, tmp_path):
+    save_path = str(tmp_path / "plans.zip")
+    with open(save_path + ".part", "wb") as f:
+        f.write(b"old partial bytes")
+    entry = {"partial": {"etag": '"v0"'}}
+    result = download.download_file(server.url, save_path, entry)
+    assert server.requests[0]["If-Range"] == '"v0"'
+    with open(save_path, "rb") as f:
+        assert f.read() == server.content
+    assert result["sha256"] == hashlib.sha256(server.content).hexdigest()
+
+
+def test_process_item_manifest_and_extract(server, tmp_path):
+    download_dir = str(tmp_path)
+    manifest_path = str(tmp_path / "manifest.json")
+    item = {"name": "plans", "url": server.url}
+    manifest = {}
+    assert download.process_item(item, download_dir, manifest, manifest_path, extract=True) == "downloaded"
+    assert os.path.exists(tmp_path / "plan information 2025.txt")
+    with open(manifest_path) as f:
+        assert json.load(f)["plans"]["etag"] == '"v1"'
+
+    assert download.process_item(item, download_dir, manifest, manifest_path, extract=True) == "unchanged"
+
+    # Same bytes under a new ETag: downloaded again, but not extracted again
+    server.etag = '"v2"'
+    os.remove(tmp_path / "plan information 2025.txt")
+    assert download.process_item(item, download_dir, manifest, manifest_path, extract=True) == "unchanged"
+    assert not os.path.exists(tmp_path / "plan information 2025.txt")
+    assert manifest["plans"]["etag"] == '"v2"'